@@ -1,60 +1,361 @@
 import re
-from typing import Optional, Tuple
+import json
+import time
+import asyncio
+import sqlite3
+import datetime
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 import os
+import sys
+import logging
+import importlib
 from dotenv import load_dotenv
-from groq import Groq
-from prompt import system_prompt
-import google.generativeai as genai
+from prompt import STATIC_SYSTEM_PROMPT, STRUCTURED_SYSTEM_PROMPT, TASK_RESPONSE_SCHEMA, get_prompt_messages, render_date_context
+from intentParser import normalize_text, format_intent_reply
+from taskRecord import TaskRecord, parse_task_records
+from recurrence import parse_recurrence
+from llmRouter import LLMRouter, Provider
+from llmAdmission import AdmissionController, SingleFlight
+from metrics import AI_PARSE_RESULTS
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 
-async def get_ai_response(text: str) -> str:
-    try:
-        # Remove any extra parameters that might be causing issues
-        client = Groq(api_key=GROQ_API_KEY)
-        completion = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": text}
-            ],
-            model="llama-3.3-70b-versatile",
-            temperature=0.7,
-            max_tokens=1024,  # Changed from max_completion_tokens
-            top_p=1,
-            stream=False,
-            stop=None,
+# Per-call timeouts (seconds) and keep-alive pool size for the LLM clients
+GROQ_TIMEOUT = float(os.environ.get("GROQ_TIMEOUT", "15"))
+GEMINI_TIMEOUT = float(os.environ.get("GEMINI_TIMEOUT", "20"))
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "20"))
+# In-flight requests allowed per provider before the router prefers the other one
+GROQ_MAX_CONCURRENCY = int(os.environ.get("GROQ_MAX_CONCURRENCY", str(LLM_MAX_CONNECTIONS)))
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", str(LLM_MAX_CONNECTIONS)))
+
+# Parsed-response cache: in-memory LRU with TTL, plus an optional SQLite tier
+AI_CACHE_SIZE = int(os.environ.get("AI_CACHE_SIZE", "1024"))
+AI_CACHE_TTL = float(os.environ.get("AI_CACHE_TTL", "3600"))
+AI_CACHE_DB = os.environ.get("AI_CACHE_DB")
+
+# Phrases resolved against the current time rather than just the date. Replies
+# to them are only valid for the minute they were made, so they are not cached.
+RELATIVE_TIME_PATTERN = re.compile(
+    r"\b(?:in\s+(?:\d+|an?|half\s+an|a\s+few|a\s+couple(?:\s+of)?)\s*(?:min(?:ute)?s?|h(?:ou)?rs?)"
+    r"|tonight|later|soon|right\s+now|now|this\s+(?:morning|afternoon|evening))\b"
+)
+
+# Opt-in JSON output: Groq JSON mode and a Gemini response schema
+AI_STRUCTURED_OUTPUT = os.environ.get("AI_STRUCTURED_OUTPUT", "0") == "1"
+
+# Warm the provider SDKs in the background once the bot is accepting updates
+AI_WARMUP = os.environ.get("AI_WARMUP", "1") == "1"
+# Provider SDKs are slow to import and Gemini is only a fallback, so they are
+# imported on first use (or by warm_ai_clients) instead of at startup
+PROVIDER_MODULES = ("httpx", "groq", "google.generativeai")
+
+# Clients are created once on first use and reused for every message
+_groq_client = None
+_gemini_model = None
+
+async def _import_off_loop(*modules):
+    """Import modules not loaded yet in a worker thread so the event loop keeps serving"""
+    missing = [module for module in modules if module not in sys.modules]
+    if missing:
+        await asyncio.to_thread(lambda: [importlib.import_module(module) for module in missing])
+
+def get_groq_client():
+    """Return the shared async Groq client, creating it on first use"""
+    global _groq_client
+    if _groq_client is None:
+        httpx = importlib.import_module("httpx")
+        groq = importlib.import_module("groq")
+        http_client = httpx.AsyncClient(
+            timeout=GROQ_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_CONNECTIONS,
+            ),
         )
-        response = completion.choices[0].message.content
-        return response
+        _groq_client = groq.AsyncGroq(
+            api_key=GROQ_API_KEY,
+            timeout=GROQ_TIMEOUT,
+            max_retries=0,
+            http_client=http_client,
+        )
+    return _groq_client
+
+def get_gemini_model():
+    """Return the shared Gemini model, configuring the SDK on first use"""
+    global _gemini_model
+    if _gemini_model is None:
+        genai = importlib.import_module("google.generativeai")
+        genai.configure(api_key=GEMINI_API_KEY)
+        # The static prompt is fixed on the model; only the date block is sent per call
+        if AI_STRUCTURED_OUTPUT:
+            _gemini_model = genai.GenerativeModel(
+                'gemini-2.5-flash',
+                system_instruction=STRUCTURED_SYSTEM_PROMPT,
+                generation_config={
+                    "response_mime_type": "application/json",
+                    "response_schema": TASK_RESPONSE_SCHEMA,
+                },
+            )
+        else:
+            _gemini_model = genai.GenerativeModel(
+                'gemini-2.5-flash',
+                system_instruction=STATIC_SYSTEM_PROMPT,
+            )
+    return _gemini_model
+
+async def warm_ai_clients():
+    """Import the provider SDKs off the event loop and create the clients ahead of the first LLM call"""
+    started = time.perf_counter()
+    try:
+        await _import_off_loop(*PROVIDER_MODULES)
+        get_groq_client()
+        get_gemini_model()
+        logger.info(f"AI clients warmed in {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        logger.error(f"Failed to warm AI clients: {e}")
+
+async def close_ai_clients():
+    """Close the shared LLM clients and their keep-alive connections"""
+    global _groq_client, _gemini_model
+    if _groq_client is not None:
+        client, _groq_client = _groq_client, None
+        await client.close()
+    _gemini_model = None
+    if _llm_router is not None:
+        logger.info(f"LLM router stats: {_llm_router.stats()}")
+    logger.info(f"AI parse metrics: {get_parse_metrics()}")
+    if _response_cache is not None:
+        logger.info(f"AI response cache stats: {_response_cache.stats()}")
+        _response_cache.close()
 
-    except Exception as groq_error:
-        print(f"Groq API failed: {groq_error}")
-        print("Trying Gemini as fallback...")
-        try:
-            genai.configure(api_key=GEMINI_API_KEY)
-            gemini_model = genai.GenerativeModel('gemini-2.5-flash')
-            full_prompt = f"{system_prompt}\n\nUser: {text}"
-            gemini_response = gemini_model.generate_content(full_prompt)
-            return gemini_response.text
-        except Exception as gemini_error:
-            print(f"Gemini API also failed: {gemini_error}")
+class SqliteResponseCache:
+    """On-disk cache tier so cached responses survive restarts"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS ai_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            self._conn.execute('DELETE FROM ai_cache WHERE expires_at < ?', (time.time(),))
+            self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, expires_at FROM ai_cache WHERE key = ?', (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
             return None
+        response, records = json.loads(row[0])
+        return response, tuple(tuple(record) for record in records)
 
+    def put(self, key: str, value, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO ai_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), expires_at)
+            )
+            self._conn.commit()
 
-async def parse_ai_response(response: str) -> Tuple[Optional[str], Optional[str], Optional[str], Optional[str], Optional[str]]:
-    patterns = {
-        "action": re.compile(r"Action:\s*(.+)", re.IGNORECASE),
-        "task": re.compile(r"Task:\s*(.+)", re.IGNORECASE),
-        "duedate": re.compile(r"Due date:\s*(.+)", re.IGNORECASE),
-        "time": re.compile(r"Time:\s*(.+)", re.IGNORECASE),
-        "note": re.compile(r"Note:\s*(.+)", re.IGNORECASE),
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """Bounded LRU/TTL cache of (reply, parsed task tuples) keyed on normalized text and date"""
+
+    def __init__(self, max_size: int = AI_CACHE_SIZE, ttl: float = AI_CACHE_TTL, db_path: Optional[str] = AI_CACHE_DB):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, tuple]]" = OrderedDict()
+        self._disk = SqliteResponseCache(db_path) if db_path else None
+
+    @staticmethod
+    def make_key(text: str, today: Optional[datetime.date] = None) -> str:
+        # The prompt embeds the user's local date, so relative dates are only valid for the same day
+        today = today or datetime.date.today()
+        return f"{today.isoformat()}|{normalize_text(text)}"
+
+    def _put_memory(self, key: str, value, expires_at: float):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, text: str, today: Optional[datetime.date] = None):
+        key = self.make_key(text, today)
+        entry = self._entries.get(key)
+        value = None
+        if entry is not None:
+            if entry[0] >= time.time():
+                self._entries.move_to_end(key)
+                value = entry[1]
+            else:
+                del self._entries[key]
+
+        if value is None and self._disk is not None:
+            value = await asyncio.to_thread(self._disk.get, key)
+            if value is not None:
+                self._put_memory(key, value, time.time() + self.ttl)
+
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        response, records = value
+        return response, [TaskRecord(*record) for record in records]
+
+    async def put(self, text: str, response: str, records: List[TaskRecord], today: Optional[datetime.date] = None):
+        key = self.make_key(text, today)
+        expires_at = time.time() + self.ttl
+        value = (response, tuple(record.as_row() for record in records))
+        self._put_memory(key, value, expires_at)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.put, key, value, expires_at)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
+
+
+_response_cache: Optional[ResponseCache] = None
+
+def get_response_cache() -> ResponseCache:
+    """Return the shared parsed-response cache, creating it on first use"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
+
+def is_time_relative(text: str) -> bool:
+    """Whether the message mentions a time relative to now ("in 2 hours", "tonight")"""
+    return bool(RELATIVE_TIME_PATTERN.search(normalize_text(text)))
+
+async def get_cached_ai_response(text: str, today: Optional[datetime.date] = None):
+    """Return a cached (reply, task records) pair for this message on the user's date `today`, or None"""
+    if is_time_relative(text):
+        return None
+    return await get_response_cache().get(text, today)
+
+async def cache_ai_response(text: str, response: str, records: List[TaskRecord], today: Optional[datetime.date] = None):
+    """Remember a parsed response; only responses that produced tasks, and not relative to the current time, are cached"""
+    if records and not is_time_relative(text):
+        await get_response_cache().put(text, response, records, today)
+
+async def call_groq(text: str, now: Optional[datetime.datetime] = None) -> str:
+    """One completion from Groq, with the date block rendered for `now`"""
+    await _import_off_loop("httpx", "groq")
+    extra_args = {}
+    if AI_STRUCTURED_OUTPUT:
+        extra_args["response_format"] = {"type": "json_object"}
+    completion = await get_groq_client().chat.completions.create(
+        messages=get_prompt_messages(now, structured=AI_STRUCTURED_OUTPUT) + [
+            {"role": "user", "content": text}
+        ],
+        model="llama-3.3-70b-versatile",
+        temperature=0.7,
+        max_tokens=1024,  # Changed from max_completion_tokens
+        top_p=1,
+        stream=False,
+        stop=None,
+        **extra_args,
+    )
+    return completion.choices[0].message.content
+
+async def call_gemini(text: str, now: Optional[datetime.datetime] = None) -> str:
+    """One completion from Gemini, with the date block rendered for `now`"""
+    await _import_off_loop("google.generativeai")
+    full_prompt = f"{render_date_context(now)}\nUser: {text}"
+    gemini_response = await get_gemini_model().generate_content_async(
+        full_prompt,
+        request_options={"timeout": GEMINI_TIMEOUT},
+    )
+    return gemini_response.text
+
+_llm_router: Optional[LLMRouter] = None
+
+def get_llm_router() -> LLMRouter:
+    """Return the shared provider router: Groq first, Gemini as hedge and fallback"""
+    global _llm_router
+    if _llm_router is None:
+        _llm_router = LLMRouter([
+            Provider("groq", call_groq, GROQ_MAX_CONCURRENCY, GROQ_TIMEOUT),
+            Provider("gemini", call_gemini, GEMINI_MAX_CONCURRENCY, GEMINI_TIMEOUT),
+        ])
+    return _llm_router
+
+_admission: Optional[AdmissionController] = None
+# Identical messages already waiting on the LLM share that one call
+_llm_single_flight = SingleFlight()
+
+def get_admission() -> AdmissionController:
+    """Return the shared per-user/global LLM admission controller"""
+    global _admission
+    if _admission is None:
+        _admission = AdmissionController()
+    return _admission
+
+async def get_ai_response(text: str, now: Optional[datetime.datetime] = None, user_id: Optional[int] = None) -> str:
+    """Ask the LLM providers, hedging slow calls; None if none of them answered.
+
+    `now` is the user's local time, so relative dates resolve in their timezone.
+    A message identical to one already in flight with the same rendered date
+    and time block, i.e. the exact same prompt, joins that call without using a
+    token; otherwise the call must be admitted for `user_id` first, and LLMBusy
+    is raised if it isn't.
+    """
+    key = f"{render_date_context(now)}|{normalize_text(text)}"
+    if not _llm_single_flight.joinable(key):
+        await get_admission().admit(user_id)
+    return await _llm_single_flight.do(key, lambda: get_llm_router().complete(text, now))
+
+
+# Compiled once; used to scrape the emoji-prefixed plain-text format
+FIELD_PATTERNS = {
+    "action": re.compile(r"Action:\s*(.+)", re.IGNORECASE),
+    "task": re.compile(r"Task:\s*(.+)", re.IGNORECASE),
+    "duedate": re.compile(r"Due date:\s*(.+)", re.IGNORECASE),
+    "time": re.compile(r"Time:\s*(.+)", re.IGNORECASE),
+    "note": re.compile(r"Note:\s*(.+)", re.IGNORECASE),
+    "repeat": re.compile(r"Repeat:\s*(.+)", re.IGNORECASE),
+}
+# Splits a plain-text response into one block per "Action:" line
+ACTION_LINE_PATTERN = re.compile(r"^.*Action:", re.IGNORECASE | re.MULTILINE)
+
+def get_parse_metrics() -> dict:
+    """Return how often responses were turned into tasks (ok), were a plain reply such as a
+    clarifying question (reply), or looked like tasks but could not be parsed (failed)"""
+    return {
+        f"{fmt}_{result}": int(AI_PARSE_RESULTS.value(fmt, result))
+        for fmt in ("structured", "text")
+        for result in ("ok", "reply", "failed")
     }
 
+def _parse_text_block(block: str) -> Optional[TaskRecord]:
     def extract_field(field: str) -> Optional[str]:
-        match = patterns[field].search(response)
+        match = FIELD_PATTERNS[field].search(block)
         if match:
             val = match.group(1).strip()
             if val.lower() == "null":
@@ -63,13 +364,62 @@ async def parse_ai_response(response: str) -> Tuple[Optional[str], Optional[str]
         return None
 
     action = extract_field("action")
-    task = extract_field("task")
-    duedate = extract_field("duedate")
-    duetime = extract_field("time")
-    note = extract_field("note")
-
-    # If required, add validation: return None tuple if action is missing
+    # If required, add validation: skip the block if action is missing
     if not action:
-        return None, None, None, None, None
+        return None
+    return TaskRecord(
+        action,
+        extract_field("task"),
+        extract_field("duedate"),
+        extract_field("time"),
+        extract_field("note"),
+        parse_recurrence(extract_field("repeat")),
+    )
+
+def _parse_text_response(response: str) -> List[TaskRecord]:
+    starts = [match.start() for match in ACTION_LINE_PATTERN.finditer(response)]
+    if not starts:
+        return []
+    bounds = zip(starts, starts[1:] + [len(response)])
+    records = [_parse_text_block(response[start:end]) for start, end in bounds]
+    return [record for record in records if record is not None]
 
-    return action, task, duedate, duetime, note
\ No newline at end of file
+def is_structured_response(response: str) -> bool:
+    return response.lstrip().startswith("{")
+
+async def parse_ai_tasks(response: str) -> List[TaskRecord]:
+    """Parse every task in a response, whether structured JSON or plain text"""
+    if is_structured_response(response):
+        records, reply = parse_task_records(response)
+        if records is None or (not records and not reply):
+            AI_PARSE_RESULTS.labels("structured", "failed").inc()
+            logger.error(f"Failed to parse structured response: {response[:200]}")
+            return []
+        AI_PARSE_RESULTS.labels("structured", "ok" if records else "reply").inc()
+        return records
+
+    records = _parse_text_response(response)
+    if records:
+        result = "ok"
+    elif ACTION_LINE_PATTERN.search(response):
+        result = "failed"
+    else:
+        result = "reply"  # A question or answer for the user, not a parse failure
+    AI_PARSE_RESULTS.labels("text", result).inc()
+    return records
+
+def format_ai_reply(response: str, records: List[TaskRecord]) -> str:
+    """Text to show the user for a response and the tasks parsed from it"""
+    if not is_structured_response(response):
+        return response
+    if records:
+        return "\n\n".join(format_intent_reply(*record.as_row()) for record in records)
+    _, reply = parse_task_records(response)
+    return reply or "Sorry, I didn't understand that. Could you rephrase?"
+
+async def parse_ai_response(response: str) -> Tuple[Optional[str], Optional[str], Optional[str], Optional[str], Optional[str]]:
+    records = await parse_ai_tasks(response)
+    # Return None tuple if no task with an action was found
+    if not records:
+        return None, None, None, None, None
+    return records[0].as_tuple()
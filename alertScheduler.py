@@ -0,0 +1,202 @@
+import os
+import logging
+import heapq
+import asyncio
+import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from dbHandler import get_tasks_due_between
+from recurrence import expand_occurrences
+from metrics import ALERT_SEND_LAG
+
+logger = logging.getLogger(__name__)
+
+# How long before the deadline an alert goes out, and how far ahead of that
+# the scheduler keeps tasks loaded in memory
+ALERT_LEAD_TIME = datetime.timedelta(minutes=float(os.environ.get("ALERT_LEAD_MINUTES", "120")))
+SCHEDULER_HORIZON = datetime.timedelta(hours=float(os.environ.get("SCHEDULER_HORIZON_HOURS", "6")))
+# Retry delay after a failed window load
+SCHEDULER_RETRY_SECONDS = 60
+
+
+def utc_now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class AlertScheduler:
+    """Min-heap of pending deadline alerts keyed on fire time (due minus lead time).
+
+    Tasks are loaded from Postgres one window at a time and kept current by
+    the dbHandler task events (local writes and the change feed), so the
+    database is only queried when the loaded window runs low. With a
+    ShardOwnership, only tasks of users in this instance's shards are kept.
+    Repeating tasks are scheduled as their occurrences within the window,
+    keyed by (task id, occurrence date); one-off tasks use date.min.
+    """
+
+    def __init__(
+        self,
+        send_alerts: Callable[[List[object]], Awaitable[None]],
+        lead_time: datetime.timedelta = ALERT_LEAD_TIME,
+        horizon: datetime.timedelta = SCHEDULER_HORIZON,
+        ownership=None,
+        clock: Callable[[], datetime.datetime] = utc_now,
+    ):
+        self.send_alerts = send_alerts
+        self.ownership = ownership
+        self.clock = clock
+        self.lead_time = lead_time
+        self.horizon = horizon
+        self._heap: List[Tuple[datetime.datetime, tuple]] = []
+        # (task id, occurrence) -> (fire time, task); heap entries that no longer match are stale
+        self._scheduled: Dict[tuple, Tuple[datetime.datetime, object]] = {}
+        self._loaded_until: Optional[datetime.datetime] = None
+        self._wakeup = asyncio.Event()
+        self._in_flight = set()
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    @staticmethod
+    def _key(task) -> tuple:
+        return task['id'], task.get('occurrence') or datetime.date.min
+
+    def schedule(self, task):
+        """Add or reschedule a task's alert (or the alerts of a repeating task's occurrences)"""
+        if task.get('recurrence') and task.get('occurrence') is None:
+            self._schedule_series(task)
+            return
+        key = self._key(task)
+        due_at = task['due_at']
+        if due_at is None or task['alerted'] or task['completed']:
+            self.unschedule(key)
+            return
+        if self.ownership is not None and not self.ownership.owns(task['userid']):
+            self.unschedule(key)
+            return
+        # Tasks beyond the loaded window are picked up by the next load
+        if self._loaded_until is None or due_at > self._loaded_until:
+            self.unschedule(key)
+            return
+        if due_at <= self.clock():
+            self.unschedule(key)
+            return
+
+        fire_at = due_at - self.lead_time
+        self._scheduled[key] = (fire_at, task)
+        heapq.heappush(self._heap, (fire_at, key))
+        self._wakeup.set()
+
+    def _schedule_series(self, task):
+        # Re-expand the occurrences in the loaded window; ones already alerted
+        # elsewhere are rescheduled here but lose the claim when they fire
+        self.unschedule_task(task['id'])
+        if self._loaded_until is None or task['completed']:
+            return
+        now = self.clock()
+        for occurrence in expand_occurrences([task], now, self._loaded_until):
+            self.schedule(occurrence)
+
+    def unschedule(self, key: tuple):
+        """Drop one pending alert; its heap entry is discarded lazily"""
+        self._scheduled.pop(key, None)
+
+    def unschedule_task(self, task_id: int):
+        """Drop every pending alert of a task, including all its occurrences"""
+        for key in [key for key in self._scheduled if key[0] == task_id]:
+            del self._scheduled[key]
+
+    def reset(self):
+        """Forget everything so the next loop iteration reloads the window from Postgres"""
+        self._heap.clear()
+        self._scheduled.clear()
+        self._loaded_until = None
+        self._wakeup.set()
+
+    def on_task_event(self, event: str, task):
+        """dbHandler task listener keeping the heap in sync with writes"""
+        if event == 'resync':
+            self.reset()
+        elif event == 'delete':
+            self.unschedule_task(task['id'])
+        else:
+            self.schedule(task)
+
+    def on_ownership_change(self, owned):
+        """ShardOwnership listener: reload the window for the new set of shards"""
+        self.reset()
+
+    async def load_window(self, now: datetime.datetime) -> bool:
+        """Load tasks whose due time falls in the next window; False if the query failed"""
+        start = self._loaded_until or now
+        end = now + self.lead_time + self.horizon
+        if self.ownership is None:
+            tasks = await get_tasks_due_between(start, end)
+        elif self.ownership.owned:
+            tasks = await get_tasks_due_between(start, end, self.ownership.shards(), self.ownership.shard_count)
+        else:
+            tasks = []  # No shards owned (yet); nothing to load
+        if tasks is None:
+            return False
+        self._loaded_until = end
+        for task in tasks:
+            self.schedule(task)
+        logger.info(f"Alert scheduler loaded {len(tasks)} tasks due until {end}")
+        return True
+
+    def _pop_due(self, now: datetime.datetime):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, key = heapq.heappop(self._heap)
+            entry = self._scheduled.get(key)
+            if entry is None or entry[0] != fire_at:
+                continue  # Stale entry left by a reschedule or unschedule
+            del self._scheduled[key]
+            due.append(entry[1])
+        return due
+
+    def _next_wakeup(self, now: datetime.datetime) -> float:
+        refill_at = self._loaded_until - self.lead_time - self.horizon / 2
+        next_at = refill_at
+        while self._heap:
+            fire_at, key = self._heap[0]
+            entry = self._scheduled.get(key)
+            if entry is None or entry[0] != fire_at:
+                heapq.heappop(self._heap)
+                continue
+            next_at = min(next_at, fire_at)
+            break
+        return max((next_at - now).total_seconds(), 0)
+
+    async def _fire(self, tasks):
+        try:
+            await self.send_alerts(tasks)
+        except Exception as e:
+            logger.error(f"Failed to send {len(tasks)} alerts: {e}")
+            return
+        # Lag is measured once the whole batch has gone out
+        sent_at = self.clock()
+        for task in tasks:
+            ALERT_SEND_LAG.observe((sent_at - (task['due_at'] - self.lead_time)).total_seconds())
+
+    async def run(self):
+        """Fire alerts at due-minus-lead-time, loading new windows as needed"""
+        while True:
+            now = self.clock()
+            if self._loaded_until is None or now + self.lead_time + self.horizon / 2 >= self._loaded_until:
+                if not await self.load_window(now):
+                    await asyncio.sleep(SCHEDULER_RETRY_SECONDS)
+                    continue
+
+            # Alerts due at the same moment are sent and acknowledged as one batch
+            due = self._pop_due(now)
+            if due:
+                fire_task = asyncio.create_task(self._fire(due))
+                self._in_flight.add(fire_task)
+                fire_task.add_done_callback(self._in_flight.discard)
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._next_wakeup(self.clock()))
+            except asyncio.TimeoutError:
+                pass
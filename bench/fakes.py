@@ -0,0 +1,333 @@
+"""Stand-ins for Telegram, the LLM providers and Postgres used by the benchmarks.
+
+The fakes only implement what main.py touches, and every call can be given
+an artificial latency so the numbers reflect the bot's own overhead on top
+of realistic network round-trips.
+"""
+import asyncio
+import datetime
+import itertools
+from zoneinfo import ZoneInfo
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import dbHandler
+from recurrence import expand_occurrences, occurrence_row
+from taskSearch import rank_tasks
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.first_name = f"user{user_id}"
+
+
+class FakeChat:
+    def __init__(self, chat_id: int):
+        self.id = chat_id
+
+
+class FakeMessage:
+    def __init__(self, user: FakeUser, text: Optional[str]):
+        self.from_user = user
+        self.chat = FakeChat(user.id)
+        self.chat_id = user.id
+        self.text = text
+        self.replies: List[str] = []
+
+    async def reply_text(self, text: str, **kwargs):
+        self.replies.append(text)
+        return self
+
+
+class FakeUpdate:
+    def __init__(self, user: FakeUser, text: Optional[str]):
+        self.message = FakeMessage(user, text)
+        self.effective_message = self.message
+        self.effective_user = user
+        self.effective_chat = self.message.chat
+        self.callback_query = None
+
+
+class FakeContext:
+    """Per-user handler context; user_data persists across that user's messages"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.user_data: Dict = {}
+        self.chat_data: Dict = {}
+        self.bot_data: Dict = {}
+
+
+class FakeBot:
+    """Records sent messages and the time each one was delivered"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.sent = []
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent.append((chat_id, text, datetime.datetime.now(datetime.timezone.utc)))
+
+
+class FakeApp:
+    def __init__(self, bot: FakeBot):
+        self.bot = bot
+        self.bot_data: Dict = {}
+
+
+class ScriptedLLM:
+    """Local replacement for aiHandler.get_ai_response with a fixed latency.
+
+    It answers in the same emoji summary format as the real prompt, treating
+    the whole message as the task to add.
+    """
+
+    def __init__(self, latency: float = 0.3):
+        self.latency = latency
+        self.calls = 0
+
+    async def get_ai_response(self, text: str, now=None, user_id=None) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return (
+            "👨‍💻 Action: add\n"
+            f"📝 Task: {text}\n"
+            "🗓️ Due date: null\n"
+            "⏱️ Time: null\n"
+            "🗒️ Note: null"
+        )
+
+
+class InMemoryTaskStore:
+    """In-memory stand-in for the dbHandler data-access functions.
+
+    Every public coroutine stands for one database round-trip and sleeps for
+    `latency` seconds to simulate the network hop to Postgres.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tasks: Dict[int, dict] = {}
+        self.reminder_claims = set()
+        # (task id, occurrence date) -> alert/completion state, like task_occurrences
+        self.occurrences: Dict[tuple, dict] = {}
+        self.timezones: Dict[int, str] = {}
+        self._by_user: Dict[int, set] = defaultdict(set)
+        self._ids = itertools.count(1)
+
+    async def _round_trip(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def seed(self, user_id: int, task: str, duedate=None, duetime=None, note=None, recurrence=None) -> dict:
+        """Insert a task directly, bypassing the simulated latency"""
+        task_id = next(self._ids)
+        due_at = None
+        if duedate and duetime:
+            due_at = datetime.datetime.combine(duedate, duetime, tzinfo=self._zone(user_id))
+        row = {
+            'id': task_id, 'action': 'add', 'task': task, 'note': note, 'userid': user_id,
+            'duedate': duedate, 'duetime': duetime, 'due_at': due_at,
+            'timezone': self._zone(user_id).key, 'recurrence': recurrence,
+            'alerted': False, 'completed': False,
+        }
+        self.tasks[task_id] = row
+        self._by_user[user_id].add(task_id)
+        return row
+
+    @staticmethod
+    def _sort_key(row):
+        return (row['duedate'] is None, row['duedate'] or datetime.date.min,
+                row['duetime'] is None, row['duetime'] or datetime.time.min, row['id'])
+
+    def _zone(self, user_id: int) -> ZoneInfo:
+        return ZoneInfo(self.timezones.get(user_id, dbHandler.DEFAULT_TIMEZONE))
+
+    def _occurrence(self, task_id: int, day: datetime.date) -> dict:
+        return self.occurrences.setdefault((task_id, day), {'alerted': False, 'completed': False, 'alert_attempts': 0})
+
+    def _open_tasks(self, user_id: int):
+        rows = [self.tasks[i] for i in self._by_user.get(user_id, ()) if not self.tasks[i]['completed']]
+        return sorted(rows, key=self._sort_key)
+
+    async def insert_task(self, action, task, duedate, duetime, note, userId):
+        await self._round_trip()
+        parsed_date = datetime.date.fromisoformat(duedate) if duedate else None
+        parsed_time = datetime.datetime.strptime(duetime, "%H:%M").time() if duetime else None
+        row = self.seed(userId, task, parsed_date, parsed_time, note)
+        dbHandler.dispatch_task_event('insert', row)
+        return row
+
+    async def insert_tasks(self, records, userId):
+        await self._round_trip()
+        rows = []
+        for action, task, duedate, duetime, note, *recurrence in records:
+            parsed_date = datetime.date.fromisoformat(duedate) if duedate else None
+            parsed_time = datetime.datetime.strptime(duetime, "%H:%M").time() if duetime else None
+            rows.append(self.seed(userId, task, parsed_date, parsed_time, note, *recurrence))
+        for row in rows:
+            dbHandler.dispatch_task_event('insert', row)
+        return rows
+
+    async def fetch_open_tasks(self, userId):
+        await self._round_trip()
+        return [dict(row) for row in self._open_tasks(userId)]
+
+    async def fetch_open_tasks_page(self, userId, after_id, limit):
+        await self._round_trip()
+        rows = self._open_tasks(userId)
+        if after_id is not None:
+            ids = [row['id'] for row in rows]
+            if after_id not in ids:
+                return []
+            rows = rows[ids.index(after_id) + 1:]
+        return [dict(row) for row in rows[:limit]]
+
+    async def update_task_completion(self, task_id: int, completed: bool = True, userId=None):
+        await self._round_trip()
+        row = self.tasks.get(task_id)
+        if row is None or (userId is not None and row['userid'] != userId):
+            return False
+        row['completed'] = completed
+        dbHandler.dispatch_task_event('update', dict(row))
+        return dict(row)
+
+    async def delete_task(self, task_id: int, userId=None):
+        await self._round_trip()
+        row = self.tasks.get(task_id)
+        if row is None or (userId is not None and row['userid'] != userId):
+            return False
+        del self.tasks[task_id]
+        self._by_user[row['userid']].discard(task_id)
+        dbHandler.dispatch_task_event('delete', row)
+        return row
+
+    @staticmethod
+    def _in_shards(row, shards, shard_count):
+        return shards is None or row['userid'] % shard_count in shards
+
+    async def fetch_user_timezone(self, userId):
+        await self._round_trip()
+        return self.timezones.get(userId)
+
+    async def get_reminder_wave_tasks(self, start, end, remind_time, shards=None, shard_count=1):
+        await self._round_trip()
+        rows = []
+        for row in self.tasks.values():
+            zone = self._zone(row['userid'])
+            local_date = start.astimezone(zone).date()
+            remind_at = datetime.datetime.combine(local_date, remind_time, tzinfo=zone)
+            if (start <= remind_at < end and row['recurrence'] is None
+                    and row['duedate'] == local_date + datetime.timedelta(days=1)
+                    and self._in_shards(row, shards, shard_count)):
+                rows.append({**row, 'local_date': local_date})
+        return sorted(rows, key=self._sort_key)
+
+    async def claim_reminders(self, user_ids, remind_dates):
+        if not user_ids:
+            return []
+        await self._round_trip()
+        claimed = [user_id for user_id, remind_date in zip(user_ids, remind_dates)
+                   if (user_id, remind_date) not in self.reminder_claims]
+        self.reminder_claims.update(zip(user_ids, remind_dates))
+        return claimed
+
+    async def claim_task_alerts(self, task_ids):
+        if not task_ids:
+            return []
+        await self._round_trip()
+        claimed = []
+        for task_id in task_ids:
+            row = self.tasks.get(task_id)
+            if row is not None and not row['alerted'] and not row['completed']:
+                row['alerted'] = True
+                claimed.append(dict(row))
+                dbHandler.dispatch_task_event('update', dict(row))
+        return claimed
+
+    async def release_task_alerts(self, task_ids, max_attempts: int = dbHandler.ALERT_MAX_ATTEMPTS):
+        if not task_ids:
+            return []
+        await self._round_trip()
+        released = []
+        for task_id in task_ids:
+            row = self.tasks.get(task_id)
+            if (row is not None and row['alerted'] and not row['completed']
+                    and row.get('alert_attempts', 0) + 1 < max_attempts):
+                row['alerted'] = False
+                row['alert_attempts'] = row.get('alert_attempts', 0) + 1
+                released.append(dict(row))
+                dbHandler.dispatch_task_event('update', dict(row))
+        return released
+
+    async def claim_occurrence_alerts(self, occurrences):
+        if not occurrences:
+            return []
+        await self._round_trip()
+        claimed = []
+        for occurrence in occurrences:
+            row = self.tasks.get(occurrence['id'])
+            state = self._occurrence(occurrence['id'], occurrence['occurrence'])
+            if row is not None and not row['completed'] and not state['alerted'] and not state['completed']:
+                state['alerted'] = True
+                claimed.append(dict(occurrence, alerted=True))
+                dbHandler.dispatch_task_event('occurrence', claimed[-1])
+        return claimed
+
+    async def release_occurrence_alerts(self, occurrences, max_attempts: int = dbHandler.ALERT_MAX_ATTEMPTS):
+        if not occurrences:
+            return []
+        await self._round_trip()
+        released = []
+        for occurrence in occurrences:
+            state = self.occurrences.get((occurrence['id'], occurrence['occurrence']))
+            if (state is not None and state['alerted'] and not state['completed']
+                    and state['alert_attempts'] + 1 < max_attempts):
+                state['alerted'] = False
+                state['alert_attempts'] += 1
+                released.append(dict(occurrence, alerted=False))
+                dbHandler.dispatch_task_event('occurrence', released[-1])
+        return released
+
+    async def complete_occurrence(self, task, occurrence_date, userId=None):
+        await self._round_trip()
+        row = self.tasks.get(task['id'])
+        if row is None or (userId is not None and row['userid'] != userId):
+            return False
+        self._occurrence(task['id'], occurrence_date)['completed'] = True
+        completed = dict(occurrence_row(task, occurrence_date), completed=True)
+        dbHandler.dispatch_task_event('occurrence', completed)
+        return completed
+
+    async def fetch_completed_occurrences(self, task_ids, today):
+        await self._round_trip()
+        task_ids = set(task_ids)
+        return [
+            {'task_id': task_id, 'occurrence_date': day}
+            for (task_id, day), state in self.occurrences.items()
+            if task_id in task_ids and day >= today and state['completed']
+        ]
+
+    async def fetch_task_candidates(self, userId, query, limit):
+        # Stands in for the pg_trgm lookup; the bot ranks the candidates again itself
+        await self._round_trip()
+        return [dict(task) for _, task in rank_tasks(self._open_tasks(userId), query, limit)]
+
+    async def get_tasks_due_between(self, start, end, shards=None, shard_count=1):
+        await self._round_trip()
+        rows = [row for row in self.tasks.values() if not row['completed'] and self._in_shards(row, shards, shard_count)]
+        due = [
+            dict(row) for row in rows
+            if row['recurrence'] is None and row['due_at'] is not None
+            and start < row['due_at'] <= end and not row['alerted']
+        ]
+        occurrences = expand_occurrences([row for row in rows if row['recurrence']], start, end)
+        return due + [
+            occurrence for occurrence in occurrences
+            if not self._occurrence(occurrence['id'], occurrence['occurrence'])['alerted']
+        ]
+
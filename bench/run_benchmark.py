@@ -0,0 +1,254 @@
+"""Offline benchmarks for the bot's hot paths.
+
+Replays synthetic traffic through main.echo, one alert burst through the
+AlertScheduler and one daily reminder wave, with Telegram and the LLM
+replaced by local fakes. The database is an in-memory store by default, or
+a real Postgres when --postgres is given (DATABASE_URL must point at a
+disposable database; benchmark users are removed afterwards).
+
+    python -m bench.run_benchmark --users 200 --tasks 5 --llm-latency 0.3
+"""
+import time
+import asyncio
+import argparse
+import datetime
+import functools
+import statistics
+from zoneinfo import ZoneInfo
+from collections import Counter
+
+import main
+import alertScheduler
+import dbHandler
+from metrics import render_metrics
+from alertScheduler import AlertScheduler
+from messageDelivery import MessageDelivery
+from bench.fakes import FakeApp, FakeBot, FakeContext, FakeUpdate, FakeUser, InMemoryTaskStore, ScriptedLLM
+
+# Data-access functions the hot paths call, and the module attributes that hold them
+BACKEND_FUNCTIONS = {
+    'insert_tasks': [main],
+    'fetch_open_tasks': [dbHandler],
+    'fetch_open_tasks_page': [dbHandler],
+    'fetch_user_timezone': [dbHandler],
+    'update_task_completion': [main],
+    'delete_task': [main],
+    'get_reminder_wave_tasks': [main],
+    'claim_reminders': [main],
+    'claim_task_alerts': [main],
+    'release_task_alerts': [main],
+    'claim_occurrence_alerts': [main],
+    'release_occurrence_alerts': [main],
+    'complete_occurrence': [main],
+    'fetch_completed_occurrences': [dbHandler],
+    'fetch_task_candidates': [dbHandler],
+    'get_tasks_due_between': [alertScheduler],
+}
+# Real user ids are far below this, so benchmark rows are easy to clean up
+BENCH_USER_OFFSET = 10 ** 12
+
+# One conversation per user: fast-path list, fast-path adds of a one-off and a
+# repeating task, an LLM-bound message, completing the repeating task by name,
+# then the two-step delete flow
+CONVERSATION = [
+    "show my tasks",
+    "add buy milk tomorrow at 2pm",
+    "remind me to stretch every day at 11:59pm",
+    "remember the thing about the quarterly report",
+    "mark stretch as done",
+    "delete task",
+    "1",
+]
+
+
+def install_backend(backend, round_trips: Counter):
+    """Point the hot paths at backend's functions, counting each call as a round-trip"""
+    for name, modules in BACKEND_FUNCTIONS.items():
+        func = getattr(backend, name)
+
+        @functools.wraps(func)
+        async def counted(*args, _func=func, _name=name, **kwargs):
+            round_trips[_name] += 1
+            return await _func(*args, **kwargs)
+
+        for module in modules:
+            setattr(module, name, counted)
+
+
+def percentiles(samples):
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
+
+
+def report(title, rows):
+    print(f"\n== {title}")
+    for label, value in rows:
+        print(f"  {label:<28} {value}")
+
+
+def local_today() -> datetime.date:
+    """Today in DEFAULT_TIMEZONE, the timezone of every benchmark user"""
+    return datetime.datetime.now(ZoneInfo(dbHandler.DEFAULT_TIMEZONE)).date()
+
+
+async def seed_tasks(backend, users, tasks_per_user, postgres: bool):
+    tomorrow = local_today() + datetime.timedelta(days=1)
+    for user_id in users:
+        for i in range(tasks_per_user):
+            due_time = datetime.time(9 + i % 10, 0)
+            if postgres:
+                await dbHandler.insert_task('add', f"task {i}", tomorrow.isoformat(), due_time.strftime("%H:%M"), None, user_id)
+            else:
+                backend.seed(user_id, f"task {i}", tomorrow, due_time)
+
+
+async def bench_echo(args, llm, round_trips):
+    users = [FakeUser(BENCH_USER_OFFSET + i) for i in range(args.users)]
+    bot = FakeBot()
+    latencies = []
+
+    async def run_user(user):
+        context = FakeContext(bot)
+        for text in CONVERSATION:
+            started = time.perf_counter()
+            await main.echo(FakeUpdate(user, text), context)
+            latencies.append(time.perf_counter() - started)
+
+    round_trips.clear()
+    llm.calls = 0
+    started = time.perf_counter()
+    await asyncio.gather(*(run_user(user) for user in users))
+    elapsed = time.perf_counter() - started
+
+    messages = len(latencies)
+    p50, p95, p99 = percentiles(latencies)
+    report("echo", [
+        ("messages", messages),
+        ("messages/sec", f"{messages / elapsed:.1f}"),
+        ("latency p50/p95/p99 (ms)", f"{p50 * 1000:.1f} / {p95 * 1000:.1f} / {p99 * 1000:.1f}"),
+        ("DB round-trips/message", f"{sum(round_trips.values()) / messages:.2f}"),
+        ("LLM calls/message", f"{llm.calls / messages:.2f}"),
+        ("round-trips by query", dict(round_trips)),
+    ])
+
+
+async def bench_alerts(args, backend, round_trips, postgres: bool):
+    bot = FakeBot(latency=args.send_latency)
+    app = FakeApp(bot)
+    app.bot_data['delivery'] = MessageDelivery(global_rate=args.delivery_rate)
+
+    # Spread the alerts over the next few seconds and fire them at their due time
+    now = datetime.datetime.now(datetime.timezone.utc)
+    due = {}
+    for i in range(args.alerts):
+        due_at = now + datetime.timedelta(seconds=1 + args.alert_spread * i / max(args.alerts, 1))
+        user_id = BENCH_USER_OFFSET + i % args.users
+        if postgres:
+            # insert_task only takes HH:MM, so insert directly to keep sub-minute due times
+            async with dbHandler.get_pool().acquire() as conn:
+                row = await conn.fetchrow(
+                    "INSERT INTO tasks (action, task, duedate, duetime, userid) VALUES ('add', $1, $2, $3, $4) "
+                    "RETURNING userid, task, due_at",
+                    f"alert {i}", due_at.date(), due_at.time(), user_id
+                )
+        else:
+            row = backend.seed(user_id, f"alert {i}", due_at.date(), due_at.time())
+        due[row['userid'], row['task']] = row['due_at']
+
+    round_trips.clear()
+    scheduler = AlertScheduler(lambda tasks: main.send_task_alerts(app, tasks), lead_time=datetime.timedelta(0))
+    runner = asyncio.create_task(scheduler.run())
+    deadline = time.perf_counter() + args.alert_spread + 30
+    while len(bot.sent) < len(due) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    runner.cancel()
+    await asyncio.gather(runner, return_exceptions=True)
+
+    lags = []
+    for chat_id, text, sent_at in bot.sent:
+        task_name = text.split("📝 Task: ", 1)[1].split("\n", 1)[0]
+        due_at = due.get((chat_id, task_name))
+        if due_at is not None:
+            lags.append((sent_at - due_at).total_seconds())
+    p50, p95, p99 = percentiles(lags)
+    report("deadline alerts", [
+        ("alerts delivered", f"{len(bot.sent)}/{len(due)}"),
+        ("send lag p50/p95/p99 (ms)", f"{p50 * 1000:.1f} / {p95 * 1000:.1f} / {p99 * 1000:.1f}"),
+        ("DB round-trips", sum(round_trips.values())),
+    ])
+
+
+async def bench_reminders(args, round_trips):
+    bot = FakeBot(latency=args.send_latency)
+    app = FakeApp(bot)
+    app.bot_data['delivery'] = MessageDelivery(global_rate=args.delivery_rate)
+
+    # The wave slot in which every benchmark user reaches their local reminder hour
+    wave_start = datetime.datetime.combine(
+        local_today(), datetime.time(main.REMINDER_HOUR), tzinfo=ZoneInfo(dbHandler.DEFAULT_TIMEZONE)
+    )
+    round_trips.clear()
+    started = time.perf_counter()
+    sent, total = await main.send_reminder_wave(app, wave_start)
+    elapsed = time.perf_counter() - started
+    report("daily reminder wave", [
+        ("reminders sent", f"{sent}/{total}"),
+        ("wave completion (s)", f"{elapsed:.2f}"),
+        ("DB round-trips", sum(round_trips.values())),
+    ])
+
+
+async def run(args):
+    llm = ScriptedLLM(latency=args.llm_latency)
+    main.get_ai_response = llm.get_ai_response
+
+    if args.postgres:
+        await dbHandler.init_pool()
+        await main.run_migrations()
+        backend = dbHandler
+    else:
+        backend = InMemoryTaskStore(latency=args.db_latency)
+
+    round_trips = Counter()
+    users = [BENCH_USER_OFFSET + i for i in range(args.users)]
+    try:
+        await seed_tasks(backend, users, args.tasks, args.postgres)
+        install_backend(backend, round_trips)
+        print(f"Benchmark: {args.users} users x {args.tasks} tasks, "
+              f"LLM {args.llm_latency * 1000:.0f} ms, DB {'postgres' if args.postgres else f'{args.db_latency * 1000:.1f} ms'}")
+
+        await bench_echo(args, llm, round_trips)
+        await bench_reminders(args, round_trips)
+        await bench_alerts(args, backend, round_trips, args.postgres)
+        if args.metrics:
+            print("\n== metrics")
+            print(render_metrics())
+    finally:
+        if args.postgres:
+            async with dbHandler.get_pool().acquire() as conn:
+                await conn.execute('DELETE FROM tasks WHERE userid >= $1', BENCH_USER_OFFSET)
+                await conn.execute('DELETE FROM reminder_claims WHERE userid >= $1', BENCH_USER_OFFSET)
+                await conn.execute('DELETE FROM users WHERE userid >= $1', BENCH_USER_OFFSET)
+            await dbHandler.close_pool()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the todo bot hot paths")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--tasks', type=int, default=5, help="tasks per user")
+    parser.add_argument('--alerts', type=int, default=200, help="deadline alerts to fire")
+    parser.add_argument('--alert-spread', type=float, default=5.0, help="seconds the alerts are spread over")
+    parser.add_argument('--llm-latency', type=float, default=0.3, help="seconds per LLM call")
+    parser.add_argument('--db-latency', type=float, default=0.002, help="seconds per in-memory DB round-trip")
+    parser.add_argument('--send-latency', type=float, default=0.05, help="seconds per Telegram send")
+    parser.add_argument('--delivery-rate', type=float, default=1000.0, help="global sends/second for the delivery limiter")
+    parser.add_argument('--postgres', action='store_true', help="use the real database at DATABASE_URL")
+    parser.add_argument('--metrics', action='store_true', help="dump the collected metrics at the end")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,76 @@
+"""Cold-start benchmark: how long a fresh process takes to answer its first message.
+
+Each run starts a new interpreter that imports main, answers one fast-path
+message through the offline fakes, and then imports the LLM provider SDKs
+that the bot now loads lazily, so their cost is visible separately.
+
+    python -m bench.startup_benchmark --runs 10
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import time
+started = time.perf_counter()
+import json, asyncio, collections
+import main
+imported = time.perf_counter()
+
+from bench.fakes import FakeBot, FakeContext, FakeUpdate, FakeUser, InMemoryTaskStore
+from bench.run_benchmark import install_backend
+
+async def first_reply():
+    install_backend(InMemoryTaskStore(), collections.Counter())
+    update = FakeUpdate(FakeUser(1), "show my tasks")
+    await main.echo(update, FakeContext(FakeBot()))
+    return update.message.replies
+
+asyncio.run(first_reply())
+replied = time.perf_counter()
+
+import importlib, aiHandler
+for module in aiHandler.PROVIDER_MODULES:
+    importlib.import_module(module)
+providers = time.perf_counter()
+
+print(json.dumps({
+    "import_main": imported - started,
+    "first_reply": replied - started,
+    "provider_import": providers - replied,
+}))
+"""
+
+
+def run_child() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "AI_WARMUP": "0", "LOG_LEVEL": "WARNING"},
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for the todo bot")
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    samples = [run_child() for _ in range(args.runs)]
+    print(f"Startup benchmark: {args.runs} fresh processes")
+    for key in ("import_main", "first_reply", "provider_import"):
+        values = sorted(sample[key] for sample in samples)
+        p95 = values[min(int(len(values) * 0.95), len(values) - 1)]
+        print(f"  {key:<28} median {statistics.median(values) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import os
+import logging
+import json
+import asyncio
+import datetime
+from typing import Optional
+
+import asyncpg
+
+from dbHandler import DATABASE_URL, dispatch_task_event
+
+logger = logging.getLogger(__name__)
+
+# Channel the tasks_notify_change trigger (migration 0003) publishes on
+TASK_CHANGES_CHANNEL = 'task_changes'
+CHANGE_FEED_RECONNECT_DELAY = float(os.getenv('CHANGE_FEED_RECONNECT_DELAY', '5'))
+CHANGE_FEED_MAX_RECONNECT_DELAY = 60.0
+
+
+def _parse_payload(payload: str):
+    """Turn a NOTIFY payload into (event, task dict shaped like a tasks row)"""
+    data = json.loads(payload)
+    event = data.pop('op')
+    if data.get('duedate'):
+        data['duedate'] = datetime.date.fromisoformat(data['duedate'])
+    if data.get('duetime'):
+        data['duetime'] = datetime.time.fromisoformat(data['duetime'])
+    if data.get('due_at'):
+        data['due_at'] = datetime.datetime.fromisoformat(data['due_at'])
+    return event, data
+
+
+class TaskChangeFeed:
+    """Single dedicated LISTEN connection that fans task changes out to the
+    in-process task listeners registered with dbHandler.add_task_listener.
+
+    Changes made by other bot instances or by hand in SQL arrive the same way
+    as local writes. After a reconnect a 'resync' event is dispatched, since
+    notifications sent while disconnected are lost.
+    """
+
+    def __init__(self, dsn: Optional[str] = DATABASE_URL):
+        self.dsn = dsn
+        self.events_received = 0
+        self._conn: Optional[asyncpg.Connection] = None
+        self._lost = asyncio.Event()
+
+    def _on_notification(self, connection, pid, channel, payload):
+        try:
+            event, task = _parse_payload(payload)
+        except Exception as e:
+            logger.warning(f"Ignoring malformed task change payload: {e}")
+            return
+        self.events_received += 1
+        dispatch_task_event(event, task)
+
+    def _on_termination(self, connection):
+        self._lost.set()
+
+    async def _connect(self):
+        conn = await asyncpg.connect(self.dsn)
+        conn.add_termination_listener(self._on_termination)
+        await conn.add_listener(TASK_CHANGES_CHANNEL, self._on_notification)
+        self._conn = conn
+        self._lost.clear()
+        logger.info(f"Listening for task changes on '{TASK_CHANGES_CHANNEL}'")
+
+    async def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            try:
+                await conn.close()
+            except Exception as e:
+                logger.error(f"Error closing change feed connection: {e}")
+
+    async def run(self):
+        """Keep the LISTEN connection open, reconnecting with backoff"""
+        delay = CHANGE_FEED_RECONNECT_DELAY
+        first_connect = True
+        try:
+            while True:
+                try:
+                    await self._connect()
+                except Exception as e:
+                    logger.error(f"Change feed connection failed: {e}, retrying in {delay:.0f}s")
+                    first_connect = False
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, CHANGE_FEED_MAX_RECONNECT_DELAY)
+                    continue
+
+                delay = CHANGE_FEED_RECONNECT_DELAY
+                if not first_connect:
+                    dispatch_task_event('resync', None)
+                first_connect = False
+
+                await self._lost.wait()
+                logger.warning("Change feed connection lost, reconnecting...")
+                await self.close()
+        finally:
+            await self.close()
@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from dbHandler import acquire
+
+logger = logging.getLogger(__name__)
+
+# Where the pending done/delete selection lives between a user's messages:
+# "memory" (per process), "sqlite" (survives restarts) or "postgres" (shared by
+# every instance). The durable backends cost one round-trip per text message.
+CONVERSATION_STATE_BACKEND = os.environ.get("CONVERSATION_STATE_BACKEND", "memory")
+CONVERSATION_STATE_TTL = float(os.environ.get("CONVERSATION_STATE_TTL", "900"))
+CONVERSATION_STATE_MAX_USERS = int(os.environ.get("CONVERSATION_STATE_MAX_USERS", "10000"))
+CONVERSATION_STATE_DB = os.environ.get("CONVERSATION_STATE_DB", "conversation_state.db")
+# The Postgres store drops expired rows once every this many writes
+CONVERSATION_STATE_PURGE_EVERY = 1000
+
+
+def new_selection(action: str, ids, offset: int) -> dict:
+    """State for one selection page: the action, the task ids shown and when it was shown"""
+    return {'action': action, 'ids': list(ids), 'offset': offset, 'created_at': time.time()}
+
+
+class MemoryStateStore:
+    """Per-process LRU of conversation state with a TTL; at most max_users entries"""
+
+    def __init__(self, ttl: float = CONVERSATION_STATE_TTL, max_users: int = CONVERSATION_STATE_MAX_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+
+    async def get(self, user_id: int) -> Optional[dict]:
+        state = self._entries.get(user_id)
+        if state is None:
+            return None
+        if state['created_at'] + self.ttl < time.time():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return state
+
+    async def set(self, user_id: int, state: dict):
+        self._entries[user_id] = state
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+
+    async def clear(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+    def close(self):
+        self._entries.clear()
+
+
+class SqliteStateStore:
+    """On-disk conversation state so a pending selection survives a restart"""
+
+    def __init__(self, path: str = CONVERSATION_STATE_DB, ttl: float = CONVERSATION_STATE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS conversation_state (userid INTEGER PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            self._conn.execute('DELETE FROM conversation_state WHERE expires_at < ?', (time.time(),))
+            self._conn.commit()
+
+    def _get(self, user_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT state FROM conversation_state WHERE userid = ? AND expires_at >= ?', (user_id, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, user_id: int, state: dict):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO conversation_state (userid, state, expires_at) VALUES (?, ?, ?)',
+                (user_id, json.dumps(state), state['created_at'] + self.ttl)
+            )
+            self._conn.commit()
+
+    def _clear(self, user_id: int):
+        with self._lock:
+            self._conn.execute('DELETE FROM conversation_state WHERE userid = ?', (user_id,))
+            self._conn.commit()
+
+    async def get(self, user_id: int) -> Optional[dict]:
+        return await asyncio.to_thread(self._get, user_id)
+
+    async def set(self, user_id: int, state: dict):
+        await asyncio.to_thread(self._set, user_id, state)
+
+    async def clear(self, user_id: int):
+        await asyncio.to_thread(self._clear, user_id)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class PostgresStateStore:
+    """Conversation state in the conversation_state table, shared by every bot instance"""
+
+    def __init__(self, ttl: float = CONVERSATION_STATE_TTL):
+        self.ttl = ttl
+        self._writes = 0
+
+    async def get(self, user_id: int) -> Optional[dict]:
+        try:
+            async with acquire('get_conversation_state') as conn:
+                state = await conn.fetchval(
+                    'SELECT state FROM conversation_state WHERE userid = $1 AND expires_at >= now()', user_id
+                )
+            return json.loads(state) if state else None
+        except Exception as e:
+            logger.error(f"Failed to load conversation state for user {user_id}: {e}")
+            return None
+
+    async def set(self, user_id: int, state: dict):
+        self._writes += 1
+        try:
+            async with acquire('set_conversation_state') as conn:
+                await conn.execute(
+                    '''
+                    INSERT INTO conversation_state (userid, state, expires_at)
+                    VALUES ($1, $2::jsonb, now() + make_interval(secs => $3))
+                    ON CONFLICT (userid) DO UPDATE SET state = excluded.state, expires_at = excluded.expires_at
+                    ''',
+                    user_id,
+                    json.dumps(state),
+                    self.ttl
+                )
+                if self._writes % CONVERSATION_STATE_PURGE_EVERY == 0:
+                    await conn.execute('DELETE FROM conversation_state WHERE expires_at < now()')
+        except Exception as e:
+            logger.error(f"Failed to save conversation state for user {user_id}: {e}")
+
+    async def clear(self, user_id: int):
+        try:
+            async with acquire('clear_conversation_state') as conn:
+                await conn.execute('DELETE FROM conversation_state WHERE userid = $1', user_id)
+        except Exception as e:
+            logger.error(f"Failed to clear conversation state for user {user_id}: {e}")
+
+    def close(self):
+        pass
+
+
+STATE_STORES = {
+    "memory": MemoryStateStore,
+    "sqlite": SqliteStateStore,
+    "postgres": PostgresStateStore,
+}
+
+_state_store = None
+
+def get_state_store():
+    """Return the shared conversation-state store for CONVERSATION_STATE_BACKEND, creating it on first use"""
+    global _state_store
+    if _state_store is None:
+        if CONVERSATION_STATE_BACKEND not in STATE_STORES:
+            logger.warning(f"Unknown CONVERSATION_STATE_BACKEND {CONVERSATION_STATE_BACKEND!r}, using memory")
+        _state_store = STATE_STORES.get(CONVERSATION_STATE_BACKEND, MemoryStateStore)()
+    return _state_store
+
+def close_state_store():
+    """Close the shared conversation-state store"""
+    global _state_store
+    if _state_store is not None:
+        store, _state_store = _state_store, None
+        store.close()
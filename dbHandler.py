@@ -1,238 +1,905 @@
 import os
+import time
+import logging
+import asyncio
 import asyncpg
-from typing import Optional
+from typing import List, Optional
 import datetime
+from collections import OrderedDict
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from taskCache import UserTaskCache
+from recurrence import RecurrenceRule, expand_occurrences, occurrence_row
+from taskSearch import TASK_SEARCH_LIMIT, rank_tasks
+from metrics import DB_ERRORS, DB_POOL_WAIT, DB_QUERY_LATENCY
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 DATABASE_URL = os.getenv('DATABASE_URL')
 
+# Connection pool settings
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '2'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '100'))
+DB_MAX_INACTIVE_LIFETIME = float(os.getenv('DB_MAX_INACTIVE_LIFETIME', '300'))
+DB_COMMAND_TIMEOUT = float(os.getenv('DB_COMMAND_TIMEOUT', '10'))
+DB_HEALTH_CHECK_INTERVAL = float(os.getenv('DB_HEALTH_CHECK_INTERVAL', '60'))
+
+# Shared pool, created once by init_pool() at startup
+_pool: Optional[asyncpg.Pool] = None
+
+# Callbacks notified as (event, task) whenever a task is inserted, updated or
+# deleted, either by this process or (through changeFeed) by anyone else.
+# A 'resync' event with task None means events may have been missed.
+_task_listeners = []
+
+# Columns returned to task listeners
+TASK_EVENT_COLUMNS = 'id, task, note, userid, duedate, duetime, due_at, alerted, completed, timezone, recurrence'
+# Display order of open tasks (NULL dates/times last); matches tasks_open_by_user_order_idx
+OPEN_TASK_ORDER = "coalesce(duedate, 'infinity'::date), coalesce(duetime, '24:00'::time), id"
+# Rows per INSERT statement in insert_tasks
+INSERT_BATCH_SIZE = int(os.getenv('INSERT_BATCH_SIZE', '500'))
+
+# Sends of one deadline alert before it is given up on; see release_task_alerts
+ALERT_MAX_ATTEMPTS = int(os.getenv('ALERT_MAX_ATTEMPTS', '3'))
+
+# IANA timezone of users who haven't set one with /timezone
+DEFAULT_TIMEZONE = os.getenv('DEFAULT_TIMEZONE', 'UTC')
+# Users' timezones are cached in-process; another instance's change shows up after the TTL
+USER_TIMEZONE_CACHE_SIZE = int(os.getenv('USER_TIMEZONE_CACHE_SIZE', '10000'))
+USER_TIMEZONE_CACHE_TTL = float(os.getenv('USER_TIMEZONE_CACHE_TTL', '600'))
+# Timezone stored with new tasks, so duedate + duetime can be turned into due_at;
+# the insert statements pass the user id as $6 and DEFAULT_TIMEZONE as $7
+TASK_TIMEZONE = "coalesce((SELECT timezone FROM users WHERE userid = $6), $7)"
+
+def check_default_timezone():
+    """Fall back to UTC at startup if DEFAULT_TIMEZONE isn't an IANA name Python knows"""
+    global DEFAULT_TIMEZONE
+    try:
+        ZoneInfo(DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.error(f"DEFAULT_TIMEZONE {DEFAULT_TIMEZONE!r} is not an IANA timezone name, using UTC")
+        DEFAULT_TIMEZONE = 'UTC'
+
+async def init_pool():
+    """Create the shared connection pool used by every data-access function"""
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(
+            DATABASE_URL,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            max_inactive_connection_lifetime=DB_MAX_INACTIVE_LIFETIME,
+            command_timeout=DB_COMMAND_TIMEOUT,
+        )
+        logger.info(f"Database pool created (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})")
+    return _pool
+
+async def close_pool():
+    """Close the shared connection pool"""
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+        logger.info("Database pool closed")
+
+def get_pool() -> asyncpg.Pool:
+    """Return the shared connection pool"""
+    if _pool is None:
+        raise RuntimeError("Database pool is not initialized, call init_pool() first")
+    return _pool
+
+@asynccontextmanager
+async def acquire(query: str):
+    """Acquire a pooled connection, recording the pool wait and the time spent using it under `query`"""
+    started = time.perf_counter()
+    async with get_pool().acquire() as conn:
+        acquired = time.perf_counter()
+        DB_POOL_WAIT.observe(acquired - started)
+        try:
+            yield conn
+        except Exception:
+            DB_ERRORS.labels(query).inc()
+            raise
+        finally:
+            DB_QUERY_LATENCY.labels(query).observe(time.perf_counter() - acquired)
+
+async def check_pool_health() -> bool:
+    """Run a trivial query to check the pool can still reach the database"""
+    try:
+        async with get_pool().acquire() as conn:
+            await conn.fetchval('SELECT 1')
+        return True
+    except Exception as e:
+        logger.error(f"Database health check failed: {e}")
+        return False
+
+async def monitor_pool_health():
+    """Periodically health-check the pool and recycle connections when it fails"""
+    while True:
+        await asyncio.sleep(DB_HEALTH_CHECK_INTERVAL)
+        if not await check_pool_health() and _pool is not None:
+            # Drop stale connections so the next acquire reconnects
+            await _pool.expire_connections()
+
+def add_task_listener(callback):
+    """Register callback(event, task) for 'insert', 'update' and 'delete' task events"""
+    _task_listeners.append(callback)
+
+def remove_task_listener(callback):
+    """Unregister a callback added with add_task_listener"""
+    if callback in _task_listeners:
+        _task_listeners.remove(callback)
+
+def dispatch_task_event(event: str, task):
+    """Call every task listener; a listener error never breaks the write path.
+
+    Events are 'insert', 'update', 'delete', 'resync', and 'occurrence' for the
+    alert/completion state of one occurrence of a repeating task.
+    """
+    for callback in list(_task_listeners):
+        try:
+            callback(event, task)
+        except Exception as e:
+            logger.error(f"Task listener failed on {event}: {e}")
+
+# Per-user cache of open tasks, patched by the task events above
+task_cache: Optional[UserTaskCache] = None
+if os.getenv('TASK_CACHE_ENABLED', '1') == '1':
+    task_cache = UserTaskCache()
+    add_task_listener(task_cache.on_task_event)
+
 async def test_database():
     """Test database connection"""
-    connection_string = DATABASE_URL
     try:
-        pool = await asyncpg.create_pool(connection_string)
-        async with pool.acquire() as conn:
+        async with acquire('test_database') as conn:
             time = await conn.fetchval('SELECT NOW();')
             version = await conn.fetchval('SELECT version();')
-        await pool.close()
-        print('Current time:', time)
-        print('PostgreSQL version:', version)
+        logger.info(f'Current time: {time}')
+        logger.info(f'PostgreSQL version: {version}')
         return True
     except Exception as e:
-        print(f"Database connection failed: {e}")
+        logger.error(f"Database connection failed: {e}")
         return False
    
+def _parse_due(duedate: Optional[str], duetime: Optional[str]):
+    """Convert YYYY-MM-DD and HH:MM strings to date and time; a bad time is dropped, a bad date raises"""
+    parsed_date = None
+    if duedate:
+        parsed_date = datetime.datetime.strptime(duedate, "%Y-%m-%d").date()
+
+    parsed_time = None
+    if duetime:
+        try:
+            parsed_time = datetime.datetime.strptime(duetime, "%H:%M").time()
+        except ValueError:
+            logger.warning(f"Invalid time format: {duetime}, expected HH:MM")
+            parsed_time = None
+    return parsed_date, parsed_time
+
 async def insert_task(
     action: str,
     task: Optional[str],
     duedate: Optional[str],
     duetime: Optional[str],
     note: Optional[str],
-    userId: int
+    userId: int,
+    recurrence: Optional[str] = None
 ):  
-    connection_string = DATABASE_URL
-
     try:
-        pool = await asyncpg.create_pool(connection_string)
-        async with pool.acquire() as conn:
-            # Convert the duedate string (YYYY-MM-DD) to datetime.date
-            parsed_date = None
-            if duedate:
-                parsed_date = datetime.datetime.strptime(duedate, "%Y-%m-%d").date()
-
-            # Convert the duetime string (HH:MM) to datetime.time
-            parsed_time = None
-            if duetime:
-                try:
-                    parsed_time = datetime.datetime.strptime(duetime, "%H:%M").time()
-                except ValueError:
-                    print(f"Invalid time format: {duetime}, expected HH:MM")
-                    parsed_time = None
-
-        
-            await conn.execute(
-                '''
-                INSERT INTO tasks (action, task, duedate, duetime, note, userId)
-                VALUES ($1, $2, $3, $4, $5, $6)
+        async with acquire('insert_task') as conn:
+            parsed_date, parsed_time = _parse_due(duedate, duetime)
+            inserted = await conn.fetchrow(
+                f'''
+                INSERT INTO tasks (action, task, duedate, duetime, note, userId, timezone, recurrence)
+                VALUES ($1, $2, $3, $4, $5, $6, {TASK_TIMEZONE}, $8)
+                RETURNING {TASK_EVENT_COLUMNS}
                 ''',
                 action,
                 task,
                 parsed_date,
                 parsed_time,
                 note,
-                userId
+                userId,
+                DEFAULT_TIMEZONE,
+                recurrence
             )
-        await pool.close()
-        print("Task inserted successfully.")
+        logger.info("Task inserted successfully.")
+        dispatch_task_event('insert', inserted)
+        return inserted
     except Exception as e:
-        print(f"Insert failed: {e}")
+        logger.error(f"Insert failed: {e}")
+        return None
 
-async def get_upcoming_tasks():
-    """Get tasks that are due within the next 2 hours and haven't been alerted yet"""
-    connection_string = DATABASE_URL
+async def insert_tasks(records, userId: int):
+    """Insert many (action, task, duedate, duetime, note[, recurrence]) tuples for one user.
+
+    Rows are sent as arrays and unnested server-side, INSERT_BATCH_SIZE per
+    statement, all in one transaction: either every task is stored or none.
+    Returns the inserted rows, or None if the insert failed.
+    """
+    columns = ([], [], [], [], [], [])
+    for action, task, duedate, duetime, note, *recurrence in records:
+        try:
+            parsed_date, parsed_time = _parse_due(duedate, duetime)
+        except ValueError:
+            logger.warning(f"Invalid date format: {duedate}, expected YYYY-MM-DD")
+            # Only the date is dropped; a valid time is kept
+            parsed_date, parsed_time = _parse_due(None, duetime)
+        row = (action, task, parsed_date, parsed_time, note, recurrence[0] if recurrence else None)
+        for column, value in zip(columns, row):
+            column.append(value)
+    if not columns[0]:
+        return []
+
+    try:
+        inserted = []
+        async with acquire('insert_tasks') as conn:
+            async with conn.transaction():
+                for start in range(0, len(columns[0]), INSERT_BATCH_SIZE):
+                    batch = [column[start:start + INSERT_BATCH_SIZE] for column in columns]
+                    inserted.extend(await conn.fetch(
+                        f'''
+                        INSERT INTO tasks (action, task, duedate, duetime, note, userid, timezone, recurrence)
+                        SELECT action, task, duedate, duetime, note, $6, {TASK_TIMEZONE}, recurrence
+                        FROM unnest($1::text[], $2::text[], $3::date[], $4::time[], $5::text[], $8::text[])
+                            AS batch (action, task, duedate, duetime, note, recurrence)
+                        RETURNING {TASK_EVENT_COLUMNS}
+                        ''',
+                        *batch[:5],
+                        userId,
+                        DEFAULT_TIMEZONE,
+                        batch[5]
+                    ))
+        logger.info(f"Inserted {len(inserted)} tasks for user {userId}")
+        for row in inserted:
+            dispatch_task_event('insert', row)
+        return inserted
+    except Exception as e:
+        logger.error(f"Bulk insert of {len(columns[0])} tasks failed: {e}")
+        return None
+
+async def get_tasks_due_between(
+    start: datetime.datetime,
+    end: datetime.datetime,
+    shards: Optional[List[int]] = None,
+    shard_count: int = 1
+):
+    """Get incomplete, not-yet-alerted tasks due in the (start, end] window.
+
+    Repeating tasks contribute one row per pending occurrence in the window,
+    with `occurrence` set to its date. With shards, only tasks of users in
+    those shards (userid mod shard_count).
+    """
     try:
-        pool = await asyncpg.create_pool(connection_string)
-        async with pool.acquire() as conn:
-            # Get current time and 2 hours from now
-            now = datetime.datetime.now()
-            two_hours_later = now + datetime.timedelta(hours=2)
-            
-            # Query for tasks due within the next 2 hours that haven't been alerted
+        async with acquire('get_tasks_due_between') as conn:
             tasks = await conn.fetch(
-                '''
-                SELECT id, task, note, userid, duedate, duetime 
+                f'''
+                SELECT {TASK_EVENT_COLUMNS}
                 FROM tasks 
                 WHERE action = 'add' 
-                AND duedate IS NOT NULL 
+                AND due_at > $1
+                AND due_at <= $2
+                AND NOT alerted
+                AND NOT completed
+                AND recurrence IS NULL
+                AND ($3::int[] IS NULL OR mod(userid, $4::int) = ANY($3::int[]))
+                ''',
+                start,
+                end,
+                shards,
+                shard_count
+            )
+            # A series can only have occurrences in the window if it started before its end (plus a day for timezones)
+            series = await conn.fetch(
+                f'''
+                SELECT {TASK_EVENT_COLUMNS}
+                FROM tasks
+                WHERE action = 'add'
+                AND recurrence IS NOT NULL
+                AND NOT completed
                 AND duetime IS NOT NULL
-                AND (duedate::timestamp + duetime::time) BETWEEN $1 AND $2
-                AND (alerted IS NULL OR alerted = false)
+                AND duedate <= $1
+                AND ($2::int[] IS NULL OR mod(userid, $3::int) = ANY($2::int[]))
                 ''',
-                now,
-                two_hours_later
+                end.astimezone(datetime.timezone.utc).date() + datetime.timedelta(days=1),
+                shards,
+                shard_count
             )
+            occurrences = expand_occurrences(series, start, end)
+            if occurrences:
+                done = await _fetch_occurrence_states(conn, occurrences, 'alerted OR completed')
+                occurrences = [row for row in occurrences if (row['id'], row['occurrence']) not in done]
+        return list(tasks) + occurrences
+    except Exception as e:
+        logger.error(f"Failed to get tasks due between {start} and {end}: {e}")
+        return None
 
-            
+async def _fetch_occurrence_states(conn, occurrences, condition: str):
+    """(task id, date) of the given occurrences whose task_occurrences row matches condition"""
+    rows = await conn.fetch(
+        f'''
+        SELECT o.task_id, o.occurrence_date
+        FROM task_occurrences o
+        JOIN unnest($1::int[], $2::date[]) AS wanted (task_id, occurrence_date) USING (task_id, occurrence_date)
+        WHERE {condition}
+        ''',
+        [row['id'] for row in occurrences],
+        [row['occurrence'] for row in occurrences]
+    )
+    return {(row['task_id'], row['occurrence_date']) for row in rows}
 
+async def claim_task_alerts(task_ids):
+    """Atomically mark tasks as alerted and return only the ones this call claimed.
 
-        await pool.close()
-        return tasks
+    Alerts are sent after claiming, so a task another instance already claimed
+    is never sent twice; an alert whose send fails is released for another try
+    with release_task_alerts.
+    """
+    if not task_ids:
+        return []
+    try:
+        async with acquire('claim_task_alerts') as conn:
+            claimed = await conn.fetch(
+                f'''
+                UPDATE tasks SET alerted = true
+                WHERE id = ANY($1::int[]) AND NOT alerted AND NOT completed
+                RETURNING {TASK_EVENT_COLUMNS}
+                ''',
+                list(task_ids)
+            )
+        for task in claimed:
+            dispatch_task_event('update', task)
+        return claimed
+    except Exception as e:
+        logger.error(f"Failed to claim {len(task_ids)} task alerts: {e}")
+        return []
+
+async def claim_occurrence_alerts(occurrences):
+    """Atomically mark occurrences of repeating tasks as alerted; returns the ones this call claimed.
+
+    Works like claim_task_alerts, with the state kept in task_occurrences.
+    """
+    if not occurrences:
+        return []
+    try:
+        async with acquire('claim_occurrence_alerts') as conn:
+            async with conn.transaction():
+                # Past occurrences are never alerted again; keep a week and drop the rest
+                await conn.execute(
+                    'DELETE FROM task_occurrences WHERE occurrence_date < $1',
+                    min(row['occurrence'] for row in occurrences) - datetime.timedelta(days=7)
+                )
+                rows = await conn.fetch(
+                    '''
+                    INSERT INTO task_occurrences (task_id, occurrence_date, alerted)
+                    SELECT o.task_id, o.occurrence_date, true
+                    FROM unnest($1::int[], $2::date[]) AS o (task_id, occurrence_date)
+                    JOIN tasks t ON t.id = o.task_id AND NOT t.completed
+                    ON CONFLICT (task_id, occurrence_date) DO UPDATE SET alerted = true
+                    WHERE NOT task_occurrences.alerted AND NOT task_occurrences.completed
+                    RETURNING task_id, occurrence_date
+                    ''',
+                    [row['id'] for row in occurrences],
+                    [row['occurrence'] for row in occurrences]
+                )
+        claimed_keys = {(row['task_id'], row['occurrence_date']) for row in rows}
+        claimed = []
+        for occurrence in occurrences:
+            if (occurrence['id'], occurrence['occurrence']) in claimed_keys:
+                claimed.append(dict(occurrence, alerted=True))
+                dispatch_task_event('occurrence', claimed[-1])
+        return claimed
     except Exception as e:
-        print(f"Failed to get upcoming tasks: {e}")
+        logger.error(f"Failed to claim {len(occurrences)} occurrence alerts: {e}")
         return []
 
-async def mark_task_alerted(task_id: int):
-    """Mark a task as alerted to avoid duplicate notifications"""
-    connection_string = DATABASE_URL
+async def release_task_alerts(task_ids, max_attempts: int = ALERT_MAX_ATTEMPTS):
+    """Undo the claims of alerts whose send failed so they are sent again; returns the released tasks.
+
+    Each release counts as a failed attempt; an alert that has failed
+    `max_attempts` times stays claimed and is not retried again.
+    """
+    if not task_ids:
+        return []
     try:
-        pool = await asyncpg.create_pool(connection_string)
-        async with pool.acquire() as conn:
-            await conn.execute(
-                'UPDATE tasks SET alerted = true WHERE id = $1',
-                task_id
+        async with acquire('release_task_alerts') as conn:
+            released = await conn.fetch(
+                f'''
+                UPDATE tasks SET alerted = false, alert_attempts = alert_attempts + 1
+                WHERE id = ANY($1::int[]) AND alerted AND NOT completed AND alert_attempts + 1 < $2
+                RETURNING {TASK_EVENT_COLUMNS}
+                ''',
+                list(task_ids),
+                max_attempts
             )
-        await pool.close()
+        # The scheduler picks the released tasks up again from these events
+        for task in released:
+            dispatch_task_event('update', task)
+        return released
     except Exception as e:
-        print(f"Failed to mark task as alerted: {e}")
+        logger.error(f"Failed to release {len(task_ids)} task alerts: {e}")
+        return []
 
-async def get_tomorrow_tasks():
-    """Get tasks that are due tomorrow"""
-    connection_string = DATABASE_URL
+async def release_occurrence_alerts(occurrences, max_attempts: int = ALERT_MAX_ATTEMPTS):
+    """Undo the claims of occurrence alerts whose send failed, like release_task_alerts"""
+    if not occurrences:
+        return []
     try:
-        pool = await asyncpg.create_pool(connection_string)
-        async with pool.acquire() as conn:
-            # Get tomorrow's date
-            tomorrow = (datetime.datetime.now() + datetime.timedelta(days=1)).date()
-            print(f"Fetching tasks due tomorrow: {tomorrow}")
-            # Query for tasks due tomorrow
-            tasks = await conn.fetch(
+        async with acquire('release_occurrence_alerts') as conn:
+            rows = await conn.fetch(
                 '''
-                SELECT task, note, userid, duedate, duetime 
-                FROM tasks 
-                WHERE action = 'add' 
-                AND duedate = $1
-                ORDER BY duetime ASC
+                UPDATE task_occurrences o SET alerted = false, alert_attempts = o.alert_attempts + 1
+                FROM unnest($1::int[], $2::date[]) AS r (task_id, occurrence_date)
+                WHERE o.task_id = r.task_id AND o.occurrence_date = r.occurrence_date
+                AND o.alerted AND NOT o.completed AND o.alert_attempts + 1 < $3
+                RETURNING o.task_id, o.occurrence_date
                 ''',
-                tomorrow
+                [row['id'] for row in occurrences],
+                [row['occurrence'] for row in occurrences],
+                max_attempts
             )
+        released_keys = {(row['task_id'], row['occurrence_date']) for row in rows}
+        released = []
+        for occurrence in occurrences:
+            if (occurrence['id'], occurrence['occurrence']) in released_keys:
+                released.append(dict(occurrence, alerted=False))
+                dispatch_task_event('occurrence', released[-1])
+        return released
+    except Exception as e:
+        logger.error(f"Failed to release {len(occurrences)} occurrence alerts: {e}")
+        return []
 
+async def complete_occurrence(task, occurrence_date: datetime.date, userId: Optional[int] = None):
+    """Mark one occurrence of a repeating task as completed; with userId, only if that user owns it.
 
-        await pool.close()
-        return tasks
+    Returns the completed occurrence row, or False if the task was not found or the update failed.
+    """
+    try:
+        async with acquire('complete_occurrence') as conn:
+            updated = await conn.fetchval(
+                '''
+                INSERT INTO task_occurrences (task_id, occurrence_date, completed)
+                SELECT id, $2, true FROM tasks
+                WHERE id = $1 AND ($3::bigint IS NULL OR userid = $3)
+                ON CONFLICT (task_id, occurrence_date) DO UPDATE SET completed = true
+                RETURNING task_id
+                ''',
+                task['id'],
+                occurrence_date,
+                userId
+            )
+        if updated is None:
+            logger.warning(f"Task {task['id']} not found")
+            return False
+        logger.info(f"Task {task['id']} occurrence {occurrence_date} marked as completed")
+        completed = dict(occurrence_row(task, occurrence_date), completed=True)
+        dispatch_task_event('occurrence', completed)
+        return completed
     except Exception as e:
-        print(f"Failed to get tomorrow's tasks: {e}")
-        return []
-    
-async def get_all_tasks(userId):
-    """Get all upcoming tasks for a user"""
-    connection_string = DATABASE_URL
+        logger.error(f"Failed to complete occurrence {occurrence_date} of task {task['id']}: {e}")
+        return False
+
+async def fetch_completed_occurrences(task_ids, today: datetime.date):
+    """(task_id, occurrence_date) rows of the tasks' occurrences completed on or after `today`"""
+    async with acquire('fetch_completed_occurrences') as conn:
+        return await conn.fetch(
+            '''
+            SELECT task_id, occurrence_date FROM task_occurrences
+            WHERE task_id = ANY($1::int[]) AND occurrence_date >= $2 AND completed
+            ''',
+            list(task_ids),
+            today
+        )
+
+async def next_occurrences(tasks, today: datetime.date):
+    """Show repeating tasks as their next open occurrence on or after `today`.
+
+    One-off tasks pass through unchanged; series that have ended are dropped.
+    Only queries the database when there are repeating tasks.
+    """
+    series = [task for task in tasks if task['recurrence']]
+    if not series:
+        return list(tasks)
+    completed = {}
     try:
-        pool = await asyncpg.create_pool(connection_string)
-        async with pool.acquire() as conn:
+        rows = await fetch_completed_occurrences([task['id'] for task in series], today)
+        for row in rows:
+            completed.setdefault(row['task_id'], set()).add(row['occurrence_date'])
+    except Exception as e:
+        logger.error(f"Failed to load completed occurrences: {e}")
+
+    shown = []
+    for task in tasks:
+        rule = RecurrenceRule.parse(task['recurrence']) if task['recurrence'] else None
+        if rule is None or task['duedate'] is None:
+            shown.append(task)
+            continue
+        day = rule.next_on_or_after(task['duedate'], today, completed.get(task['id'], ()))
+        if day is not None:
+            shown.append(occurrence_row(task, day))
+    return shown
+
+# Tasks of the users whose local remind time ($3) falls in the [$1, $2) window,
+# z.local_start being the user's local time at $1; $5/$6 are the shard filter
+REMINDER_WINDOW_SQL = '''
+    FROM tasks t
+    LEFT JOIN users u ON u.userid = t.userid
+    CROSS JOIN LATERAL (
+        SELECT $1::timestamptz AT TIME ZONE coalesce(u.timezone, $4) AS local_start,
+               $2::timestamptz AT TIME ZONE coalesce(u.timezone, $4) AS local_end
+    ) z
+    WHERE t.action = 'add'
+    AND z.local_start::date + $3::time >= z.local_start
+    AND z.local_start::date + $3::time < z.local_end
+    AND ($5::int[] IS NULL OR mod(t.userid, $6::int) = ANY($5::int[]))
+'''
+
+async def get_reminder_wave_tasks(
+    start: datetime.datetime,
+    end: datetime.datetime,
+    remind_time: datetime.time,
+    shards: Optional[List[int]] = None,
+    shard_count: int = 1
+):
+    """Get tomorrow's tasks of the users whose local remind_time falls in the [start, end) window.
 
+    Each row carries local_date, the user's date at the reminder; repeating
+    tasks appear once if an open occurrence falls on the next day. With
+    shards, only users in those shards (userid mod shard_count).
+    """
+    window_args = (start, end, remind_time, DEFAULT_TIMEZONE, shards, shard_count)
+    try:
+        async with acquire('get_reminder_wave_tasks') as conn:
+            # Local dates are within a day of the UTC date; the range lets tasks_duedate_idx narrow the scan
+            utc_date = start.astimezone(datetime.timezone.utc).date()
             tasks = await conn.fetch(
-                '''
-                SELECT id, task, note, userid, duedate, duetime, alerted, completed
-                FROM tasks 
-                WHERE action = 'add' 
-                AND userid = $1
-                AND (completed IS NULL OR completed = false)
-                ORDER BY 
-                    CASE WHEN duedate IS NULL THEN 1 ELSE 0 END,
-                    duedate ASC, 
-                    CASE WHEN duetime IS NULL THEN 1 ELSE 0 END,
-                    duetime ASC
+                f'''
+                SELECT t.task, t.note, t.userid, t.duedate, t.duetime, z.local_start::date AS local_date
+                {REMINDER_WINDOW_SQL}
+                AND t.recurrence IS NULL
+                AND t.duedate BETWEEN $7 AND $8
+                AND t.duedate = z.local_start::date + 1
                 ''',
-                userId
+                *window_args,
+                utc_date,
+                utc_date + datetime.timedelta(days=2)
             )
+            series = await conn.fetch(
+                f'''
+                SELECT t.id, t.task, t.note, t.userid, t.duedate, t.duetime, t.recurrence, z.local_start::date AS local_date
+                {REMINDER_WINDOW_SQL}
+                AND t.recurrence IS NOT NULL
+                AND NOT t.completed
+                AND t.duedate <= z.local_start::date + 1
+                ''',
+                *window_args
+            )
+            occurrences = []
+            for task in series:
+                rule = RecurrenceRule.parse(task['recurrence'])
+                tomorrow = task['local_date'] + datetime.timedelta(days=1)
+                if rule is not None and rule.occurs_on(task['duedate'], tomorrow):
+                    occurrences.append(occurrence_row(task, tomorrow))
+            if occurrences:
+                done = await _fetch_occurrence_states(conn, occurrences, 'completed')
+                occurrences = [row for row in occurrences if (row['id'], row['occurrence']) not in done]
+        # Same order as before: by due time, tasks without one last
+        return sorted(
+            list(tasks) + occurrences,
+            key=lambda task: (task['duetime'] is None, task['duetime'] or datetime.time.min)
+        )
+    except Exception as e:
+        logger.error(f"Failed to get reminder tasks for {start} to {end}: {e}")
+        return []
 
-        await pool.close()
-        return tasks
+async def claim_reminders(user_ids, remind_dates: List[datetime.date]):
+    """Record that these users get their reminder for the matching remind_dates; returns the user ids claimed here.
+
+    Users already claimed by another instance (or an earlier wave) are left
+    out, so each user gets at most one reminder per local day.
+    """
+    if not user_ids:
+        return []
+    try:
+        async with acquire('claim_reminders') as conn:
+            async with conn.transaction():
+                # Only today's claims matter; keep a week of history and drop the rest
+                await conn.execute('DELETE FROM reminder_claims WHERE remind_date < $1', min(remind_dates) - datetime.timedelta(days=7))
+                rows = await conn.fetch(
+                    '''
+                    INSERT INTO reminder_claims (userid, remind_date)
+                    SELECT * FROM unnest($1::bigint[], $2::date[])
+                    ON CONFLICT DO NOTHING
+                    RETURNING userid
+                    ''',
+                    list(user_ids),
+                    list(remind_dates)
+                )
+        return [row['userid'] for row in rows]
     except Exception as e:
-        print(f"Failed to get all tasks for user {userId}: {e}")
+        logger.error(f"Failed to claim reminders for {len(user_ids)} users: {e}")
         return []
 
+# userId -> (expires at, timezone name), least recently used first
+_user_timezones: "OrderedDict[int, tuple]" = OrderedDict()
+
+async def fetch_user_timezone(userId) -> Optional[str]:
+    """Load a user's timezone from the database, bypassing the cache; None if never set"""
+    async with acquire('fetch_user_timezone') as conn:
+        return await conn.fetchval('SELECT timezone FROM users WHERE userid = $1', userId)
+
+def _cache_user_timezone(userId, timezone: str):
+    _user_timezones[userId] = (time.monotonic() + USER_TIMEZONE_CACHE_TTL, timezone)
+    _user_timezones.move_to_end(userId)
+    while len(_user_timezones) > USER_TIMEZONE_CACHE_SIZE:
+        _user_timezones.popitem(last=False)
+
+async def get_user_timezone(userId) -> str:
+    """Return a user's IANA timezone name, DEFAULT_TIMEZONE if they never set one"""
+    cached = _user_timezones.get(userId)
+    if cached is not None and cached[0] > time.monotonic():
+        _user_timezones.move_to_end(userId)
+        return cached[1]
+    try:
+        timezone = await fetch_user_timezone(userId) or DEFAULT_TIMEZONE
+    except Exception as e:
+        logger.error(f"Failed to get timezone for user {userId}: {e}")
+        return cached[1] if cached is not None else DEFAULT_TIMEZONE
+    _cache_user_timezone(userId, timezone)
+    return timezone
+
+async def set_user_timezone(userId, timezone: str) -> bool:
+    """Store a user's timezone and move their open tasks to it, keeping the same wall-clock times.
 
-async def update_task_completion(task_id: int, completed: bool = True):
-    """Mark a task as completed or incomplete"""
-    connection_string = DATABASE_URL
+    Returns False if Postgres doesn't know the timezone or the update failed.
+    """
     try:
-        pool = await asyncpg.create_pool(connection_string)
-        async with pool.acquire() as conn:
-            await conn.execute(
-                'UPDATE tasks SET completed = $1 WHERE id = $2',
+        async with acquire('set_user_timezone') as conn:
+            async with conn.transaction():
+                # Raises for names missing from the server's timezone database
+                await conn.execute('SELECT now() AT TIME ZONE $1', timezone)
+                await conn.execute(
+                    '''
+                    INSERT INTO users (userid, timezone) VALUES ($1, $2)
+                    ON CONFLICT (userid) DO UPDATE SET timezone = excluded.timezone, updated_at = now()
+                    ''',
+                    userId,
+                    timezone
+                )
+                moved = await conn.fetch(
+                    f'''
+                    UPDATE tasks SET timezone = $2
+                    WHERE userid = $1 AND NOT completed AND timezone <> $2
+                    RETURNING {TASK_EVENT_COLUMNS}
+                    ''',
+                    userId,
+                    timezone
+                )
+        _cache_user_timezone(userId, timezone)
+        logger.info(f"User {userId} timezone set to {timezone} ({len(moved)} open tasks moved)")
+        for task in moved:
+            dispatch_task_event('update', task)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to set timezone {timezone!r} for user {userId}: {e}")
+        return False
+
+async def fetch_open_tasks(userId):
+    """Load a user's open tasks from the database, bypassing the cache"""
+    async with acquire('fetch_open_tasks') as conn:
+        return await conn.fetch(
+            f'''
+            SELECT {TASK_EVENT_COLUMNS}
+            FROM tasks 
+            WHERE action = 'add' 
+            AND userid = $1
+            AND NOT completed
+            ORDER BY {OPEN_TASK_ORDER}
+            ''',
+            userId
+        )
+
+async def get_open_tasks(userId):
+    """Get a user's open tasks, served from the per-user cache when possible"""
+    if task_cache is not None:
+        cached = task_cache.get(userId)
+        if cached is not None:
+            return cached
+        version = task_cache.version(userId)
+        return task_cache.put(userId, await fetch_open_tasks(userId), version)
+    return await fetch_open_tasks(userId)
+
+async def fetch_open_tasks_page(userId, after_id: Optional[int], limit: int):
+    """Load up to `limit` open tasks after the task `after_id` from the database"""
+    async with acquire('fetch_open_tasks_page') as conn:
+        return await conn.fetch(
+            f'''
+            SELECT {TASK_EVENT_COLUMNS}
+            FROM tasks 
+            WHERE action = 'add' 
+            AND userid = $1
+            AND NOT completed
+            AND ($2::int IS NULL OR ({OPEN_TASK_ORDER}) > (
+                SELECT {OPEN_TASK_ORDER} FROM tasks WHERE id = $2
+            ))
+            ORDER BY {OPEN_TASK_ORDER}
+            LIMIT $3
+            ''',
+            userId,
+            after_id,
+            limit
+        )
+
+async def get_user_tasks_page(userId, after_id: Optional[int] = None, limit: int = 8):
+    """Get one page of a user's open tasks after the task `after_id` (keyset pagination).
+
+    Returns (tasks, has_more). If the cursor task no longer exists the page is empty.
+    """
+    try:
+        if task_cache is not None:
+            cached = task_cache.get(userId)
+            if cached is not None:
+                start = 0
+                if after_id is not None:
+                    ids = [task['id'] for task in cached]
+                    if after_id not in ids:
+                        return [], False
+                    start = ids.index(after_id) + 1
+                return cached[start:start + limit], len(cached) > start + limit
+
+        # One extra row tells us whether there is a next page
+        tasks = await fetch_open_tasks_page(userId, after_id, limit + 1)
+        return tasks[:limit], len(tasks) > limit
+    except Exception as e:
+        logger.error(f"Failed to get task page for user {userId}: {e}")
+        return [], False
+
+# Cleared when pg_trgm turns out to be missing; search then ranks all open tasks in process
+_trigram_search = True
+
+async def fetch_task_candidates(userId, query: str, limit: int):
+    """Open tasks whose names are trigram-similar to `query`, most similar first"""
+    async with acquire('fetch_task_candidates') as conn:
+        return await conn.fetch(
+            f'''
+            SELECT {TASK_EVENT_COLUMNS}
+            FROM tasks
+            WHERE action = 'add'
+            AND userid = $1
+            AND NOT completed
+            AND (lower($2) <% lower(task) OR lower(task) % lower($2))
+            ORDER BY greatest(word_similarity(lower($2), lower(task)), similarity(lower(task), lower($2))) DESC
+            LIMIT $3
+            ''',
+            userId,
+            query,
+            limit
+        )
+
+async def search_open_tasks(userId, query: str, limit: int = TASK_SEARCH_LIMIT):
+    """Rank a user's open tasks by how well their names match `query`; returns (score, task) pairs.
+
+    Cached tasks are ranked in process without a round-trip. Otherwise the
+    trigram index narrows the candidates and the same scorer ranks them.
+    """
+    global _trigram_search
+    try:
+        tasks = task_cache.get(userId) if task_cache is not None else None
+        if tasks is None and _trigram_search:
+            try:
+                tasks = await fetch_task_candidates(userId, query, limit * 4)
+            except asyncpg.UndefinedFunctionError as e:
+                logger.warning(f"pg_trgm is not installed, searching tasks in process: {e}")
+                _trigram_search = False
+        if tasks is None:
+            tasks = await get_open_tasks(userId)
+        return rank_tasks(tasks, query, limit)
+    except Exception as e:
+        logger.error(f"Failed to search tasks for user {userId}: {e}")
+        return []
+
+def _display_order(task):
+    # OPEN_TASK_ORDER for rows and occurrences alike
+    return (
+        task['duedate'] is None, task['duedate'] or datetime.date.min,
+        task['duetime'] is None, task['duetime'] or datetime.time.min,
+        task['id'],
+    )
+
+async def get_all_tasks(userId, today: Optional[datetime.date] = None):
+    """Get all upcoming tasks for a user; with today, repeating tasks show their next open occurrence"""
+    try:
+        tasks = await get_open_tasks(userId)
+        if today is None:
+            return tasks
+        return sorted(await next_occurrences(tasks, today), key=_display_order)
+    except Exception as e:
+        logger.error(f"Failed to get all tasks for user {userId}: {e}")
+        return []
+
+
+async def update_task_completion(task_id: int, completed: bool = True, userId: Optional[int] = None):
+    """Mark a task as completed or incomplete; with userId, only if that user owns it.
+
+    Returns the updated task row, or False if it was not found or the update failed.
+    """
+    try:
+        async with acquire('update_task_completion') as conn:
+            updated = await conn.fetchrow(
+                f'''
+                UPDATE tasks SET completed = $1, completed_at = CASE WHEN $1 THEN now() END
+                WHERE id = $2 AND ($3::bigint IS NULL OR userid = $3)
+                RETURNING {TASK_EVENT_COLUMNS}
+                ''',
                 completed,
-                task_id
+                task_id,
+                userId
             )
-        await pool.close()
-        print(f"Task {task_id} marked as {'completed' if completed else 'incomplete'}")
-        return True
+        if not updated:
+            logger.warning(f"Task {task_id} not found")
+            return False
+        logger.info(f"Task {task_id} marked as {'completed' if completed else 'incomplete'}")
+        dispatch_task_event('update', updated)
+        return updated
     except Exception as e:
-        print(f"Failed to update task completion: {e}")
+        logger.error(f"Failed to update task completion: {e}")
         return False
 
-async def get_user_tasks_for_selection(userId):
-    """Get incomplete tasks for a user to allow selection"""
-    connection_string = DATABASE_URL
+async def get_task_history(userId, limit: int = 20):
+    """A user's most recently finished tasks: completed ones still in the tasks table, then the archive.
+
+    Archived rows that were never completed expired past their due date.
+    """
     try:
-        pool = await asyncpg.create_pool(connection_string)
-        async with pool.acquire() as conn:
-            tasks = await conn.fetch(
+        async with acquire('get_task_history') as conn:
+            return await conn.fetch(
                 '''
-                SELECT id, task, duedate, duetime
-                FROM tasks 
-                WHERE action = 'add' 
-                AND userid = $1
-                AND (completed IS NULL OR completed = false)
-                ORDER BY 
-                    CASE WHEN duedate IS NULL THEN 1 ELSE 0 END,
-                    duedate ASC, 
-                    CASE WHEN duetime IS NULL THEN 1 ELSE 0 END,
-                    duetime ASC
+                SELECT task, duedate, duetime, completed, finished_at FROM (
+                    SELECT task, duedate, duetime, completed, completed_at AS finished_at
+                    FROM tasks
+                    WHERE userid = $1 AND completed AND action = 'add'
+                    UNION ALL
+                    SELECT task, duedate, duetime, completed, coalesce(completed_at, archived_at)
+                    FROM tasks_archive
+                    WHERE userid = $1 AND action = 'add'
+                ) history
+                ORDER BY finished_at DESC NULLS LAST
+                LIMIT $2
                 ''',
-                userId
+                userId,
+                limit
             )
-        await pool.close()
-        return tasks
     except Exception as e:
-        print(f"Failed to get tasks for selection: {e}")
+        logger.error(f"Failed to get task history for user {userId}: {e}")
         return []
-    
-async def delete_task(task_id: int):
-    """Delete a task"""
-    connection_string = DATABASE_URL
-    try:
-        pool = await asyncpg.create_pool(connection_string)
-        async with pool.acquire() as conn:
-            await conn.execute(
-                'DELETE FROM tasks WHERE id = $1',
-                task_id
+
+async def delete_task(task_id: int, userId: Optional[int] = None):
+    """Delete a task; with userId, only if that user owns it.
+
+    Returns the deleted task row, or False if it was not found or the delete failed.
+    """
+    try:
+        async with acquire('delete_task') as conn:
+            deleted = await conn.fetchrow(
+                f'''
+                DELETE FROM tasks
+                WHERE id = $1 AND ($2::bigint IS NULL OR userid = $2)
+                RETURNING {TASK_EVENT_COLUMNS}
+                ''',
+                task_id,
+                userId
             )
-        await pool.close()
-        print(f"Task {task_id} deleted successfully")
-        return True
+        if not deleted:
+            logger.warning(f"Task {task_id} not found")
+            return False
+        logger.info(f"Task {task_id} deleted successfully")
+        dispatch_task_event('delete', deleted)
+        return deleted
     except Exception as e:
-        print(f"Failed to delete task: {e}")
+        logger.error(f"Failed to delete task: {e}")
         return False
\ No newline at end of file
@@ -0,0 +1,79 @@
+import os
+import logging
+import re
+import asyncio
+from typing import List, Tuple
+
+from dbHandler import get_pool, init_pool, close_pool
+from logConfig import setup_logging, stop_logging
+
+logger = logging.getLogger(__name__)
+
+# Versioned SQL migrations live in migrations/NNNN_description.sql and are
+# applied in order, each in its own transaction
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_FILE_PATTERN = re.compile(r'^(\d+)_(\w+)\.sql$')
+# Advisory lock key so concurrent bot instances don't migrate at the same time
+MIGRATION_LOCK_KEY = 727001
+
+def load_migrations() -> List[Tuple[int, str, str]]:
+    """Return (version, name, sql) for every migration file, sorted by version"""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = MIGRATION_FILE_PATTERN.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, filename), encoding='utf-8') as f:
+            migrations.append((int(match.group(1)), match.group(2), f.read()))
+    migrations.sort()
+    return migrations
+
+async def run_migrations() -> int:
+    """Apply pending migrations and return how many were applied"""
+    applied_count = 0
+    async with get_pool().acquire() as conn:
+        await conn.execute('SELECT pg_advisory_lock($1)', MIGRATION_LOCK_KEY)
+        try:
+            await conn.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+                '''
+            )
+            applied = {row['version'] for row in await conn.fetch('SELECT version FROM schema_migrations')}
+
+            for version, name, sql in load_migrations():
+                if version in applied:
+                    continue
+                logger.info(f"Applying migration {version:04d}_{name}...")
+                async with conn.transaction():
+                    await conn.execute(sql)
+                    await conn.execute(
+                        'INSERT INTO schema_migrations (version, name) VALUES ($1, $2)',
+                        version,
+                        name
+                    )
+                applied_count += 1
+        finally:
+            await conn.execute('SELECT pg_advisory_unlock($1)', MIGRATION_LOCK_KEY)
+
+    if applied_count:
+        # Cached statements may reference the old table layout
+        await get_pool().expire_connections()
+    logger.info(f"Database schema up to date ({applied_count} migrations applied)")
+    return applied_count
+
+async def _main():
+    setup_logging()
+    await init_pool()
+    try:
+        await run_migrations()
+    finally:
+        await close_pool()
+        stop_logging()
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,203 @@
+import re
+import datetime
+from typing import Optional, Tuple
+
+from recurrence import RECURRENCE_PATTERN, RecurrenceRule, first_occurrence, rule_from_match
+
+# Rule-based parser for the common, unambiguous commands. It returns the same
+# tuple as aiHandler.parse_ai_response (plus the recurrence rule for adds), or
+# None when the message should go to the LLM instead.
+
+ParsedIntent = Tuple[Optional[str], ...]
+
+LIST_PATTERN = re.compile(
+    r"^(?:please\s+)?(?:(?:show|list|view|see|display|get|give)(?:\s+me)?(?:\s+all)?(?:\s+of)?(?:\s+my)?"
+    r"(?:\s+(?:tasks?|todos?|to-dos?|to\s+dos?|list))?|(?:what\s+are\s+)?(?:all\s+)?my\s+(?:tasks?|todos?|to-dos?))"
+    r"(?:\s+please)?$"
+)
+UPDATE_PATTERN = re.compile(
+    r"^(?:please\s+)?(?:mark(?:\s+(?!as\b)(?P<task1>.+?))?(?:\s+as)?\s+(?:done|complete|completed|finished)"
+    r"|(?:complete|finish)(?:\s+(?:a\s+|my\s+)?task)?(?:\s+(?P<task2>.+?))?"
+    r"|done)(?:\s+please)?$"
+)
+DELETE_PATTERN = re.compile(
+    r"^(?:please\s+)?(?:delete|remove)(?:\s+(?:a\s+|my\s+|the\s+)?task)?(?:\s+(?P<task>.+?))?(?:\s+please)?$"
+)
+ADD_PATTERN = re.compile(
+    r"^(?:please\s+)?(?:add(?:\s+(?:a\s+)?(?:new\s+)?task)?(?:\s+to)?|remind\s+me\s+to|new\s+task|create(?:\s+a)?\s+task)\s+(?P<rest>.+)$"
+)
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+DAY_PATTERN = re.compile(
+    r"\b(?:(?P<today>today|tonight)|(?P<tomorrow>tomorrow)"
+    r"|(?:on\s+)?(?P<next>next\s+)?(?P<weekday>" + "|".join(WEEKDAYS) + r")"
+    r"|(?:on\s+)?(?P<iso>\d{4}-\d{2}-\d{2}))\b"
+)
+TIME_PATTERN = re.compile(
+    r"\b(?:at\s+)?(?:(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<ampm>am|pm)"
+    r"|(?P<hour24>[01]?\d|2[0-3]):(?P<minute24>\d{2}))\b"
+    r"|\b(?:in\s+the\s+)?(?P<period>morning|afternoon|evening|noon|midnight)\b"
+)
+# Words that mean the remaining text still carries date information we don't
+# understand ("next week", "on the 5th", "every day"), so the LLM should decide
+AMBIGUOUS_PATTERN = re.compile(
+    r"\b(?:next|week|weeks|month|months|year|every|daily|weekly|monthly|in\s+\d+|by|until|before|after)\b|\d"
+)
+PERIOD_TIMES = {
+    "morning": "09:00",
+    "noon": "12:00",
+    "afternoon": "14:00",
+    "evening": "18:00",
+    "midnight": "00:00",
+}
+# Deadline words in the name of a task being completed ("finish the report by
+# friday") mean the user is adding a task, not completing one
+DEADLINE_PATTERN = re.compile(r"\b(?:by|until|before|due)\b")
+GENERIC_TASK_WORDS = {"task", "tasks", "a task", "my task", "the task", "it", "one", "something"}
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, trim and collapse whitespace/trailing punctuation"""
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip(" .!?")
+
+
+def extract_date(text: str, now: datetime.datetime) -> Tuple[Optional[str], str]:
+    """Pull a date phrase out of text, returning (YYYY-MM-DD or None, remaining text)"""
+    match = DAY_PATTERN.search(text)
+    if not match:
+        return None, text
+
+    today = now.date()
+    if match.group("today"):
+        date = today
+    elif match.group("tomorrow"):
+        date = today + datetime.timedelta(days=1)
+    elif match.group("weekday"):
+        days_ahead = (WEEKDAYS.index(match.group("weekday")) - today.weekday()) % 7
+        if days_ahead == 0 or match.group("next"):
+            days_ahead += 7
+        date = today + datetime.timedelta(days=days_ahead)
+    else:
+        try:
+            date = datetime.date.fromisoformat(match.group("iso"))
+        except ValueError:
+            return None, text
+
+    remaining = text[:match.start()] + text[match.end():]
+    if match.group("today") == "tonight" and not TIME_PATTERN.search(remaining):
+        remaining += " evening"
+    return date.strftime("%Y-%m-%d"), remaining
+
+
+def extract_time(text: str) -> Tuple[Optional[str], str]:
+    """Pull a time phrase out of text, returning (HH:MM or None, remaining text)"""
+    match = TIME_PATTERN.search(text)
+    if not match:
+        return None, text
+
+    if match.group("period"):
+        time = PERIOD_TIMES[match.group("period")]
+    elif match.group("hour24"):
+        time = f"{int(match.group('hour24')):02d}:{match.group('minute24')}"
+    else:
+        hour = int(match.group("hour"))
+        minute = int(match.group("minute") or 0)
+        if not 1 <= hour <= 12 or minute > 59:
+            return None, text
+        hour = hour % 12 + (12 if match.group("ampm") == "pm" else 0)
+        time = f"{hour:02d}:{minute:02d}"
+
+    return time, text[:match.start()] + text[match.end():]
+
+
+def extract_recurrence(text: str) -> Tuple[Optional[str], str]:
+    """Pull a repeat phrase ("every monday", "daily") out of text, returning (rule or None, remaining text)"""
+    match = RECURRENCE_PATTERN.search(text)
+    if not match:
+        return None, text
+    return str(rule_from_match(match)), text[:match.start()] + text[match.end():]
+
+
+def _clean_task(text: Optional[str]) -> Optional[str]:
+    if not text:
+        return None
+    text = re.sub(r"\s+", " ", text).strip(" ,.-")
+    text = re.sub(r"\s+(?:at|on|for)$", "", text)
+    text = re.sub(r"^(?:the|my|a|an)\s+", "", text)
+    text = re.sub(r"\s+task$", "", text)
+    if text in GENERIC_TASK_WORDS:
+        return None
+    return text or None
+
+
+def parse_intent(text: str, now: Optional[datetime.datetime] = None) -> Optional[ParsedIntent]:
+    """Parse simple list/update/delete/add commands without the LLM, or return None"""
+    if not text:
+        return None
+    normalized = normalize_text(text)
+
+    if LIST_PATTERN.match(normalized):
+        return "list", None, None, None, None
+
+    match = UPDATE_PATTERN.match(normalized)
+    if match:
+        task = _clean_task(match.group("task1") or match.group("task2"))
+        if task and (DEADLINE_PATTERN.search(task) or DAY_PATTERN.search(task) or TIME_PATTERN.search(task)):
+            return None
+        return "update", task, None, None, None
+
+    match = DELETE_PATTERN.match(normalized)
+    if match:
+        return "delete", _clean_task(match.group("task")), None, None, None
+
+    match = ADD_PATTERN.match(normalized)
+    if match:
+        return _parse_add(match.group("rest"), text, now or datetime.datetime.now(), strict=True)
+
+    return None
+
+
+def _parse_add(rest: str, text: str, now: datetime.datetime, strict: bool) -> Optional[ParsedIntent]:
+    recurrence, rest = extract_recurrence(rest)
+    duedate, rest = extract_date(rest, now)
+    duetime, rest = extract_time(rest)
+    # In strict mode leftover date-like words send the message to the LLM instead
+    if strict and AMBIGUOUS_PATTERN.search(rest):
+        return None
+    task = _clean_task(rest)
+    if not task:
+        return None
+    # Keep the user's original casing for the task name when possible
+    original = re.search(re.escape(task), text, re.IGNORECASE)
+    if original:
+        task = original.group(0)
+    if recurrence:
+        # A repeating task's due date is its first occurrence
+        duedate = first_occurrence(recurrence, duedate, duetime, now)
+    return "add", task, duedate, duetime, None, recurrence
+
+
+def parse_task_line(text: str, now: Optional[datetime.datetime] = None) -> Optional[ParsedIntent]:
+    """Parse one "task [date] [time]" line of an import list as an add intent.
+
+    Unlike parse_intent, words the parser doesn't understand stay in the task name.
+    """
+    if not text:
+        return None
+    return _parse_add(normalize_text(text), text, now or datetime.datetime.now(), strict=False)
+
+
+def format_intent_reply(action, task, duedate, duetime, note, recurrence=None) -> str:
+    """Render a parsed intent in the same summary format the LLM uses"""
+    reply = (
+        f"👨‍💻 Action: {action}\n"
+        f"📝 Task: {task or 'null'}\n"
+        f"🗓️ Due date: {duedate or 'null'}\n"
+        f"⏱️ Time: {duetime or 'null'}\n"
+        f"🗒️ Note: {note or 'null'}"
+    )
+    rule = RecurrenceRule.parse(recurrence)
+    if rule is not None:
+        reply += f"\n🔁 Repeat: {rule.describe()}"
+    return reply
@@ -0,0 +1,167 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+from metrics import LLM_ADMISSION
+
+logger = logging.getLogger(__name__)
+
+# Token buckets in front of the LLM providers. Each user may start
+# LLM_USER_RATE calls per minute (bursts of LLM_USER_BURST); everyone together
+# LLM_GLOBAL_RATE per second (bursts of LLM_GLOBAL_BURST). A rate of 0 turns
+# that limit off.
+LLM_USER_RATE = float(os.environ.get("LLM_USER_RATE", "10"))
+LLM_USER_BURST = float(os.environ.get("LLM_USER_BURST", "5"))
+LLM_GLOBAL_RATE = float(os.environ.get("LLM_GLOBAL_RATE", "5"))
+LLM_GLOBAL_BURST = float(os.environ.get("LLM_GLOBAL_BURST", "20"))
+# Requests over the global rate wait in line for a token; when this many are
+# already waiting, or the wait would pass LLM_QUEUE_TIMEOUT, they are turned away
+LLM_QUEUE_SIZE = int(os.environ.get("LLM_QUEUE_SIZE", "100"))
+LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", "5"))
+LLM_ADMISSION_MAX_USERS = int(os.environ.get("LLM_ADMISSION_MAX_USERS", "10000"))
+
+
+class LLMBusy(Exception):
+    """Raised when a request is not admitted to the LLM; the user should try again shortly"""
+
+
+class TokenBucket:
+    """Holds up to `burst` tokens, refilled at `rate` tokens per second"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> bool:
+        """Take one token if there is one"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def give_back(self):
+        """Return a token taken for a request that was then turned away elsewhere"""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+    def wait_time(self) -> float:
+        """Seconds until the next token is available"""
+        self._refill()
+        return max(1 - self.tokens, 0) / self.rate
+
+
+class AdmissionController:
+    """Per-user and global token-bucket admission with a bounded FIFO wait queue.
+
+    A user over their own rate is turned away at once: waiting would only let
+    one user's burst fill the queue. Requests over the global rate queue in
+    arrival order until a token frees up.
+    """
+
+    def __init__(
+        self,
+        user_rate: float = LLM_USER_RATE / 60,
+        user_burst: float = LLM_USER_BURST,
+        global_rate: float = LLM_GLOBAL_RATE,
+        global_burst: float = LLM_GLOBAL_BURST,
+        queue_size: int = LLM_QUEUE_SIZE,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT,
+        max_users: int = LLM_ADMISSION_MAX_USERS,
+    ):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.max_users = max_users
+        self._global = TokenBucket(global_rate, global_burst) if global_rate > 0 else None
+        self._users: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+        # asyncio.Lock wakes waiters in arrival order, so the queue is FIFO
+        self._queue_lock = asyncio.Lock()
+        self.waiting = 0
+
+    def _user_bucket(self, user_id: Hashable) -> TokenBucket:
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            bucket = self._users[user_id] = TokenBucket(self.user_rate, self.user_burst)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user_id)
+        return bucket
+
+    async def _wait_for_global(self):
+        async with self._queue_lock:
+            while not self._global.take():
+                await asyncio.sleep(self._global.wait_time())
+
+    async def admit(self, user_id: Optional[Hashable] = None) -> str:
+        """Admit one LLM call; returns the admission result, raises LLMBusy if turned away"""
+        user_bucket = None
+        if user_id is not None and self.user_rate > 0:
+            user_bucket = self._user_bucket(user_id)
+            if not user_bucket.take():
+                LLM_ADMISSION.labels("user_limited").inc()
+                raise LLMBusy(f"user {user_id} is over the LLM rate limit")
+
+        if self._global is None or (not self._queue_lock.locked() and self._global.take()):
+            LLM_ADMISSION.labels("admitted").inc()
+            return "admitted"
+
+        if self.waiting >= self.queue_size:
+            result = "queue_full"
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._wait_for_global(), self.queue_timeout)
+                LLM_ADMISSION.labels("queued").inc()
+                return "queued"
+            except asyncio.TimeoutError:
+                result = "queue_timeout"
+            finally:
+                self.waiting -= 1
+
+        if user_bucket is not None:
+            user_bucket.give_back()
+        LLM_ADMISSION.labels(result).inc()
+        raise LLMBusy(f"LLM admission {result.replace('_', ' ')}")
+
+
+class SingleFlight:
+    """Merges concurrent calls with the same key into one: the first caller
+    runs it, later callers await the same result until it finishes.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    def joinable(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable]):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            LLM_ADMISSION.labels("coalesced").inc()
+        # One caller giving up (e.g. its handler was cancelled) must not cancel the others
+        return await asyncio.shield(task)
@@ -0,0 +1,235 @@
+import os
+import logging
+import time
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, List, Optional
+
+from metrics import LLM_HEDGES, LLM_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Hedge delay is the primary's recent p95 latency, clamped to these bounds
+LLM_HEDGE_MIN_DELAY = float(os.environ.get("LLM_HEDGE_MIN_DELAY", "0.5"))
+LLM_HEDGE_MAX_DELAY = float(os.environ.get("LLM_HEDGE_MAX_DELAY", "5"))
+# Delay used until a provider has enough latency samples
+LLM_HEDGE_DEFAULT_DELAY = float(os.environ.get("LLM_HEDGE_DEFAULT_DELAY", "2"))
+LLM_LATENCY_WINDOW = int(os.environ.get("LLM_LATENCY_WINDOW", "200"))
+LLM_LATENCY_MIN_SAMPLES = 20
+# Consecutive failures that open a provider's circuit, and how long it stays open
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.environ.get("LLM_BREAKER_RESET", "30"))
+
+
+class ProviderUnavailable(Exception):
+    """Raised when a provider's circuit is open"""
+
+
+class LatencyTracker:
+    """Sliding window of recent successful call latencies"""
+
+    def __init__(self, window: int = LLM_LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if len(self._samples) < LLM_LATENCY_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+    def p95(self) -> Optional[float]:
+        return self.percentile(0.95)
+
+
+class CircuitBreaker:
+    """Closed until `failures` consecutive errors, then open for `reset_timeout`
+    seconds, then half-open: one probe call decides whether it closes again.
+    """
+
+    def __init__(
+        self,
+        failures: int = LLM_BREAKER_FAILURES,
+        reset_timeout: float = LLM_BREAKER_RESET,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._probing)
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; in half-open state this takes the single probe slot"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self._probing or self.consecutive_failures >= self.failures:
+            self.opened_at = self.clock()
+        self._probing = False
+
+    def release(self):
+        """A probe was cancelled before it finished; let another call probe"""
+        self._probing = False
+
+
+class Provider:
+    """One LLM backend with its own concurrency limit, latency window and circuit breaker"""
+
+    def __init__(self, name: str, call: Callable[..., Awaitable[Optional[str]]], max_concurrency: int, timeout: float):
+        self.name = name
+        self.call = call
+        self.timeout = timeout
+        self.tracker = LatencyTracker()
+        self.breaker = CircuitBreaker()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.calls = 0
+        self.errors = 0
+
+    def available(self) -> bool:
+        return self.breaker.available()
+
+    def saturated(self) -> bool:
+        return self._semaphore.locked()
+
+    async def __call__(self, text: str, *args) -> str:
+        if not self.breaker.allow():
+            raise ProviderUnavailable(f"{self.name} circuit is open")
+        finished = False
+        try:
+            async with self._semaphore:
+                self.calls += 1
+                started = time.monotonic()
+                try:
+                    response = await asyncio.wait_for(self.call(text, *args), self.timeout)
+                    if not response:
+                        raise ValueError("empty response")
+                except Exception:
+                    finished = True
+                    self.errors += 1
+                    self.breaker.record_failure()
+                    LLM_LATENCY.labels(self.name, "error").observe(time.monotonic() - started)
+                    raise
+                finished = True
+                elapsed = time.monotonic() - started
+                self.tracker.record(elapsed)
+                self.breaker.record_success()
+                LLM_LATENCY.labels(self.name, "ok").observe(elapsed)
+                return response
+        finally:
+            if not finished:
+                self.breaker.release()  # Cancelled (lost a hedge race) before finishing
+
+    def stats(self) -> dict:
+        p95 = self.tracker.p95()
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "p95_ms": round(p95 * 1000) if p95 is not None else None,
+            "circuit": self.breaker.state,
+        }
+
+
+class LLMRouter:
+    """Sends each request to the first healthy provider and, if it hasn't
+    answered within its p95 latency, hedges with the next one; whichever
+    answers first wins and the other call is cancelled. A failed call moves on
+    to the next provider immediately instead of waiting for the hedge delay.
+    """
+
+    def __init__(self, providers: List[Provider]):
+        self.providers = providers
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def _candidates(self) -> List[Provider]:
+        # Healthy providers keep their priority order, ones with free slots first
+        healthy = [provider for provider in self.providers if provider.available()]
+        return sorted(healthy, key=Provider.saturated)
+
+    @staticmethod
+    def _hedge_delay(provider: Provider) -> float:
+        p95 = provider.tracker.p95()
+        if p95 is None:
+            p95 = LLM_HEDGE_DEFAULT_DELAY
+        return min(max(p95, LLM_HEDGE_MIN_DELAY), LLM_HEDGE_MAX_DELAY)
+
+    async def complete(self, text: str, *args) -> Optional[str]:
+        """Return the first successful response, or None if every provider failed or is open.
+
+        Extra arguments are passed on to every provider call.
+        """
+        pending = self._candidates()
+        if not pending:
+            logger.warning("All LLM providers are unavailable (circuits open)")
+            return None
+        running = {}
+
+        def launch():
+            provider = pending.pop(0)
+            running[asyncio.create_task(provider(text, *args))] = provider
+            return provider
+
+        primary = latest = launch()
+        try:
+            while running:
+                timeout = self._hedge_delay(latest) if pending else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    slow, latest = latest, launch()
+                    self.hedged += 1
+                    LLM_HEDGES.labels(latest.name).inc()
+                    logger.warning(f"{slow.name} slower than {timeout:.2f}s, hedging with {latest.name}")
+                    continue
+
+                for task in done:
+                    provider = running.pop(task)
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        logger.error(f"{provider.name} API failed: {e}")
+                        continue
+                    if provider is not primary:
+                        self.hedge_wins += 1
+                    return response
+
+                # Everything that finished failed: try the next provider right away
+                if pending:
+                    latest = launch()
+            return None
+        finally:
+            for task in running:
+                task.cancel()
+
+    def stats(self) -> dict:
+        stats = {provider.name: provider.stats() for provider in self.providers}
+        stats["hedged"] = self.hedged
+        stats["hedge_wins"] = self.hedge_wins
+        return stats
@@ -1,359 +1,643 @@
 import os
+import time
+import logging
 import asyncio
-from datetime import datetime, timedelta
-from aiHandler import parse_ai_response, get_ai_response
-from dbHandler import test_database, insert_task, get_upcoming_tasks, mark_task_alerted,get_tomorrow_tasks, get_all_tasks, update_task_completion, get_user_tasks_for_selection, delete_task
+# Imported first so the startup report covers loading the other modules
+from startupTimer import startup_timer
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from aiHandler import AI_WARMUP, parse_ai_tasks, format_ai_reply, get_ai_response, get_cached_ai_response, cache_ai_response, close_ai_clients, warm_ai_clients
+from intentParser import parse_intent, format_intent_reply
+from llmAdmission import LLMBusy
+from taskRecord import TaskRecord
+from recurrence import first_occurrence, get_zone
+from taskImport import IMPORT_MAX_BYTES, parse_import
+from taskSearch import confident_match
+from taskViews import SELECTION_PAGE_SIZE, SELECTION_PROMPTS, build_selection_page, format_task_history, format_task_list
+from alertScheduler import AlertScheduler
+from messageDelivery import MessageDelivery
+from changeFeed import TaskChangeFeed
+from taskArchive import run_task_archival
+from conversationState import close_state_store, get_state_store, new_selection
+from logConfig import setup_logging, stop_logging
+from metrics import ECHO_LATENCY, start_metrics_server
+from shardOwnership import SCHEDULER_SHARDS, ShardOwnership
+from updateDispatcher import UPDATE_WORKERS, PerUserUpdateProcessor, UpdateDispatcher
+from dbMigrations import run_migrations
+from dbHandler import check_default_timezone, init_pool, close_pool, monitor_pool_health, add_task_listener, remove_task_listener, test_database, insert_tasks, claim_task_alerts, claim_occurrence_alerts, release_task_alerts, release_occurrence_alerts, complete_occurrence, next_occurrences, get_reminder_wave_tasks, claim_reminders, get_user_timezone, set_user_timezone, get_all_tasks, get_task_history, update_task_completion, get_user_tasks_page, search_open_tasks, delete_task
 
 from dotenv import load_dotenv
 from telegram import Update
 from telegram.ext import (
     ApplicationBuilder,
+    CallbackQueryHandler,
     CommandHandler,
     MessageHandler,
     ContextTypes,
     filters,
 )
 
+logger = logging.getLogger(__name__)
+startup_timer.record("imports")
+
 # Load environment variables
 load_dotenv()
 TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
+# "polling" pulls updates with getUpdates; "webhook" serves them over HTTP
+BOT_MODE = os.environ.get("BOT_MODE", "polling")
+# Local hour of each user's daily reminder. Waves run every REMINDER_WAVE_MINUTES
+# and cover the users whose reminder hour falls in that slot, so zones with
+# half- and quarter-hour offsets are reminded on time too
+REMINDER_HOUR = int(os.environ.get("REMINDER_HOUR", "21"))
+REMINDER_WAVE_INTERVAL = timedelta(minutes=int(os.environ.get("REMINDER_WAVE_MINUTES", "15")))
+# Seconds before an alert that failed to send is released to be sent again.
+# Users who blocked the bot or chats Telegram rejects are not retried.
+ALERT_RETRY_DELAY = float(os.environ.get("ALERT_RETRY_DELAY", "60"))
+PERMANENT_SEND_ERRORS = {"forbidden", "bad_request"}
+
+async def user_now(userId) -> datetime:
+    """Current time in the user's timezone"""
+    return datetime.now(get_zone(await get_user_timezone(userId)))
+
+def anchor_recurring(records, now):
+    """Set each repeating task's due date to its first occurrence still ahead of the user's local `now`"""
+    for record in records:
+        if record.recurrence:
+            record.duedate = first_occurrence(record.recurrence, record.duedate, record.duetime, now)
+    return records
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    welcome_message = """
+    welcome_message = f"""
         Hello! I'm your To-Do assistant. Here's what I can do:
 
         📝 Add tasks: "Add call mom tomorrow at 2pm"
+        🔁 Repeating tasks: "Remind me to take meds every day at 8am"
         📋 List tasks: "Show my tasks" 
-        ✅ Mark done: "Mark task done"
-        🗑️ Delete tasks: "Delete task"
+        ✅ Mark done: "Mark task done" or "Mark dentist as done"
+        🗑️ Delete tasks: "Delete task" or "Delete the dentist task"
+        🗂️ Finished tasks: /history
+        📥 Import a list: /import followed by one task per line, or a CSV file with the caption /import
 
         I'll also send you:
         🔔 2-hour alerts for upcoming tasks
-        🌅 Daily reminders at 9 PM for tomorrow's tasks
+        🌅 Daily reminders at {REMINDER_HOUR:02d}:00 your time for tomorrow's tasks
+
+        🌍 Set your timezone with /timezone, e.g. /timezone Europe/London
 
         Just tell me what you need to do!
     """
     await update.message.reply_text(welcome_message)
 
+async def import_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/import with a task list in the message, or a .csv/.txt document captioned /import"""
+    message = update.message
+    userId = message.from_user.id
+
+    if message.document is not None:
+        if message.document.file_size and message.document.file_size > IMPORT_MAX_BYTES:
+            await message.reply_text(f"❌ That file is too large. Please keep imports under {IMPORT_MAX_BYTES // 1024} KB.")
+            return
+        telegram_file = await message.document.get_file()
+        data = await telegram_file.download_as_bytearray()
+        text = bytes(data).decode('utf-8-sig', errors='replace')
+    else:
+        # Everything after the command itself is the list
+        text = (message.text or "").partition('\n')[2] or " ".join(context.args or [])
+
+    now = await user_now(userId)
+    records, errors = parse_import(text, now)
+    if not records:
+        reply = "📥 Send /import followed by one task per line, e.g.\n/import\nBuy milk tomorrow at 5pm\nDentist Friday 10am\n\nor a CSV file with task,date,time,note columns captioned /import."
+        if errors:
+            reply = "❌ No tasks could be imported:\n" + "\n".join(errors[:10])
+        await message.reply_text(reply)
+        return
+
+    inserted = await insert_tasks([record.as_row() for record in anchor_recurring(records, now)], userId)
+    if inserted is None:
+        await message.reply_text("❌ Failed to import your tasks. Please try again.")
+        return
+
+    reply = f"📥 Imported {len(inserted)} tasks."
+    if errors:
+        reply += f"\n⚠️ Skipped {len(errors)} lines:\n" + "\n".join(errors[:10])
+        if len(errors) > 10:
+            reply += f"\n… and {len(errors) - 10} more"
+    await message.reply_text(reply)
+
+async def timezone_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/timezone shows the user's timezone; /timezone Area/City changes it"""
+    userId = update.message.from_user.id
+    if not context.args:
+        current = await get_user_timezone(userId)
+        await update.message.reply_text(
+            f"🌍 Your timezone is {current}. Change it with /timezone followed by a name like Europe/London or Asia/Phnom_Penh."
+        )
+        return
+
+    name = context.args[0]
+    try:
+        zone = ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        await update.message.reply_text(f"❌ Unknown timezone {name!r}. Use a name like Europe/London or America/New_York.")
+        return
+
+    if not await set_user_timezone(userId, name):
+        await update.message.reply_text("❌ Failed to set your timezone. Please try again.")
+        return
+    await update.message.reply_text(
+        f"✅ Timezone set to {name}. Your local time is {datetime.now(zone):%H:%M}; "
+        f"daily reminders arrive at {REMINDER_HOUR:02d}:00."
+    )
+
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/history lists recently completed and expired tasks, including archived ones"""
+    tasks = await get_task_history(update.message.from_user.id)
+    for chunk in format_task_history(tasks):
+        await update.message.reply_text(chunk)
+
+async def build_selection(context, userId, action, after_id=None, offset=0):
+    """Fetch one page of the user's open tasks for the done/delete flow.
+
+    Returns (text, keyboard), or None if the user has no open tasks. Only the
+    ids on the page are remembered, in the conversation-state store, for users
+    who reply with a number.
+    """
+    tasks, has_more = await get_user_tasks_page(userId, after_id, SELECTION_PAGE_SIZE)
+    if not tasks and after_id is not None:
+        # The page cursor was completed or deleted meanwhile; start over
+        tasks, has_more = await get_user_tasks_page(userId, None, SELECTION_PAGE_SIZE)
+        offset = 0
+    today = (await user_now(userId)).date()
+    shown = []
+    while tasks:
+        # The next page starts after the last row read, even if it isn't shown
+        after_id = tasks[-1]['id']
+        # Repeating tasks are shown as their next open occurrence; ended series
+        # are dropped, so read on while a whole page of them shows nothing
+        shown = await next_occurrences(tasks, today)
+        if shown or not has_more:
+            break
+        tasks, has_more = await get_user_tasks_page(userId, after_id, SELECTION_PAGE_SIZE)
+    if not shown:
+        await get_state_store().clear(userId)
+        return None
+
+    await get_state_store().set(userId, new_selection(action, [task['id'] for task in shown], offset))
+    return build_selection_page(action, shown, has_more, offset, after_id)
+
+async def apply_selection(userId, action, task_id) -> str:
+    """Complete or delete the chosen task and return the reply text"""
+    if action == 'delete':
+        deleted = await delete_task(task_id, userId)
+        if deleted:
+            return f"🗑️ Task deleted: {deleted['task']}"
+        return "❌ Failed to delete task. Please try again."
+
+    # "Done" on a repeating task completes only its next open occurrence
+    tasks = await get_all_tasks(userId, (await user_now(userId)).date())
+    task = next((task for task in tasks if task['id'] == task_id), None)
+    if task is not None and task.get('occurrence') is not None:
+        completed = await complete_occurrence(task, task['occurrence'], userId)
+        if completed:
+            return f"✅ Task completed: {completed['task']} ({completed['occurrence']})"
+        return "❌ Failed to mark task as completed. Please try again."
+
+    completed = await update_task_completion(task_id, True, userId)
+    if completed:
+        return f"✅ Task completed: {completed['task']}"
+    return "❌ Failed to mark task as completed. Please try again."
+
+async def resolve_named_task(update: Update, userId, action, name, today) -> bool:
+    """Complete or delete the task the user named in one step, or offer the closest matches.
+
+    Returns False when no open task matches the name.
+    """
+    ranked = await search_open_tasks(userId, name)
+    if not ranked:
+        return False
+    # Deleting the wrong task can't be undone, so only an exact name skips the list
+    match = confident_match(ranked, name, exact=action == 'delete')
+    if match is not None:
+        await get_state_store().clear(userId)
+        await update.message.reply_text(await apply_selection(userId, action, match['id']))
+        return True
+
+    tasks = await next_occurrences([task for _, task in ranked], today)
+    if not tasks:
+        return False
+    await get_state_store().set(userId, new_selection(action, [task['id'] for task in tasks], 0))
+    message, keyboard = build_selection_page(action, tasks, False, 0)
+    await update.message.reply_text(message, reply_markup=keyboard)
+    return True
+
+async def handle_selection_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inline keyboard presses from the done/delete selection pages"""
+    query = update.callback_query
+    await query.answer()
+    userId = query.from_user.id
+
+    if query.data == 'cancel':
+        await get_state_store().clear(userId)
+        await query.edit_message_text("👌 Selection cancelled.")
+        return
+
+    try:
+        kind, action, rest = query.data.split(':', 2)
+        if action not in SELECTION_PROMPTS:
+            raise ValueError(f"unknown action {action}")
+
+        if kind == 'sel':
+            reply = await apply_selection(userId, action, int(rest))
+            await get_state_store().clear(userId)
+            await query.edit_message_text(reply)
+        elif kind == 'page':
+            after_id, offset = rest.split(':')
+            page = await build_selection(context, userId, action, int(after_id) if after_id else None, int(offset))
+            if page is None:
+                await query.edit_message_text("📋 You have no open tasks left!")
+                return
+            message, keyboard = page
+            await query.edit_message_text(message, reply_markup=keyboard)
+        else:
+            raise ValueError(f"unknown callback {kind}")
+    except ValueError as e:
+        logger.warning(f"Ignoring malformed callback data {query.data!r}: {e}")
 
 async def echo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    started = time.perf_counter()
+    route = await handle_message(update, context)
+    ECHO_LATENCY.labels(route).observe(time.perf_counter() - started)
+    startup_timer.first_reply()
+
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """Answer one text message; returns how it was handled, for the latency histogram"""
     userId = update.message.from_user.id
     text = update.message.text
 
     # Check if text is None
     if text is None:
         await update.message.reply_text("I can only process text messages. Please send me a text message with your task.")
-        return
+        return 'non_text'
 
-    if 'pending_completion' in context.user_data:
-        try:
+    # A bare number answers the selection page the user was shown last
+    state_store = get_state_store()
+    if text.strip().isdigit():
+        pending = await state_store.get(userId)
+        if pending:
             task_number = int(text.strip())
-            pending_tasks = context.user_data['pending_completion']
+            offset = pending['offset']
+            pending_ids = pending['ids']
             
-            if 1 <= task_number <= len(pending_tasks):
-                selected_task = pending_tasks[task_number - 1]
-                task_id = selected_task['id']
-                task_name = selected_task['task']
-                
-                # Check if this is for completion or deletion
-                if context.user_data.get('action_type') == 'delete':
-                    # Delete the task
-                    success = await delete_task(task_id)
-                    
-                    if success:
-                        await update.message.reply_text(f"🗑️ Task deleted: {task_name}")
-                    else:
-                        await update.message.reply_text("❌ Failed to delete task. Please try again.")
-                else:
-                    # Mark task as completed (existing logic)
-                    success = await update_task_completion(task_id, True)
-                    
-                    if success:
-                        await update.message.reply_text(f"✅ Task completed: {task_name}")
-                    else:
-                        await update.message.reply_text("❌ Failed to mark task as completed. Please try again.")
-                
-                # Clear pending completion
-                del context.user_data['pending_completion']
-                if 'action_type' in context.user_data:
-                    del context.user_data['action_type']
-                return
+            if offset < task_number <= offset + len(pending_ids):
+                reply = await apply_selection(userId, pending['action'], pending_ids[task_number - offset - 1])
+                await state_store.clear(userId)
+                await update.message.reply_text(reply)
             else:
-                await update.message.reply_text(f"❌ Invalid number. Please choose between 1 and {len(pending_tasks)}.")
-                return
-                
-        except ValueError:
-            await update.message.reply_text("❌ Please enter a valid number.")
-            return
+                await update.message.reply_text(f"❌ Invalid number. Please choose between {offset + 1} and {offset + len(pending_ids)}.")
+            return 'selection'
+    else:
+        # Anything else ends the selection and is handled as a new request
+        await state_store.clear(userId)
+
+    # Relative dates ("tomorrow", "tonight") are resolved in the user's timezone
+    now = await user_now(userId)
 
-    response = await get_ai_response(text)
+    # Simple commands are parsed locally; only fall back to the LLM when unsure
+    parsed = parse_intent(text, now)
+    if parsed:
+        route = 'intent'
+        response = format_intent_reply(*parsed)
+        records = [TaskRecord(*parsed)]
+    else:
+        # Repeated phrasings are answered from the cache without an LLM call
+        cached = await get_cached_ai_response(text, now.date())
+        if cached:
+            route = 'cache'
+            response, records = cached
+        else:
+            route = 'llm'
+            records = []
+            try:
+                response = await get_ai_response(text, now, userId)
+            except LLMBusy as e:
+                logger.info(f"Turned away LLM request from user {userId}: {e}")
+                await update.message.reply_text("⏳ I'm handling a lot of requests right now. Please try again in a moment.")
+                return 'busy'
+            if response:
+                records = await parse_ai_tasks(response)
+                response = format_ai_reply(response, records)
+                await cache_ai_response(text, response, records, now.date())
     if response:
-        action, task, duedate, duetime, note = await parse_ai_response(response)
-        print(f"Action: {action}, Task: {task}, Due date: {duedate}, Due time: {duetime}, Note: {note}")
+        action, task, duedate, duetime, note = records[0].as_tuple() if records else (None, None, None, None, None)
+        logger.info(f"Action: {action}, Task: {task}, Due date: {duedate}, Due time: {duetime}, Note: {note}")
         if action == 'add':
-            await insert_task(action, task, duedate, duetime, note, userId)
+            # A single message may carry several tasks; store them in one round-trip
+            added = anchor_recurring([record for record in records if record.action == 'add'], now)
+            if await insert_tasks([record.as_row() for record in added], userId) is None:
+                await update.message.reply_text("❌ Failed to add your tasks. Please try again.")
+                return route
         elif action == 'list':
-            tasks = await get_all_tasks(userId)
-            
-            # Format tasks into a readable message
-            if not tasks:
-                message = "📋 You have no upcoming tasks!"
-            else:
-                message = f"📋 Your Tasks ({len(tasks)} total):\n\n"
-                
-                for i, task in enumerate(tasks, 1):
-                    task_name = task['task']
-                    due_date = task['duedate']
-                    due_time = task['duetime']
-                    note = task['note']
-                    complete = task['completed']
-                    
-                    message += f"{i}. 📝 {task_name}\n"
-                    if complete:
-                        message += "    ✅ Completed\n"
-                    else:
-                        message += "    ⏳ Incomplete\n"
-
-                    if due_date:
-                        message += f"    📅 {due_date}"
-                        if due_time:
-                            message += f" at {due_time}"
-                        message += "\n"
-                    
-                    if note:
-                        message += f"    📄 {note}\n"
-                    
-                    message += "\n"
+            tasks = await get_all_tasks(userId, now.date())
             
-            await update.message.reply_text(message)
-            return
+            # Format tasks into one or more messages within Telegram's size limit
+            for message in format_task_list(tasks):
+                await update.message.reply_text(message)
+            return route
         
-        elif action == 'update':
-            # Get user's incomplete tasks
-            user_tasks = await get_user_tasks_for_selection(userId)
-            
-            if not user_tasks:
-                await update.message.reply_text("📋 You have no incomplete tasks to mark as done!")
-                return
+        elif action in ('update', 'delete'):
+            selection = 'delete' if action == 'delete' else 'done'
+            # "Delete the dentist task" is resolved by name; without a name, list everything
+            if task and await resolve_named_task(update, userId, selection, task, now.date()):
+                return route
+            page = await build_selection(context, userId, selection)
             
-            # Create a message listing tasks with numbers
-            message = "📋 Which task would you like to mark as completed? Reply with the number:\n\n"
-            
-            for i, task in enumerate(user_tasks, 1):
-                task_name = task['task']
-                due_date = task['duedate']
-                due_time = task['duetime']
-                
-                message += f"{i}. 📝 {task_name}"
-                if due_date:
-                    message += f" (📅 {due_date}"
-                    if due_time:
-                        message += f" at {due_time}"
-                    message += ")"
-                message += "\n"
-            
-            message += "\nJust reply with the number (e.g., '1', '2', etc.)"
-            await update.message.reply_text(message)
-            
-            # Store user tasks in context for the next message
-            context.user_data['pending_completion'] = user_tasks
-            return
-        
-        elif action == 'delete':
-            # Get user's tasks for deletion
-            user_tasks = await get_user_tasks_for_selection(userId)
-            
-            if not user_tasks:
-                await update.message.reply_text("📋 You have no tasks to delete!")
-                return
-            
-            # Create a message listing tasks with numbers
-            message = "🗑️ Which task would you like to delete? Reply with the number:\n\n"
-            
-            for i, task in enumerate(user_tasks, 1):
-                task_name = task['task']
-                due_date = task['duedate']
-                due_time = task['duetime']
-                
-                message += f"{i}. 📝 {task_name}"
-                if due_date:
-                    message += f" (📅 {due_date}"
-                    if due_time:
-                        message += f" at {due_time}"
-                    message += ")"
-                message += "\n"
-            
-            message += "\n⚠️ This action cannot be undone. Just reply with the number (e.g., '1', '2', etc.)"
-            await update.message.reply_text(message)
+            if page is None:
+                if selection == 'delete':
+                    await update.message.reply_text("📋 You have no tasks to delete!")
+                else:
+                    await update.message.reply_text("📋 You have no incomplete tasks to mark as done!")
+                return route
             
-            # Store user tasks in context for the next message
-            context.user_data['pending_completion'] = user_tasks
-            context.user_data['action_type'] = 'delete'
-            return
+            message, keyboard = page
+            await update.message.reply_text(message, reply_markup=keyboard)
+            return route
 
         await update.message.reply_text(response)
+        return route
     else:
         await update.message.reply_text("I am temporarily unavailable. Please try again later.")
+        return 'unavailable'
+
+def format_task_alert(task) -> str:
+    """Build the deadline alert message for one task"""
+    task_name = task['task']
+    note = task['note']
+    due_date = task['duedate']
+    due_time = task['duetime']
+    
+    # Calculate how much time is left; due_at is an absolute (UTC) instant
+    time_left = task['due_at'] - datetime.now(timezone.utc)
+    hours_left = int(time_left.total_seconds() / 3600)
+    minutes_left = int((time_left.total_seconds() % 3600) / 60)
+    
+    # Create alert message
+    alert_message = f"🚨 Deadline Approach!\n\n"
+    alert_message += f"📝 Task: {task_name}\n"
+    alert_message += f"⏰ Due: {due_date} at {due_time}\n"
+    alert_message += f"⏳ Time left: {hours_left}h {minutes_left}m\n"
+    
+    if note:
+        alert_message += f"📄 Note: {note}\n"
+    return alert_message
+
+async def send_task_alerts(app, tasks):
+    """Claim the tasks' alerts in one round-trip, then send the claimed ones concurrently.
+
+    Alerts that failed to send for a reason that may pass are released again
+    after ALERT_RETRY_DELAY, up to ALERT_MAX_ATTEMPTS sends in all.
+    """
+    # Claiming first means an alert another instance already took is never sent twice
+    claimed = await claim_task_alerts([task['id'] for task in tasks if task.get('occurrence') is None])
+    occurrences = [task for task in tasks if task.get('occurrence') is not None]
+    if occurrences:
+        claimed = list(claimed) + await claim_occurrence_alerts(occurrences)
+    delivery = app.bot_data['delivery']
+    results = await delivery.deliver_many(
+        app.bot, [(task['userid'], format_task_alert(task)) for task in claimed]
+    )
+    failed = [
+        task for task, reason in zip(claimed, results)
+        if reason is not None and reason not in PERMANENT_SEND_ERRORS
+    ]
+    logger.info(f"Alerts sent: {results.count(None)}/{len(claimed)} claimed of {len(tasks)} due")
+    if failed:
+        # The claims are held meanwhile, so no other instance sends them either
+        await asyncio.sleep(ALERT_RETRY_DELAY)
+        released = await release_task_alerts([task['id'] for task in failed if task.get('occurrence') is None])
+        released += await release_occurrence_alerts([task for task in failed if task.get('occurrence') is not None])
+        logger.info(f"Released {len(released)} of {len(failed)} failed alerts for another try")
 
 async def check_upcoming_tasks(app):
-    """Check for tasks due in the next 2 hours and send alerts every hour"""
-    while True:
-        try:
-            print("Checking for upcoming tasks...")
-            upcoming_tasks = await get_upcoming_tasks()
-            
-            for task in upcoming_tasks:
-                task_id = task['id']
-                task_name = task['task']
-                note = task['note']
-                user_id = task['userid']
-                due_date = task['duedate']
-                due_time = task['duetime']
-                
-                # Calculate how much time is left
-                due_datetime = datetime.combine(due_date, due_time)
-                time_left = due_datetime - datetime.now()
-                hours_left = int(time_left.total_seconds() / 3600)
-                minutes_left = int((time_left.total_seconds() % 3600) / 60)
-                
-                # Create alert message
-                alert_message = f"🚨 Deadline Approach!\n\n"
-                alert_message += f"📝 Task: {task_name}\n"
-                alert_message += f"⏰ Due: {due_date} at {due_time}\n"
-                alert_message += f"⏳ Time left: {hours_left}h {minutes_left}m\n"
-                
-                if note:
-                    alert_message += f"📄 Note: {note}\n"
-                
-                # Send alert to user
-                try:
-                    await app.bot.send_message(
-                        chat_id=user_id,
-                        text=alert_message
-                    )
-                    print(f"Alert sent to user {user_id} for task: {task_name}")
-                    
-                    # Mark task as alerted to prevent duplicate notifications
-                    await mark_task_alerted(task_id)
-                    
-                except Exception as send_error:
-                    print(f"Failed to send alert to user {user_id}: {send_error}")
-            
-            if not upcoming_tasks:
-                print("No upcoming tasks found.")
+    """Fire deadline alerts from the in-process scheduler at due time minus the lead time"""
+    ownership = app.bot_data.get('ownership')
+    scheduler = AlertScheduler(lambda tasks: send_task_alerts(app, tasks), ownership=ownership)
+    add_task_listener(scheduler.on_task_event)
+    if ownership is not None:
+        ownership.add_listener(scheduler.on_ownership_change)
+    try:
+        logger.info("Starting deadline alert scheduler...")
+        await scheduler.run()
+    finally:
+        remove_task_listener(scheduler.on_task_event)
+        if ownership is not None:
+            ownership.remove_listener(scheduler.on_ownership_change)
+
+def reminder_wave_start(now: datetime) -> datetime:
+    """Start of the reminder wave slot containing `now`"""
+    interval = REMINDER_WAVE_INTERVAL.total_seconds()
+    return datetime.fromtimestamp(now.timestamp() // interval * interval, timezone.utc)
+
+async def send_reminder_wave(app, start=None, end=None):
+    """Remind the users whose local reminder hour falls in [start, end) about tomorrow's tasks.
+
+    Defaults to the current wave slot. Returns (sent, total).
+    """
+    if start is None:
+        start = reminder_wave_start(datetime.now(timezone.utc))
+    end = end or start + REMINDER_WAVE_INTERVAL
+    remind_time = datetime.min.time().replace(hour=REMINDER_HOUR)
+    ownership = app.bot_data.get('ownership')
+    if ownership is None:
+        tomorrow_tasks = await get_reminder_wave_tasks(start, end, remind_time)
+    elif ownership.owned:
+        # Each instance covers the users in its own shards
+        tomorrow_tasks = await get_reminder_wave_tasks(start, end, remind_time, ownership.shards(), ownership.shard_count)
+    else:
+        logger.info("No shards owned, skipping the reminder wave.")
+        return 0, 0
+    
+    if not tomorrow_tasks:
+        return 0, 0
+    logger.info(f"Sending daily reminders for the wave starting {start:%H:%M} UTC...")
+
+    # Group tasks by user
+    user_tasks = {}
+    for task in tomorrow_tasks:
+        user_id = task['userid']
+        if user_id not in user_tasks:
+            user_tasks[user_id] = []
+        user_tasks[user_id].append(task)
+    
+    # Claim the users first so a user is reminded at most once a (local) day across instances
+    claimed = set(await claim_reminders(
+        list(user_tasks), [tasks[0]['local_date'] for tasks in user_tasks.values()]
+    ))
+
+    # Build one reminder per user
+    reminders = []
+    for user_id, tasks in user_tasks.items():
+        if user_id not in claimed:
+            continue
+        # Create reminder message
+        tomorrow_date = tasks[0]['duedate'].strftime("%Y-%m-%d")
+        reminder_message = f"🌅 Good Evening! Here are your tasks for tomorrow ({tomorrow_date}):\n\n"
+        
+        for i, task in enumerate(tasks, 1):
+            task_name = task['task']
+            note = task['note']
+            due_time = task['duetime']
             
-        except Exception as e:
-            print(f"Error checking upcoming tasks: {e}")
+            reminder_message += f"{i}. 📝 {task_name}\n"
+            if due_time:
+                reminder_message += f"   ⏰ {due_time}\n"
+            if note:
+                reminder_message += f"   📄 {note}\n"
+            reminder_message += "\n"
         
-        # Wait 1 hour (3600 seconds) before checking again
-        print("Waiting 1 hour before next check...")
-        await asyncio.sleep(7200)
+        reminder_message += "Have a great evening! 🌙"
+        reminders.append((user_id, reminder_message))
+    
+    # Send the whole wave concurrently within Telegram's rate limits
+    wave_started = time.perf_counter()
+    results = await app.bot_data['delivery'].send_many(app.bot, reminders)
+    wave_seconds = time.perf_counter() - wave_started
+    logger.info(f"Daily reminders sent: {sum(results)}/{len(reminders)} users in {wave_seconds:.1f}s")
+    return sum(results), len(reminders)
 
 async def send_daily_reminders(app):
-    """Send daily reminders at 21:00 about tomorrow's tasks"""
+    """Send each user a reminder about tomorrow's tasks at REMINDER_HOUR in their own timezone.
+
+    Users are bucketed by when their local reminder hour comes round, so the
+    day's reminders go out as many small waves instead of one global spike.
+    """
+    start = reminder_wave_start(datetime.now(timezone.utc))
     while True:
         try:
-            now = datetime.now()
-            
-            # Calculate next 21:00
-            target_time = now.replace(hour=21, minute=0, second=0, microsecond=0)
-            # target_time = now + timedelta(seconds=10)
-
-            if now >= target_time:
-                # If it's already past 21:00 today, schedule for tomorrow
-                target_time += timedelta(days=1)
-            
-            # Calculate sleep time until next 21:00
-            sleep_seconds = (target_time - now).total_seconds()
-            
-            print(f"Daily reminder scheduled for {target_time}. Sleeping for {sleep_seconds/3600:.2f} hours...")
-            await asyncio.sleep(sleep_seconds)
-            
-            # Send reminders
-            print("Sending daily reminders for tomorrow's tasks...")
-            tomorrow_tasks = await get_tomorrow_tasks()
-            
-            # Group tasks by user
-            user_tasks = {}
-            for task in tomorrow_tasks:
-                user_id = task['userid']
-                if user_id not in user_tasks:
-                    user_tasks[user_id] = []
-                user_tasks[user_id].append(task)
-            
-            # Send reminders to each user
-            for user_id, tasks in user_tasks.items():
-                tomorrow_date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
-                
-                # Create reminder message
-                reminder_message = f"🌅 Good Evening! Here are your tasks for tomorrow ({tomorrow_date}):\n\n"
-                
-                for i, task in enumerate(tasks, 1):
-                    task_name = task['task']
-                    note = task['note']
-                    due_time = task['duetime']
-                    
-                    reminder_message += f"{i}. 📝 {task_name}\n"
-                    if due_time:
-                        reminder_message += f"   ⏰ {due_time}\n"
-                    if note:
-                        reminder_message += f"   📄 {note}\n"
-                    reminder_message += "\n"
-                
-                reminder_message += "Have a great evening! 🌙"
-                
-                # Send reminder to user
-                try:
-                    await app.bot.send_message(
-                        chat_id=user_id,
-                        text=reminder_message
-                    )
-                    print(f"Daily reminder sent to user {user_id} with {len(tasks)} tasks")
-                except Exception as send_error:
-                    print(f"Failed to send daily reminder to user {user_id}: {send_error}")
-            
-            if not tomorrow_tasks:
-                print("No tasks due tomorrow.")
-                
+            # A wave that started before we did still runs; reminder claims skip users already reminded
+            await send_reminder_wave(app, start, start + REMINDER_WAVE_INTERVAL)
         except Exception as e:
-            print(f"Error in daily reminder system: {e}")
-            await asyncio.sleep(3600)  # Wait 1 hour before retrying
+            logger.error(f"Error in daily reminder system: {e}")
+        start += REMINDER_WAVE_INTERVAL
+        sleep_seconds = (start - datetime.now(timezone.utc)).total_seconds()
+        if sleep_seconds > 0:
+            await asyncio.sleep(sleep_seconds)
+
+def catch_up_reminders(app, owned):
+    """ShardOwnership listener: rerun the current wave for shards taken over from a dead instance"""
+    if owned:
+        # Users already reminded today are skipped by the reminder claims
+        task = asyncio.create_task(send_reminder_wave(app))
+        app.bot_data.setdefault('catch_up_tasks', set()).add(task)
+        task.add_done_callback(app.bot_data['catch_up_tasks'].discard)
+
+async def prepare_database():
+    """Create the shared database pool once for the whole process and migrate"""
+    check_default_timezone()
+    with startup_timer.phase("db_pool"):
+        await init_pool()
+    if os.environ.get("RUN_MIGRATIONS", "1") == "1":
+        with startup_timer.phase("migrations"):
+            await run_migrations()
+
+async def initialize_bot(app):
+    with startup_timer.phase("bot_init"):
+        await app.initialize()
 
 async def main():
-    # Test database connection first
-    # await test_database()
+    setup_logging()
     
-    # Build the bot
-    app = ApplicationBuilder().token(TOKEN).build()
+    # Build the bot; updates run concurrently across users, in order per user
+    app = ApplicationBuilder().token(TOKEN).concurrent_updates(PerUserUpdateProcessor(UPDATE_WORKERS)).build()
+    app.bot_data['delivery'] = MessageDelivery()
+    # Alerts and reminders are split between instances by user shard
+    ownership = None
+    if SCHEDULER_SHARDS > 0:
+        ownership = ShardOwnership()
+        ownership.add_listener(lambda owned: catch_up_reminders(app, owned))
+        app.bot_data['ownership'] = ownership
     app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("import", import_command))
+    app.add_handler(CommandHandler("timezone", timezone_command))
+    app.add_handler(CommandHandler("history", history_command))
+    app.add_handler(MessageHandler(filters.Document.ALL & filters.CaptionRegex(r"^/import\b"), import_command))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, echo))
+    app.add_handler(CallbackQueryHandler(handle_selection_callback, pattern=r"^(sel|page):|^cancel$"))
     
-    print("Bot is running...")
-    
-    # Initialize and start the bot
-    await app.initialize()
-    await app.start()
-    await app.updater.start_polling()
-    
+    # The database and the Telegram handshake (getMe) don't depend on each other
+    await asyncio.gather(prepare_database(), initialize_bot(app))
+    # Test database connection first
+    # await test_database()
+
+    # Start the bot
+    with startup_timer.phase("start_updates"):
+        await app.start()
+        webhook = None
+        if BOT_MODE == "webhook":
+            # Imported here so polling deployments don't need aiohttp
+            from webhookServer import WebhookServer
+            webhook = WebhookServer(app, UpdateDispatcher(app))
+            await webhook.start()
+        else:
+            await app.updater.start_polling()
+    logger.info("Bot is running...")
+    startup_timer.ready()
+
     # Start the alert checker in the background
-    print("Starting background task checker...")
+    logger.info("Starting background task checker...")
     alert_task = asyncio.create_task(check_upcoming_tasks(app))
     
-    print("Starting daily reminder system...")
+    logger.info("Starting daily reminder system...")
     daily_reminder_task = asyncio.create_task(send_daily_reminders(app))
+
+    db_health_task = asyncio.create_task(monitor_pool_health())
+    background_tasks = [alert_task, daily_reminder_task, db_health_task]
+
+    if AI_WARMUP:
+        # Load the LLM SDKs now rather than on the first message that needs them
+        background_tasks.append(asyncio.create_task(warm_ai_clients()))
+
+    if ownership is not None:
+        logger.info(f"Starting shard ownership ({SCHEDULER_SHARDS} shards)...")
+        background_tasks.append(asyncio.create_task(ownership.run()))
+
+    if os.environ.get("TASK_ARCHIVE_ENABLED", "1") == "1":
+        logger.info("Starting task archival...")
+        background_tasks.append(asyncio.create_task(run_task_archival()))
+
+    if os.environ.get("CHANGE_FEED_ENABLED", "1") == "1":
+        logger.info("Starting task change feed...")
+        background_tasks.append(asyncio.create_task(TaskChangeFeed().run()))
+
+    try:
+        metrics_runner = await start_metrics_server()
+        if metrics_runner is not None:
+            logger.info("Serving metrics on /metrics")
+    except OSError as e:
+        logger.error(f"Failed to start metrics server: {e}")
+        metrics_runner = None
     # Keep the bot running
     try:
         await asyncio.Event().wait()
-    except KeyboardInterrupt:
-        print("Bot stopped by user")
-        alert_task.cancel()
-        daily_reminder_task.cancel()
-        await asyncio.gather(alert_task, daily_reminder_task, return_exceptions=True)
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        logger.info("Bot stopped by user")
     finally:
         # Clean shutdown
-        await app.updater.stop()
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        if webhook is not None:
+            await webhook.stop()
+        else:
+            await app.updater.stop()
         await app.stop()
         await app.shutdown()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await close_ai_clients()
+        close_state_store()
+        await close_pool()
+        stop_logging()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
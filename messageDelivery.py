@@ -0,0 +1,168 @@
+import os
+import logging
+import time
+import asyncio
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from metrics import MESSAGES_SENT, SEND_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows roughly 30 messages/second overall and 1 message/second per chat
+DELIVERY_GLOBAL_RATE = float(os.environ.get("DELIVERY_GLOBAL_RATE", "25"))
+DELIVERY_CHAT_RATE = float(os.environ.get("DELIVERY_CHAT_RATE", "1"))
+DELIVERY_CHAT_BURST = float(os.environ.get("DELIVERY_CHAT_BURST", "3"))
+DELIVERY_CONCURRENCY = int(os.environ.get("DELIVERY_CONCURRENCY", "20"))
+DELIVERY_MAX_RETRIES = int(os.environ.get("DELIVERY_MAX_RETRIES", "3"))
+# Number of idle per-chat buckets kept around before the oldest are dropped
+DELIVERY_MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at `rate` tokens per second"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for the given number of seconds"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+def send_error_reason(error: Exception) -> str:
+    """The SEND_ERRORS label for a send error; a fixed set so the metric's series stay bounded"""
+    if isinstance(error, RetryAfter):
+        return "retry_after"
+    if isinstance(error, Forbidden):
+        return "forbidden"
+    # BadRequest subclasses NetworkError in PTB, so it is checked first
+    if isinstance(error, BadRequest):
+        return "bad_request"
+    if isinstance(error, NetworkError):
+        return "network"
+    return "other"
+
+
+class MessageDelivery:
+    """Bounded-concurrency message sender with global and per-chat rate limits"""
+
+    def __init__(
+        self,
+        global_rate: float = DELIVERY_GLOBAL_RATE,
+        chat_rate: float = DELIVERY_CHAT_RATE,
+        chat_burst: float = DELIVERY_CHAT_BURST,
+        concurrency: int = DELIVERY_CONCURRENCY,
+        max_retries: int = DELIVERY_MAX_RETRIES,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._chat_buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+            while len(self._chat_buckets) > DELIVERY_MAX_CHAT_BUCKETS:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def deliver(self, bot, chat_id: int, text: str) -> Optional[str]:
+        """Send one message, honouring rate limits and retry-after.
+
+        Returns None on success, else the send_error_reason of the last error.
+        """
+        chat_bucket = self._chat_bucket(chat_id)
+        reason = None
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                await chat_bucket.acquire()
+                await self.global_bucket.acquire()
+                try:
+                    await bot.send_message(chat_id=chat_id, text=text)
+                    MESSAGES_SENT.labels("ok").inc()
+                    return None
+                except RetryAfter as e:
+                    reason = send_error_reason(e)
+                    SEND_ERRORS.labels(reason).inc()
+                    # Flood control applies to the whole bot, so back off globally
+                    delay = _retry_after_seconds(e)
+                    logger.warning(f"Flood limit hit sending to {chat_id}, retrying after {delay}s")
+                    self.global_bucket.pause(delay)
+                    chat_bucket.pause(delay)
+                except BadRequest as e:
+                    # Sending the same request again won't fix it
+                    reason = send_error_reason(e)
+                    SEND_ERRORS.labels(reason).inc()
+                    logger.error(f"Failed to send message to {chat_id}: {e}")
+                    MESSAGES_SENT.labels("failed").inc()
+                    return reason
+                except (TimedOut, NetworkError) as e:
+                    reason = send_error_reason(e)
+                    SEND_ERRORS.labels(reason).inc()
+                    if attempt == self.max_retries:
+                        logger.error(f"Failed to send message to {chat_id}: {e}")
+                        MESSAGES_SENT.labels("failed").inc()
+                        return reason
+                    await asyncio.sleep(2 ** attempt)
+                except Exception as e:
+                    reason = send_error_reason(e)
+                    SEND_ERRORS.labels(reason).inc()
+                    logger.error(f"Failed to send message to {chat_id}: {e}")
+                    MESSAGES_SENT.labels("failed").inc()
+                    return reason
+        logger.warning(f"Giving up on message to {chat_id} after {self.max_retries + 1} attempts")
+        MESSAGES_SENT.labels("failed").inc()
+        return reason
+
+    async def send(self, bot, chat_id: int, text: str) -> bool:
+        """Send one message like deliver(); True on success"""
+        return await self.deliver(bot, chat_id, text) is None
+
+    async def deliver_many(self, bot, messages: Iterable[Tuple[int, str]]) -> List[Optional[str]]:
+        """Send (chat_id, text) pairs concurrently; deliver() results in input order"""
+        return await asyncio.gather(*(self.deliver(bot, chat_id, text) for chat_id, text in messages))
+
+    async def send_many(self, bot, messages: Iterable[Tuple[int, str]]) -> List[bool]:
+        """Send (chat_id, text) pairs concurrently; results are in input order"""
+        return await asyncio.gather(*(self.send(bot, chat_id, text) for chat_id, text in messages))
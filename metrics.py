@@ -0,0 +1,207 @@
+import os
+import time
+import bisect
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Port for the local Prometheus /metrics endpoint; 0 disables it. Not 9100,
+# which node_exporter listens on by default
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9479"))
+METRICS_LISTEN = os.environ.get("METRICS_LISTEN", "127.0.0.1")
+
+# Latency buckets in seconds, from sub-millisecond DB calls to slow LLM answers
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values):
+        """Child metric for one combination of label values"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        if self.label_names:
+            raise ValueError(f"{self.name} needs labels {self.label_names}")
+        return self.labels()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+
+class _CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Counter(_Metric):
+    """Monotonic counter, optionally split by labels"""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def value(self, *values) -> float:
+        child = self._children.get(tuple(str(value) for value in values))
+        return child.value if child is not None else 0.0
+
+    def _render_child(self, key, child):
+        return [f"{self.name}_total{_format_labels(self.label_names, key)} {child.value}"]
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram, optionally split by labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _render_child(self, key, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, child.counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', repr(bound)))} {cumulative}")
+        lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', '+Inf'))} {child.count}")
+        lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {child.sum}")
+        lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {child.count}")
+        return lines
+
+
+_registry: List[_Metric] = []
+
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Message handling
+ECHO_LATENCY = _register(Histogram(
+    "todo_message_seconds", "End-to-end handling time of one text message", ["route"]))
+
+# LLM providers
+LLM_LATENCY = _register(Histogram(
+    "todo_llm_request_seconds", "LLM call latency per provider", ["provider", "outcome"]))
+LLM_HEDGES = _register(Counter(
+    "todo_llm_hedges", "Requests hedged to a second provider", ["provider"]))
+LLM_ADMISSION = _register(Counter(
+    "todo_llm_admission", "LLM requests by admission result", ["result"]))
+AI_PARSE_RESULTS = _register(Counter(
+    "todo_ai_parse", "LLM responses parsed into tasks, by format and result", ["format", "result"]))
+
+# Database
+DB_QUERY_LATENCY = _register(Histogram(
+    "todo_db_query_seconds", "Time spent using a pooled connection, per query", ["query"]))
+DB_POOL_WAIT = _register(Histogram(
+    "todo_db_pool_wait_seconds", "Time waiting to acquire a pooled connection"))
+DB_ERRORS = _register(Counter(
+    "todo_db_errors", "Database calls that raised", ["query"]))
+TASKS_ARCHIVED = _register(Counter(
+    "todo_tasks_archived", "Tasks moved from the hot table into the archive"))
+
+# Telegram delivery
+MESSAGES_SENT = _register(Counter(
+    "todo_messages_sent", "Outgoing bot messages by result", ["result"]))
+SEND_ERRORS = _register(Counter(
+    "todo_send_errors", "Errors while sending messages by reason", ["reason"]))
+ALERT_SEND_LAG = _register(Histogram(
+    "todo_alert_send_lag_seconds", "Deadline alert delivery time minus its scheduled time"))
+
+
+async def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_LISTEN):
+    """Serve GET /metrics on a local port; returns the runner to clean up, or None if disabled"""
+    if not port:
+        return None
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+    web_app = web.Application()
+    web_app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(web_app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
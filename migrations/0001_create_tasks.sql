@@ -0,0 +1,12 @@
+-- Baseline tasks table, matching the schema the bot was originally deployed with
+CREATE TABLE IF NOT EXISTS tasks (
+    id SERIAL PRIMARY KEY,
+    action TEXT,
+    task TEXT,
+    duedate DATE,
+    duetime TIME,
+    note TEXT,
+    userid BIGINT NOT NULL,
+    alerted BOOLEAN DEFAULT false,
+    completed BOOLEAN DEFAULT false
+);
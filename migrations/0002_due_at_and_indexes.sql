@@ -0,0 +1,26 @@
+-- Make the status flags non-nullable so they can be used in index predicates
+UPDATE tasks SET alerted = false WHERE alerted IS NULL;
+UPDATE tasks SET completed = false WHERE completed IS NULL;
+ALTER TABLE tasks ALTER COLUMN alerted SET DEFAULT false;
+ALTER TABLE tasks ALTER COLUMN alerted SET NOT NULL;
+ALTER TABLE tasks ALTER COLUMN completed SET DEFAULT false;
+ALTER TABLE tasks ALTER COLUMN completed SET NOT NULL;
+
+-- Stored due timestamp, NULL unless both duedate and duetime are set
+ALTER TABLE tasks
+    ADD COLUMN IF NOT EXISTS due_at TIMESTAMP GENERATED ALWAYS AS (duedate + duetime) STORED;
+
+-- Alert scans: pending tasks ordered by due time
+CREATE INDEX IF NOT EXISTS tasks_pending_alert_idx
+    ON tasks (due_at)
+    WHERE NOT alerted AND NOT completed AND action = 'add';
+
+-- List and selection views: a user's open tasks in display order
+CREATE INDEX IF NOT EXISTS tasks_open_by_user_idx
+    ON tasks (userid, duedate, duetime, id)
+    WHERE NOT completed AND action = 'add';
+
+-- Daily digest: tasks due on a given day
+CREATE INDEX IF NOT EXISTS tasks_duedate_idx
+    ON tasks (duedate, duetime)
+    WHERE action = 'add';
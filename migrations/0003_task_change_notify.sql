@@ -0,0 +1,34 @@
+-- Publish every change to tasks on the task_changes channel so bot instances
+-- can keep in-memory state current without polling
+CREATE OR REPLACE FUNCTION notify_task_change() RETURNS trigger AS $$
+DECLARE
+    changed tasks%ROWTYPE;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        changed := OLD;
+    ELSE
+        changed := NEW;
+    END IF;
+
+    -- NOTIFY payloads are limited to 8000 bytes, so free text is truncated
+    PERFORM pg_notify('task_changes', json_build_object(
+        'op', lower(TG_OP),
+        'id', changed.id,
+        'userid', changed.userid,
+        'action', changed.action,
+        'task', left(changed.task, 1000),
+        'note', left(changed.note, 1000),
+        'duedate', changed.duedate,
+        'duetime', changed.duetime,
+        'due_at', changed.due_at,
+        'alerted', changed.alerted,
+        'completed', changed.completed
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tasks_notify_change ON tasks;
+CREATE TRIGGER tasks_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON tasks
+    FOR EACH ROW EXECUTE FUNCTION notify_task_change();
@@ -0,0 +1,8 @@
+-- Keyset pagination over a user's open tasks orders by these expressions so
+-- that NULL dates/times sort last and every row has a comparable cursor
+CREATE INDEX IF NOT EXISTS tasks_open_by_user_order_idx
+    ON tasks (userid, coalesce(duedate, 'infinity'::date), coalesce(duetime, '24:00'::time), id)
+    WHERE NOT completed AND action = 'add';
+
+-- Superseded by the expression index above
+DROP INDEX IF EXISTS tasks_open_by_user_idx;
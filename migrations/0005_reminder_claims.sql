@@ -0,0 +1,8 @@
+-- One row per user and reminder day, claimed by whichever instance sends the
+-- daily reminder so running several bot instances never sends it twice
+CREATE TABLE IF NOT EXISTS reminder_claims (
+    userid BIGINT NOT NULL,
+    remind_date DATE NOT NULL,
+    claimed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (remind_date, userid)
+);
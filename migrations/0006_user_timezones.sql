@@ -0,0 +1,24 @@
+-- Per-user IANA timezone; users without a row use the bot's DEFAULT_TIMEZONE
+CREATE TABLE IF NOT EXISTS users (
+    userid BIGINT PRIMARY KEY,
+    timezone TEXT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Due date and time stay in the user's wall-clock time; each task records the
+-- timezone they are in so due_at can be a real instant
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS timezone TEXT;
+-- Tasks written so far were compared against the server clock
+UPDATE tasks SET timezone = current_setting('TimeZone') WHERE timezone IS NULL;
+ALTER TABLE tasks ALTER COLUMN timezone SET DEFAULT 'UTC';
+ALTER TABLE tasks ALTER COLUMN timezone SET NOT NULL;
+
+-- Replace the naive due timestamp with a TIMESTAMPTZ (stored as UTC)
+DROP INDEX IF EXISTS tasks_pending_alert_idx;
+ALTER TABLE tasks DROP COLUMN IF EXISTS due_at;
+ALTER TABLE tasks
+    ADD COLUMN due_at TIMESTAMPTZ GENERATED ALWAYS AS ((duedate + duetime) AT TIME ZONE timezone) STORED;
+
+CREATE INDEX IF NOT EXISTS tasks_pending_alert_idx
+    ON tasks (due_at)
+    WHERE NOT alerted AND NOT completed AND action = 'add';
@@ -0,0 +1,7 @@
+-- Pending conversation state (the done/delete selection a user is answering),
+-- one row per user, shared by every bot instance and expired by expires_at
+CREATE TABLE IF NOT EXISTS conversation_state (
+    userid BIGINT PRIMARY KEY,
+    state JSONB NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL
+);
@@ -0,0 +1,50 @@
+-- Repeating tasks: the rule (an RRULE subset, see recurrence.py) is stored once
+-- on the task, whose duedate/duetime are the first occurrence. NULL for one-off tasks.
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS recurrence TEXT;
+
+-- Open series are expanded whenever alerts, reminders or the list need them
+CREATE INDEX IF NOT EXISTS tasks_open_series_idx
+    ON tasks (userid, duedate)
+    WHERE recurrence IS NOT NULL AND NOT completed AND action = 'add';
+
+-- Alert and completion state of single occurrences. Occurrences without a row
+-- are pending; rows are written when an occurrence is alerted or completed and
+-- pruned once it is a week in the past, so the table doesn't grow with the series.
+CREATE TABLE IF NOT EXISTS task_occurrences (
+    task_id INTEGER NOT NULL REFERENCES tasks (id) ON DELETE CASCADE,
+    occurrence_date DATE NOT NULL,
+    alerted BOOLEAN NOT NULL DEFAULT false,
+    completed BOOLEAN NOT NULL DEFAULT false,
+    PRIMARY KEY (task_id, occurrence_date)
+);
+
+-- Task change notifications also carry the timezone and recurrence rule
+CREATE OR REPLACE FUNCTION notify_task_change() RETURNS trigger AS $$
+DECLARE
+    changed tasks%ROWTYPE;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        changed := OLD;
+    ELSE
+        changed := NEW;
+    END IF;
+
+    -- NOTIFY payloads are limited to 8000 bytes, so free text is truncated
+    PERFORM pg_notify('task_changes', json_build_object(
+        'op', lower(TG_OP),
+        'id', changed.id,
+        'userid', changed.userid,
+        'action', changed.action,
+        'task', left(changed.task, 1000),
+        'note', left(changed.note, 1000),
+        'duedate', changed.duedate,
+        'duetime', changed.duetime,
+        'due_at', changed.due_at,
+        'alerted', changed.alerted,
+        'completed', changed.completed,
+        'timezone', changed.timezone,
+        'recurrence', changed.recurrence
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
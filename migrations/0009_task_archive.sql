@@ -0,0 +1,32 @@
+-- When a task was completed, so the archival job knows when it may move it
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS completed_at TIMESTAMPTZ;
+
+-- History view and archival job: a user's completed tasks by completion time
+CREATE INDEX IF NOT EXISTS tasks_completed_idx
+    ON tasks (userid, completed_at)
+    WHERE completed;
+
+-- Completed and long-expired tasks are moved out of the hot tasks table into
+-- this archive in batches (see taskArchive.py). It is partitioned by month of
+-- archiving; partitions are named tasks_archive_YYYYMM, created ahead by the
+-- job and dropped whole once older than ARCHIVE_RETENTION_MONTHS.
+CREATE TABLE IF NOT EXISTS tasks_archive (
+    id INTEGER NOT NULL,
+    action TEXT,
+    task TEXT,
+    duedate DATE,
+    duetime TIME,
+    note TEXT,
+    userid BIGINT NOT NULL,
+    alerted BOOLEAN NOT NULL,
+    completed BOOLEAN NOT NULL,
+    completed_at TIMESTAMPTZ,
+    due_at TIMESTAMPTZ,
+    timezone TEXT NOT NULL,
+    recurrence TEXT,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT now()
+) PARTITION BY RANGE (archived_at);
+
+-- Created on every partition: history lookups for one user, newest first
+CREATE INDEX IF NOT EXISTS tasks_archive_user_idx
+    ON tasks_archive (userid, archived_at DESC);
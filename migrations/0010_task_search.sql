@@ -0,0 +1,13 @@
+-- Fuzzy lookup of open tasks by name ("delete the dentist task"). pg_trgm may
+-- not be installable on managed databases; the bot then ranks the user's open
+-- tasks in process instead, so its absence must not fail the migration.
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX IF NOT EXISTS tasks_open_name_trgm_idx
+        ON tasks USING gin (lower(task) gin_trgm_ops)
+        WHERE NOT completed AND action = 'add';
+EXCEPTION WHEN insufficient_privilege OR undefined_file OR feature_not_supported THEN
+    RAISE NOTICE 'pg_trgm unavailable (%), task search falls back to in-process matching', SQLERRM;
+END
+$$;
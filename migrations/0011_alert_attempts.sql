@@ -0,0 +1,5 @@
+-- Alerts whose send failed are released (alerted reset to false) for another
+-- try; this counts the failed sends so a task is given up on after
+-- ALERT_MAX_ATTEMPTS instead of retried forever
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS alert_attempts SMALLINT NOT NULL DEFAULT 0;
+ALTER TABLE task_occurrences ADD COLUMN IF NOT EXISTS alert_attempts SMALLINT NOT NULL DEFAULT 0;
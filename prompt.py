@@ -1,17 +1,10 @@
 import datetime
+import functools
 
-def get_system_prompt():
-    current_datetime = datetime.datetime.now()
-    current_date = current_datetime.strftime("%Y-%m-%d")
-    current_time = current_datetime.strftime("%H:%M")
-    current_day = current_datetime.strftime("%A")
-    
-    return f"""
-You are a To-Do app assistant. Your job is to help the user manage tasks clearly and naturally. Understand instructions and convert them into structured actions: add, list, mark done, delete, or update tasks. 
-
-Current information:
-- Today's date: {current_date} ({current_day})
-- Current time: {current_time}
+# Static part of the system prompt. It never changes between requests, so it is
+# sent first and byte-for-byte identical, which lets providers cache the prefix.
+STATIC_SYSTEM_PROMPT = """
+You are a To-Do app assistant. Your job is to help the user manage tasks clearly and naturally. Understand instructions and convert them into structured actions: add, list, mark done, delete, or update tasks.
 
 Always follow these rules:
 - If the user's intent is clear and complete, respond ONLY with a task summary in this exact plain-text format:
@@ -22,6 +15,10 @@ Always follow these rules:
   ⏱️ Time: 14:00
   🗒️ Note: Ask about her trip
 
+- If the message contains several tasks, write one such summary per task, separated by a blank line.
+
+- If a task repeats ("every day", "every Monday", "monthly"), add a last line such as "🔁 Repeat: every monday", and set the due date to the first occurrence. Leave the line out for one-off tasks.
+
 - Allowed actions: add, list, done, delete, update.
 - If user ask for all the tasks, the action should be "list"
 - If the user asks to mark a task as done, use "update" action.
@@ -30,7 +27,7 @@ Always follow these rules:
 - Time must be in HH:MM format (24-hour) or `null` if none.
 - If task, due date, time, or note are missing, write `null`.
 
-- When users say "today", use {current_date}
+- When users say "today", use today's date from the current information
 - When users say "tomorrow", use the next day's date
 - When users say "next week", calculate the appropriate date
 - If they say "morning", suggest 09:00; "afternoon", suggest 14:00; "evening", suggest 18:00
@@ -45,5 +42,89 @@ Always follow these rules:
 Never add any other text outside the specified format when outputting tasks.
 """
 
-# Keep the old variable for backward compatibility
-system_prompt = get_system_prompt()
\ No newline at end of file
+# Static prompt for the opt-in structured output mode, where the model answers
+# with JSON matching TASK_RESPONSE_SCHEMA instead of the emoji summary
+STRUCTURED_SYSTEM_PROMPT = """
+You are a To-Do app assistant. Your job is to help the user manage tasks clearly and naturally. Understand instructions and convert them into structured actions: add, list, delete, or update tasks.
+
+Always answer with a single JSON object and nothing else:
+
+  {"tasks": [{"action": "add", "task": "Call mom", "duedate": "2025-07-16", "time": "14:00", "note": "Ask about her trip"}], "reply": null}
+
+Always follow these rules:
+- Allowed actions: add, list, delete, update.
+- If user ask for all the tasks, the action should be "list"
+- If the user asks to mark a task as done, use "update" action.
+- If the user say delete, use "delete" action without needed further detail.
+- If the message contains several tasks, return one entry per task in "tasks".
+- "duedate" must be in YYYY-MM-DD format or null if none.
+- "time" must be in HH:MM format (24-hour) or null if none.
+- If task, due date, time, or note are missing, use null.
+- If a task repeats ("every day", "every Monday", "monthly"), set "repeat" to a phrase like "every monday" and "duedate" to the first occurrence; otherwise "repeat" is null.
+
+- When users say "today", use today's date from the current information
+- When users say "tomorrow", use the next day's date
+- When users say "next week", calculate the appropriate date
+- If they say "morning", suggest 09:00; "afternoon", suggest 14:00; "evening", suggest 18:00
+
+- If details are missing, or the user asks for help, return an empty "tasks" list and put a short question or answer in "reply".
+"""
+
+TASK_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "tasks": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "action": {"type": "string"},
+                    "task": {"type": "string", "nullable": True},
+                    "duedate": {"type": "string", "nullable": True},
+                    "time": {"type": "string", "nullable": True},
+                    "note": {"type": "string", "nullable": True},
+                    "repeat": {"type": "string", "nullable": True},
+                },
+                "required": ["action"],
+            },
+        },
+        "reply": {"type": "string", "nullable": True},
+    },
+    "required": ["tasks"],
+}
+
+@functools.lru_cache(maxsize=4)
+def _render_date_context(minute: datetime.datetime) -> str:
+    current_date = minute.strftime("%Y-%m-%d")
+    current_time = minute.strftime("%H:%M")
+    current_day = minute.strftime("%A")
+
+    return f"""Current information:
+- Today's date: {current_date} ({current_day})
+- Current time: {current_time}
+"""
+
+def render_date_context(now: datetime.datetime = None) -> str:
+    """Render the small per-request date/time block for `now` in the user's timezone, memoized per minute"""
+    now = now or datetime.datetime.now()
+    # Keyed on the local wall-clock minute: aware datetimes compare by instant,
+    # which would share one rendering between users in different timezones
+    return _render_date_context(now.replace(second=0, microsecond=0, tzinfo=None))
+
+def get_prompt_messages(now: datetime.datetime = None, structured: bool = False):
+    """System messages for chat APIs: the cacheable static prefix, then the date block"""
+    return [
+        {"role": "system", "content": STRUCTURED_SYSTEM_PROMPT if structured else STATIC_SYSTEM_PROMPT},
+        {"role": "system", "content": render_date_context(now)},
+    ]
+
+def get_system_prompt(now: datetime.datetime = None):
+    """Full system prompt as a single string, rendered for the current time"""
+    return f"{STATIC_SYSTEM_PROMPT}\n{render_date_context(now)}"
+
+def __getattr__(name):
+    # Keep the old variable for backward compatibility, but render it on access
+    # so it never goes stale after midnight
+    if name == "system_prompt":
+        return get_system_prompt()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
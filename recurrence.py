@@ -0,0 +1,259 @@
+import re
+import logging
+import calendar
+import datetime
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+# Repeating tasks store their rule as a subset of iCalendar RRULE:
+#   FREQ=DAILY|WEEKLY|MONTHLY[;INTERVAL=n][;BYDAY=MO,WE][;BYMONTHDAY=15][;COUNT=n][;UNTIL=YYYYMMDD]
+# The task's duedate is the first occurrence (DTSTART) and its duetime applies
+# to every occurrence.
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY")
+WEEKDAY_CODES = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+WEEKDAY_NAMES = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+_DAY_NAME = r"(?:" + "|".join(WEEKDAY_NAMES) + r")s?"
+# Phrases like "every day", "every monday and thursday", "weekdays", "every 2 weeks", "monthly"
+RECURRENCE_PATTERN = re.compile(
+    r"\b(?:(?P<daily>daily|every\s*day|each\s+day)"
+    r"|(?P<weekdays>(?:every|each|on)\s+weekdays?|weekdays)"
+    r"|(?:every|each)\s+(?P<days>" + _DAY_NAME + r"(?:\s*(?:,|and|&)\s*" + _DAY_NAME + r")*)"
+    r"|(?P<weekly>weekly|every\s+week)"
+    r"|(?P<monthly>monthly|every\s+month)"
+    r"|every\s+(?P<count>\d+|other)\s+(?P<unit>days?|weeks?|months?))\b"
+)
+
+
+class RecurrenceRule:
+    """Parsed recurrence rule; occurrences are generated lazily, never stored"""
+
+    __slots__ = ("freq", "interval", "byday", "bymonthday", "count", "until")
+
+    def __init__(self, freq: str, interval: int = 1, byday=(), bymonthday: Optional[int] = None,
+                 count: Optional[int] = None, until: Optional[datetime.date] = None):
+        self.freq = freq
+        self.interval = max(interval, 1)
+        self.byday = tuple(sorted(set(byday)))
+        self.bymonthday = bymonthday
+        self.count = count
+        self.until = until
+
+    @classmethod
+    def parse(cls, text: Optional[str]) -> Optional["RecurrenceRule"]:
+        """Parse an RRULE string (with or without the RRULE: prefix), or None if invalid"""
+        if not text:
+            return None
+        text = text.strip().upper()
+        if text.startswith("RRULE:"):
+            text = text[len("RRULE:"):]
+        try:
+            parts = dict(part.split("=", 1) for part in text.split(";") if part)
+            freq = parts["FREQ"]
+            if freq not in FREQUENCIES:
+                return None
+            byday = [WEEKDAY_CODES.index(code) for code in parts["BYDAY"].split(",")] if "BYDAY" in parts else ()
+            bymonthday = int(parts["BYMONTHDAY"]) if "BYMONTHDAY" in parts else None
+            if bymonthday is not None and not 1 <= bymonthday <= 31:
+                return None
+            until = None
+            if "UNTIL" in parts:
+                until = datetime.datetime.strptime(parts["UNTIL"][:8].replace("-", ""), "%Y%m%d").date()
+            return cls(
+                freq,
+                int(parts.get("INTERVAL", "1")),
+                byday,
+                bymonthday,
+                int(parts["COUNT"]) if "COUNT" in parts else None,
+                until,
+            )
+        except (KeyError, ValueError):
+            return None
+
+    def __str__(self) -> str:
+        parts = [f"FREQ={self.freq}"]
+        if self.interval != 1:
+            parts.append(f"INTERVAL={self.interval}")
+        if self.byday:
+            parts.append("BYDAY=" + ",".join(WEEKDAY_CODES[day] for day in self.byday))
+        if self.bymonthday is not None:
+            parts.append(f"BYMONTHDAY={self.bymonthday}")
+        if self.count is not None:
+            parts.append(f"COUNT={self.count}")
+        if self.until is not None:
+            parts.append(f"UNTIL={self.until:%Y%m%d}")
+        return ";".join(parts)
+
+    def describe(self) -> str:
+        """Short human description, e.g. "every 2 weeks on Mon, Thu" """
+        unit = {"DAILY": "day", "WEEKLY": "week", "MONTHLY": "month"}[self.freq]
+        text = f"every {self.interval} {unit}s" if self.interval > 1 else f"every {unit}"
+        if self.freq == "DAILY" and self.interval == 1:
+            text = "daily"
+        if self.byday:
+            text += " on " + ", ".join(WEEKDAY_NAMES[day][:3].title() for day in self.byday)
+        if self.bymonthday is not None:
+            text += f" on day {self.bymonthday}"
+        if self.until is not None:
+            text += f" until {self.until.isoformat()}"
+        return text
+
+    def _periods(self, dtstart: datetime.date, skip: int) -> Iterator[List[datetime.date]]:
+        """Candidate dates of each period (day, week or month) starting `skip` periods in"""
+        period = skip
+        while True:
+            step = period * self.interval
+            if self.freq == "DAILY":
+                yield [dtstart + datetime.timedelta(days=step)]
+            elif self.freq == "WEEKLY":
+                week_start = dtstart - datetime.timedelta(days=dtstart.weekday()) + datetime.timedelta(weeks=step)
+                yield [week_start + datetime.timedelta(days=day) for day in self.byday or (dtstart.weekday(),)]
+            else:
+                year, month = divmod(dtstart.month - 1 + step, 12)
+                year += dtstart.year
+                if year > datetime.MAXYEAR:
+                    return
+                # Days past the end of a short month fall on its last day
+                day = min(self.bymonthday or dtstart.day, calendar.monthrange(year, month + 1)[1])
+                yield [datetime.date(year, month + 1, day)]
+            period += 1
+
+    def _skip_periods(self, dtstart: datetime.date, start: datetime.date) -> int:
+        """Whole periods that end before `start`; 0 when COUNT needs counting from the first"""
+        if self.count is not None or start <= dtstart:
+            return 0
+        if self.freq == "DAILY":
+            return (start - dtstart).days // self.interval
+        if self.freq == "WEEKLY":
+            return max((start - dtstart).days // 7 - 1, 0) // self.interval
+        months = (start.year - dtstart.year) * 12 + start.month - dtstart.month
+        return max(months - 1, 0) // self.interval
+
+    def occurrences(self, dtstart: datetime.date, start: Optional[datetime.date] = None) -> Iterator[datetime.date]:
+        """Occurrence dates in order, from `start` (default dtstart) on; endless unless COUNT/UNTIL"""
+        start = max(start or dtstart, dtstart)
+        emitted = 0
+        try:
+            for candidates in self._periods(dtstart, self._skip_periods(dtstart, start)):
+                for day in candidates:
+                    if day < dtstart:
+                        continue
+                    if self.until is not None and day > self.until:
+                        return
+                    emitted += 1
+                    if self.count is not None and emitted > self.count:
+                        return
+                    if day >= start:
+                        yield day
+        except OverflowError:
+            return  # Ran past datetime.date.max
+
+    def between(self, dtstart: datetime.date, start: datetime.date, end: datetime.date) -> Iterator[datetime.date]:
+        """Occurrence dates in [start, end]"""
+        for day in self.occurrences(dtstart, start):
+            if day > end:
+                return
+            yield day
+
+    def next_on_or_after(self, dtstart: datetime.date, day: datetime.date, skip: Iterable[datetime.date] = ()) -> Optional[datetime.date]:
+        """First occurrence on or after `day` not in `skip`, or None once the series has ended"""
+        skip = set(skip)
+        for occurrence in self.occurrences(dtstart, day):
+            if occurrence not in skip:
+                return occurrence
+        return None
+
+    def occurs_on(self, dtstart: datetime.date, day: datetime.date) -> bool:
+        return next(self.occurrences(dtstart, day), None) == day
+
+
+def rule_from_match(match: re.Match) -> RecurrenceRule:
+    """Build the rule for a RECURRENCE_PATTERN match"""
+    if match.group("daily"):
+        return RecurrenceRule("DAILY")
+    if match.group("weekdays"):
+        return RecurrenceRule("WEEKLY", byday=range(5))
+    if match.group("days"):
+        days = re.findall("|".join(WEEKDAY_NAMES), match.group("days"))
+        return RecurrenceRule("WEEKLY", byday=[WEEKDAY_NAMES.index(day) for day in days])
+    if match.group("weekly"):
+        return RecurrenceRule("WEEKLY")
+    if match.group("monthly"):
+        return RecurrenceRule("MONTHLY")
+    count = match.group("count")
+    interval = 2 if count == "other" else int(count)
+    freq = {"d": "DAILY", "w": "WEEKLY", "m": "MONTHLY"}[match.group("unit")[0]]
+    return RecurrenceRule(freq, interval)
+
+
+def parse_recurrence(value: Optional[str]) -> Optional[str]:
+    """Normalize an RRULE string or a phrase like "every monday" to a stored rule, or None"""
+    if not value or value.strip().lower() in ("null", "none", "no", "never"):
+        return None
+    rule = RecurrenceRule.parse(value)
+    if rule is None and "FREQ=" not in value.upper():
+        # Also accept a bare "monday" or "2 weeks" as written in an import's repeat column
+        match = RECURRENCE_PATTERN.search(value.lower()) or RECURRENCE_PATTERN.search(f"every {value.lower()}")
+        rule = rule_from_match(match) if match else None
+    return str(rule) if rule is not None else None
+
+
+def first_occurrence(recurrence: str, duedate: Optional[str], duetime: Optional[str], now: datetime.datetime) -> Optional[str]:
+    """First occurrence on or after duedate (default today), as YYYY-MM-DD; the series' stored duedate.
+
+    `now` is the user's local time: an occurrence today whose time has already
+    passed would never be alerted, so the series starts at the next one instead.
+    """
+    rule = RecurrenceRule.parse(recurrence)
+    if rule is None:
+        return duedate
+    today = now.date()
+    try:
+        start = datetime.date.fromisoformat(duedate) if duedate else today
+    except ValueError:
+        start = today  # Unvalidated LLM output such as "every day"
+    occurrence = rule.next_on_or_after(start, start)
+    if occurrence == today and duetime:
+        try:
+            passed = datetime.datetime.strptime(duetime, "%H:%M").time() <= now.time()
+        except ValueError:
+            passed = False
+        if passed:
+            occurrence = rule.next_on_or_after(start, today + datetime.timedelta(days=1))
+    return occurrence.isoformat() if occurrence else duedate
+
+
+def occurrence_row(task, day: datetime.date, due_at: Optional[datetime.datetime] = None) -> dict:
+    """One occurrence of a repeating task, shaped like a tasks row; `occurrence` holds its date"""
+    row = dict(task)
+    row.update(duedate=day, due_at=due_at, occurrence=day, alerted=False, completed=False)
+    return row
+
+
+@lru_cache(maxsize=256)
+def get_zone(name: Optional[str]) -> datetime.tzinfo:
+    """ZoneInfo for an IANA name, falling back to UTC for names this system doesn't know"""
+    try:
+        return ZoneInfo(name or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown timezone {name!r}, using UTC")
+        return datetime.timezone.utc
+
+
+def expand_occurrences(series, start: datetime.datetime, end: datetime.datetime) -> List[dict]:
+    """Occurrences of the given repeating tasks whose due time falls in the (start, end] window"""
+    occurrences = []
+    for task in series:
+        rule = RecurrenceRule.parse(task['recurrence'])
+        if rule is None or task['duedate'] is None or task['duetime'] is None:
+            continue
+        # One bad stored zone must not break the alert scan for every user
+        zone = get_zone(task['timezone'])
+        for day in rule.between(task['duedate'], start.astimezone(zone).date(), end.astimezone(zone).date()):
+            due_at = datetime.datetime.combine(day, task['duetime'], tzinfo=zone)
+            if start < due_at <= end:
+                occurrences.append(occurrence_row(task, day, due_at))
+    return occurrences
@@ -0,0 +1,142 @@
+import os
+import logging
+import random
+import asyncio
+from typing import Callable, FrozenSet, List, Optional
+
+import asyncpg
+
+from dbHandler import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+# Users are split into this many shards (userid mod SCHEDULER_SHARDS); 0 turns sharding off
+SCHEDULER_SHARDS = int(os.environ.get("SCHEDULER_SHARDS", "64"))
+SHARD_REBALANCE_INTERVAL = float(os.environ.get("SHARD_REBALANCE_INTERVAL", "15"))
+# Advisory lock classes: (SHARD_LOCK_CLASS, shard) is held by the shard's owner,
+# (SHARD_MEMBER_LOCK_CLASS, backend pid) by every live instance
+SHARD_LOCK_CLASS = 727002
+SHARD_MEMBER_LOCK_CLASS = 727003
+
+
+def shard_of(user_id: int, shard_count: int = SCHEDULER_SHARDS) -> int:
+    """Shard a user belongs to; matches mod(userid, shard_count) in SQL for Telegram's positive ids"""
+    return user_id % shard_count
+
+
+class ShardOwnership:
+    """Splits alert and reminder work between bot instances using Postgres advisory locks.
+
+    Each instance keeps one dedicated connection holding a membership lock and
+    session-level locks on the shards it owns. Every rebalance it counts the
+    live members and takes or releases shards to reach its fair share. When an
+    instance dies its connection closes, Postgres drops its locks and the
+    remaining instances pick the shards up on their next rebalance.
+    """
+
+    def __init__(
+        self,
+        shard_count: int = SCHEDULER_SHARDS,
+        dsn: Optional[str] = DATABASE_URL,
+        rebalance_interval: float = SHARD_REBALANCE_INTERVAL,
+    ):
+        self.shard_count = shard_count
+        self.dsn = dsn
+        self.rebalance_interval = rebalance_interval
+        self.owned: FrozenSet[int] = frozenset()
+        self._conn: Optional[asyncpg.Connection] = None
+        self._listeners: List[Callable[[FrozenSet[int]], None]] = []
+
+    def owns(self, user_id: int) -> bool:
+        return shard_of(user_id, self.shard_count) in self.owned
+
+    def shards(self) -> List[int]:
+        return sorted(self.owned)
+
+    def add_listener(self, callback: Callable[[FrozenSet[int]], None]):
+        """Register callback(owned shards), called whenever the owned set changes"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _set_owned(self, owned):
+        owned = frozenset(owned)
+        if owned == self.owned:
+            return
+        gained, lost = owned - self.owned, self.owned - owned
+        self.owned = owned
+        logger.info(f"Shard ownership changed: {len(owned)}/{self.shard_count} owned (+{len(gained)} -{len(lost)})")
+        for callback in list(self._listeners):
+            try:
+                callback(owned)
+            except Exception as e:
+                logger.error(f"Shard ownership listener failed: {e}")
+
+    def _on_termination(self, connection):
+        # Postgres released our locks with the session; stop acting as owner at once
+        self._conn = None
+        self._set_owned(())
+
+    async def _connect(self):
+        conn = await asyncpg.connect(self.dsn)
+        conn.add_termination_listener(self._on_termination)
+        await conn.execute('SELECT pg_advisory_lock($1, pg_backend_pid())', SHARD_MEMBER_LOCK_CLASS)
+        self._conn = conn
+
+    async def close(self):
+        """Release every shard by closing the lock connection"""
+        conn, self._conn = self._conn, None
+        self._set_owned(())
+        if conn is not None:
+            try:
+                await conn.close()
+            except Exception as e:
+                logger.error(f"Error closing shard ownership connection: {e}")
+
+    async def rebalance(self):
+        """Take or release shards so this instance holds its fair share"""
+        conn = self._conn
+        members = await conn.fetchval(
+            '''
+            SELECT count(DISTINCT pid) FROM pg_locks
+            WHERE locktype = 'advisory' AND classid = $1 AND objsubid = 2 AND granted
+            ''',
+            SHARD_MEMBER_LOCK_CLASS
+        )
+        target = -(-self.shard_count // max(members, 1))
+
+        owned = set(self.owned)
+        if len(owned) > target:
+            # Hand the surplus back; other instances take it on their next rebalance
+            for shard in sorted(owned)[target:]:
+                await conn.execute('SELECT pg_advisory_unlock($1, $2)', SHARD_LOCK_CLASS, shard)
+                owned.discard(shard)
+        elif len(owned) < target:
+            # Start at a random shard so instances don't all race for the same ones
+            start = random.randrange(self.shard_count)
+            for i in range(self.shard_count):
+                shard = (start + i) % self.shard_count
+                if shard in owned:
+                    continue
+                if await conn.fetchval('SELECT pg_try_advisory_lock($1, $2)', SHARD_LOCK_CLASS, shard):
+                    owned.add(shard)
+                    if len(owned) >= target:
+                        break
+        self._set_owned(owned)
+
+    async def run(self):
+        """Keep the lock connection open and rebalance periodically"""
+        try:
+            while True:
+                try:
+                    if self._conn is None or self._conn.is_closed():
+                        await self._connect()
+                    await self.rebalance()
+                except Exception as e:
+                    logger.error(f"Shard ownership check failed: {e}")
+                    await self.close()
+                await asyncio.sleep(self.rebalance_interval)
+        finally:
+            await self.close()
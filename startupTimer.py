@@ -0,0 +1,49 @@
+import time
+import logging
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Wall-clock duration of each startup phase, plus time to the first reply.
+
+    Times are measured from when this module is first imported, so import it
+    before anything heavy to include module loading in the report.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self.ready_at: Optional[float] = None
+        self.first_reply_at: Optional[float] = None
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def record(self, name: str, since: Optional[float] = None):
+        """Record a phase that ran from `since` (default: the end of the last phase) until now"""
+        if since is None:
+            since = self.started + sum(seconds for _, seconds in self.phases)
+        self.phases.append((name, time.perf_counter() - since))
+
+    def ready(self):
+        """Mark the bot as accepting updates and log the per-phase report"""
+        self.ready_at = time.perf_counter()
+        report = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases)
+        logger.info(f"Startup took {self.ready_at - self.started:.2f}s ({report})")
+
+    def first_reply(self):
+        """Log the time from process start to the first handled message, once"""
+        if self.first_reply_at is None:
+            self.first_reply_at = time.perf_counter()
+            logger.info(f"First reply {self.first_reply_at - self.started:.2f}s after start")
+
+
+startup_timer = StartupTimer()
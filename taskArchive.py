@@ -0,0 +1,145 @@
+import os
+import re
+import asyncio
+import logging
+import datetime
+from typing import List
+
+from dbHandler import acquire, dispatch_task_event, TASK_EVENT_COLUMNS
+from metrics import TASKS_ARCHIVED
+
+logger = logging.getLogger(__name__)
+
+# Completed tasks leave the hot table this long after completion, open one-off
+# tasks this long after their due date; tasks without a date never expire
+ARCHIVE_COMPLETED_AFTER_DAYS = float(os.environ.get("ARCHIVE_COMPLETED_AFTER_DAYS", "1"))
+ARCHIVE_EXPIRED_AFTER_DAYS = int(os.environ.get("ARCHIVE_EXPIRED_AFTER_DAYS", "30"))
+ARCHIVE_INTERVAL = float(os.environ.get("ARCHIVE_INTERVAL", "3600"))
+# Each batch is one short transaction; the pause between batches leaves room for user traffic
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_BATCH_PAUSE = float(os.environ.get("ARCHIVE_BATCH_PAUSE", "0.2"))
+# Monthly archive partitions older than this are dropped; 0 keeps them forever
+ARCHIVE_RETENTION_MONTHS = int(os.environ.get("ARCHIVE_RETENTION_MONTHS", "0"))
+# Partitions are created this many months ahead so inserts never lack one
+ARCHIVE_PARTITIONS_AHEAD = 1
+# Advisory lock key so only one bot instance archives at a time
+ARCHIVE_LOCK_KEY = 727004
+
+ARCHIVE_PARTITION_PATTERN = re.compile(r"^tasks_archive_(\d{4})(\d{2})$")
+ARCHIVE_COLUMNS = (
+    "id, action, task, duedate, duetime, note, userid, alerted, completed, "
+    "completed_at, due_at, timezone, recurrence"
+)
+
+# Moves one batch and returns the moved rows. SKIP LOCKED leaves rows a user is
+# updating right now for the next batch instead of waiting on them.
+ARCHIVE_BATCH_SQL = f'''
+WITH moved AS (
+    DELETE FROM tasks
+    WHERE id IN (
+        SELECT id FROM tasks
+        WHERE (completed AND coalesce(completed_at, '-infinity') < $1)
+        OR (NOT completed AND recurrence IS NULL AND duedate < $2)
+        OR action IS DISTINCT FROM 'add'
+        LIMIT $3
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING {ARCHIVE_COLUMNS}
+), archived AS (
+    INSERT INTO tasks_archive ({ARCHIVE_COLUMNS})
+    SELECT {ARCHIVE_COLUMNS} FROM moved
+)
+SELECT {TASK_EVENT_COLUMNS} FROM moved
+'''
+
+
+def add_months(day: datetime.date, months: int) -> datetime.date:
+    """First day of the month `months` after the month of `day`"""
+    year, month = divmod(day.month - 1 + months, 12)
+    return datetime.date(day.year + year, month + 1, 1)
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"tasks_archive_{month:%Y%m}"
+
+
+async def ensure_archive_partitions(conn, today: datetime.date, ahead: int = ARCHIVE_PARTITIONS_AHEAD):
+    """Create the archive partitions for this month and the next `ahead` months"""
+    for offset in range(ahead + 1):
+        month = add_months(today, offset)
+        await conn.execute(
+            f'''
+            CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF tasks_archive
+            FOR VALUES FROM ('{month.isoformat()} 00:00+00') TO ('{add_months(month, 1).isoformat()} 00:00+00')
+            '''
+        )
+
+
+async def drop_archive_partitions(conn, today: datetime.date, retention_months: int = ARCHIVE_RETENTION_MONTHS) -> List[str]:
+    """Drop whole archive partitions whose month ended more than `retention_months` ago"""
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(today, -retention_months)
+    names = await conn.fetch(
+        '''
+        SELECT child.relname AS name FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = 'tasks_archive'::regclass
+        '''
+    )
+    dropped = []
+    for row in names:
+        match = ARCHIVE_PARTITION_PATTERN.match(row['name'])
+        if match and datetime.date(int(match.group(1)), int(match.group(2)), 1) < cutoff:
+            await conn.execute(f"DROP TABLE IF EXISTS {row['name']}")
+            dropped.append(row['name'])
+    return dropped
+
+
+async def archive_tasks(
+    now: datetime.datetime,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    batch_pause: float = ARCHIVE_BATCH_PAUSE,
+) -> int:
+    """Move completed and expired tasks into the archive in batches; returns how many were moved.
+
+    Returns 0 without doing anything when another instance is archiving.
+    """
+    completed_before = now - datetime.timedelta(days=ARCHIVE_COMPLETED_AFTER_DAYS)
+    # A day of slack so a task is never expired before its due date has passed everywhere
+    expired_before = (now - datetime.timedelta(days=ARCHIVE_EXPIRED_AFTER_DAYS + 1)).date()
+    moved_count = 0
+    async with acquire('archive_tasks') as conn:
+        if not await conn.fetchval('SELECT pg_try_advisory_lock($1)', ARCHIVE_LOCK_KEY):
+            logger.info("Task archival is running on another instance, skipping")
+            return 0
+        try:
+            await ensure_archive_partitions(conn, now.date())
+            while True:
+                moved = await conn.fetch(ARCHIVE_BATCH_SQL, completed_before, expired_before, batch_size)
+                moved_count += len(moved)
+                TASKS_ARCHIVED.inc(len(moved))
+                # The rows are gone from the hot table as far as caches and the scheduler are concerned
+                for task in moved:
+                    dispatch_task_event('delete', task)
+                if len(moved) < batch_size:
+                    break
+                await asyncio.sleep(batch_pause)
+            dropped = await drop_archive_partitions(conn, now.date())
+            if dropped:
+                logger.info(f"Dropped archive partitions: {', '.join(dropped)}")
+        finally:
+            await conn.execute('SELECT pg_advisory_unlock($1)', ARCHIVE_LOCK_KEY)
+    return moved_count
+
+
+async def run_task_archival(interval: float = ARCHIVE_INTERVAL):
+    """Background loop archiving completed and expired tasks every `interval` seconds"""
+    while True:
+        try:
+            moved = await archive_tasks(datetime.datetime.now(datetime.timezone.utc))
+            if moved:
+                logger.info(f"Archived {moved} completed or expired tasks")
+        except Exception as e:
+            logger.error(f"Error in task archival: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,145 @@
+import os
+import datetime
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# Bounds for the per-user open-task cache
+TASK_CACHE_MAX_USERS = int(os.getenv('TASK_CACHE_MAX_USERS', '10000'))
+TASK_CACHE_MAX_TASKS = int(os.getenv('TASK_CACHE_MAX_TASKS', '200000'))
+
+
+class CachedTask:
+    """Compact copy of one open task; supports task['field'] like an asyncpg Record"""
+
+    __slots__ = ('id', 'task', 'note', 'userid', 'duedate', 'duetime', 'due_at', 'alerted', 'completed', 'timezone', 'recurrence')
+
+    def __init__(self, row):
+        for field in self.__slots__:
+            setattr(self, field, row[field])
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return self.__slots__
+
+    def sort_key(self):
+        # Same order as the SQL: duedate then duetime, NULLs last, then id
+        return (
+            self.duedate is None, self.duedate or datetime.date.min,
+            self.duetime is None, self.duetime or datetime.time.min,
+            self.id,
+        )
+
+    def __repr__(self):
+        return f"CachedTask(id={self.id!r}, task={self.task!r})"
+
+
+class UserTaskCache:
+    """LRU cache of each user's open tasks, kept current by task events.
+
+    Writes patch the cached list in place instead of dropping it. Loads that
+    raced with a write are discarded using a per-user version counter, so a
+    slow read can never overwrite a newer patch.
+    """
+
+    def __init__(self, max_users: int = TASK_CACHE_MAX_USERS, max_tasks: int = TASK_CACHE_MAX_TASKS):
+        self.max_users = max_users
+        self.max_tasks = max_tasks
+        self.hits = 0
+        self.misses = 0
+        self._lists: "OrderedDict[int, List[CachedTask]]" = OrderedDict()
+        # Per-user version of the last write, taken from a global clock. Users
+        # without an entry report the floor, raised whenever the map is pruned.
+        self._versions: Dict[int, int] = {}
+        self._clock = 0
+        self._floor = 0
+        self._task_count = 0
+
+    def get(self, user_id: int) -> Optional[List[CachedTask]]:
+        tasks = self._lists.get(user_id)
+        if tasks is None:
+            self.misses += 1
+            return None
+        self._lists.move_to_end(user_id)
+        self.hits += 1
+        return list(tasks)
+
+    def version(self, user_id: int) -> int:
+        return self._versions.get(user_id, self._floor)
+
+    def _bump(self, user_id: int):
+        self._clock += 1
+        self._versions[user_id] = self._clock
+
+    def put(self, user_id: int, rows, version: int) -> List[CachedTask]:
+        """Cache rows loaded when the user's version was `version`; returns the compact list"""
+        tasks = [CachedTask(row) for row in rows]
+        if version != self.version(user_id):
+            return tasks  # A write landed while loading; don't cache a stale list
+        self._drop(user_id)
+        self._lists[user_id] = tasks
+        self._task_count += len(tasks)
+        self._evict()
+        return list(tasks)
+
+    def invalidate(self, user_id: int):
+        self._bump(user_id)
+        self._drop(user_id)
+
+    def clear(self):
+        self._lists.clear()
+        self._task_count = 0
+        self._versions.clear()
+        self._clock += 1
+        self._floor = self._clock
+
+    def _drop(self, user_id: int):
+        tasks = self._lists.pop(user_id, None)
+        if tasks is not None:
+            self._task_count -= len(tasks)
+
+    def _evict(self):
+        while self._lists and (len(self._lists) > self.max_users or self._task_count > self.max_tasks):
+            user_id, tasks = self._lists.popitem(last=False)
+            self._task_count -= len(tasks)
+        # Versions only matter while a load may be in flight; keep the map bounded
+        if len(self._versions) > 2 * self.max_users:
+            self._versions.clear()
+            self._clock += 1
+            self._floor = self._clock
+
+    def _patch(self, task, deleted: bool):
+        user_id = task['userid']
+        self._bump(user_id)
+        tasks = self._lists.get(user_id)
+        if tasks is None:
+            return
+        remaining = [cached for cached in tasks if cached.id != task['id']]
+        self._task_count -= len(tasks) - len(remaining)
+        self._lists[user_id] = remaining
+        if not deleted and not task['completed'] and task.get('action', 'add') == 'add':
+            remaining.append(CachedTask(task))
+            remaining.sort(key=CachedTask.sort_key)
+            self._task_count += 1
+            self._evict()
+
+    def on_task_event(self, event: str, task):
+        """dbHandler task listener patching the affected user's cached list"""
+        if event == 'resync':
+            self.clear()
+        elif event == 'occurrence':
+            return  # One occurrence of a repeating task; the series row is unchanged
+        else:
+            self._patch(task, deleted=(event == 'delete'))
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._lists),
+            "tasks": self._task_count,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,120 @@
+import os
+import re
+import csv
+import datetime
+from typing import List, Optional, Tuple
+
+from intentParser import parse_task_line
+from recurrence import parse_recurrence
+from taskRecord import TaskRecord
+
+# Upper bounds for one /import, so a single upload can't monopolise the database
+IMPORT_MAX_TASKS = int(os.environ.get("IMPORT_MAX_TASKS", "1000"))
+IMPORT_MAX_BYTES = int(os.environ.get("IMPORT_MAX_BYTES", str(512 * 1024)))
+
+# Header names accepted for each CSV column
+CSV_COLUMNS = {
+    "task": ("task", "title", "name"),
+    "duedate": ("duedate", "due date", "due_date", "date", "due"),
+    "duetime": ("duetime", "due time", "due_time", "time"),
+    "note": ("note", "notes", "description"),
+    "repeat": ("repeat", "repeats", "recurrence", "every"),
+}
+# List markers stripped from plain-text lines: "-", "*", "•", "1.", "2)", "[ ]"
+BULLET_PATTERN = re.compile(r"^\s*(?:[-*•]|\d+[.)]|\[[ xX]?\])\s*")
+
+
+def _csv_header(line: str) -> Optional[dict]:
+    """Map CSV columns to field names if the line is a header naming a task column"""
+    names = [name.strip().lower() for name in next(csv.reader([line]), [])]
+    mapping = {}
+    for field, aliases in CSV_COLUMNS.items():
+        for index, name in enumerate(names):
+            if name in aliases:
+                mapping[field] = index
+                break
+    return mapping if "task" in mapping else None
+
+
+def _valid_date(value: str) -> Optional[str]:
+    try:
+        return datetime.date.fromisoformat(value).isoformat()
+    except ValueError:
+        return None
+
+
+def _valid_time(value: str) -> Optional[str]:
+    try:
+        return datetime.datetime.strptime(value, "%H:%M").strftime("%H:%M")
+    except ValueError:
+        return None
+
+
+def _parse_csv(lines: List[str], mapping: dict) -> Tuple[List[TaskRecord], List[str]]:
+    records, errors = [], []
+    for line_number, row in enumerate(csv.reader(lines), 2):
+        def column(field):
+            index = mapping.get(field)
+            value = row[index].strip() if index is not None and index < len(row) else ""
+            return value or None
+
+        task = column("task")
+        if not task:
+            if any(cell.strip() for cell in row):
+                errors.append(f"line {line_number}: missing task")
+            continue
+        duedate, duetime = column("duedate"), column("duetime")
+        if duedate:
+            duedate = _valid_date(duedate)
+            if duedate is None:
+                errors.append(f"line {line_number}: bad date {column('duedate')!r}, expected YYYY-MM-DD")
+                continue
+        if duetime:
+            duetime = _valid_time(duetime)
+            if duetime is None:
+                errors.append(f"line {line_number}: bad time {column('duetime')!r}, expected HH:MM")
+                continue
+        recurrence = parse_recurrence(column("repeat"))
+        if column("repeat") and recurrence is None:
+            errors.append(f"line {line_number}: bad repeat {column('repeat')!r}, expected e.g. daily or every monday")
+            continue
+        records.append(TaskRecord("add", task, duedate, duetime, column("note"), recurrence))
+    return records, errors
+
+
+def _parse_plain(lines: List[str], now: datetime.datetime) -> Tuple[List[TaskRecord], List[str]]:
+    records, errors = [], []
+    for line_number, line in enumerate(lines, 1):
+        line = BULLET_PATTERN.sub("", line).strip()
+        if not line:
+            continue
+        parsed = parse_task_line(line, now)
+        if parsed is None:
+            errors.append(f"line {line_number}: no task found")
+            continue
+        records.append(TaskRecord(*parsed))
+    return records, errors
+
+
+def parse_import(text: str, now: Optional[datetime.datetime] = None) -> Tuple[List[TaskRecord], List[str]]:
+    """Parse an import list into add records and per-line error messages.
+
+    A first line naming a task column (task,date,time,note,repeat) makes it
+    CSV; anything else is one "task [date] [time] [repeat]" per line.
+    """
+    lines = text.splitlines()
+    while lines and not lines[0].strip():
+        lines.pop(0)
+    if not lines:
+        return [], []
+
+    mapping = _csv_header(lines[0])
+    if mapping is not None:
+        records, errors = _parse_csv(lines[1:], mapping)
+    else:
+        records, errors = _parse_plain(lines, now or datetime.datetime.now())
+
+    if len(records) > IMPORT_MAX_TASKS:
+        errors.append(f"only the first {IMPORT_MAX_TASKS} tasks were imported")
+        records = records[:IMPORT_MAX_TASKS]
+    return records, errors
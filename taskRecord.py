@@ -0,0 +1,122 @@
+import re
+import json
+import datetime
+from typing import List, Optional, Tuple
+
+from recurrence import parse_recurrence
+
+ALLOWED_ACTIONS = {"add", "list", "update", "delete"}
+# Synonyms the model sometimes returns for the allowed actions
+ACTION_ALIASES = {"done": "update", "complete": "update", "mark done": "update", "remove": "delete"}
+DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+TIME_PATTERN = re.compile(r"^([01]?\d|2[0-3]):([0-5]\d)$")
+
+
+class TaskRecord:
+    """One task extracted from a message, in the same field order as parse_ai_response.
+
+    recurrence is the stored rule (see recurrence.py) for repeating tasks, else None.
+    """
+
+    __slots__ = ("action", "task", "duedate", "duetime", "note", "recurrence")
+
+    def __init__(self, action: str, task: Optional[str] = None, duedate: Optional[str] = None,
+                 duetime: Optional[str] = None, note: Optional[str] = None, recurrence: Optional[str] = None):
+        self.action = action
+        self.task = task
+        self.duedate = duedate
+        self.duetime = duetime
+        self.note = note
+        self.recurrence = recurrence
+
+    def as_tuple(self) -> Tuple[Optional[str], Optional[str], Optional[str], Optional[str], Optional[str]]:
+        return self.action, self.task, self.duedate, self.duetime, self.note
+
+    def as_row(self) -> Tuple[Optional[str], ...]:
+        """as_tuple plus the recurrence rule, as taken by insert_tasks"""
+        return self.as_tuple() + (self.recurrence,)
+
+    def __eq__(self, other):
+        return isinstance(other, TaskRecord) and self.as_row() == other.as_row()
+
+    def __repr__(self):
+        return f"TaskRecord{self.as_row()!r}"
+
+
+def _clean_string(value) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if not value or value.lower() == "null":
+        return None
+    return value
+
+
+def _clean_date(value) -> Optional[str]:
+    value = _clean_string(value)
+    if value is None or not DATE_PATTERN.match(value):
+        return None
+    try:
+        datetime.date.fromisoformat(value)
+    except ValueError:
+        return None
+    return value
+
+
+def _clean_time(value) -> Optional[str]:
+    value = _clean_string(value)
+    if value is None:
+        return None
+    match = TIME_PATTERN.match(value)
+    if not match:
+        return None
+    return f"{int(match.group(1)):02d}:{match.group(2)}"
+
+
+def normalize_action(value) -> Optional[str]:
+    """Map the model's action onto one of the allowed actions, or None"""
+    value = _clean_string(value)
+    if value is None:
+        return None
+    value = value.lower()
+    value = ACTION_ALIASES.get(value, value)
+    return value if value in ALLOWED_ACTIONS else None
+
+
+def parse_task_records(response: str) -> Tuple[Optional[List[TaskRecord]], Optional[str]]:
+    """Validate a structured JSON response in one pass.
+
+    Returns (records, reply). records is None when the response is not valid
+    JSON in the expected shape; invalid individual fields are dropped to None
+    and entries without a usable action are skipped.
+    """
+    try:
+        payload = json.loads(response)
+    except (TypeError, ValueError):
+        return None, None
+    if not isinstance(payload, dict):
+        return None, None
+
+    items = payload.get("tasks")
+    if items is None:
+        # Accept a bare single task object as well
+        items = [payload] if "action" in payload else []
+    if not isinstance(items, list):
+        return None, None
+
+    records = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        action = normalize_action(item.get("action"))
+        if action is None:
+            continue
+        records.append(TaskRecord(
+            action,
+            _clean_string(item.get("task")),
+            _clean_date(item.get("duedate")),
+            _clean_time(item.get("time", item.get("duetime"))),
+            _clean_string(item.get("note")),
+            parse_recurrence(_clean_string(item.get("repeat"))),
+        ))
+    return records, _clean_string(payload.get("reply"))
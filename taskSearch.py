@@ -0,0 +1,79 @@
+import os
+import re
+from difflib import SequenceMatcher
+from typing import List, Optional, Tuple
+
+# Scores run from 0 (unrelated) to 1 (same name). A match is applied without
+# asking when it scores at least TASK_MATCH_THRESHOLD, beats the runner-up by
+# TASK_MATCH_MARGIN, and the query is at least TASK_MATCH_MIN_QUERY_LENGTH
+# characters of whole words from the name; otherwise the user picks from the
+# top matches. Deletes are only applied without asking on an exact name.
+TASK_MATCH_THRESHOLD = float(os.environ.get("TASK_MATCH_THRESHOLD", "0.75"))
+TASK_MATCH_MARGIN = float(os.environ.get("TASK_MATCH_MARGIN", "0.1"))
+TASK_MATCH_MIN_QUERY_LENGTH = int(os.environ.get("TASK_MATCH_MIN_QUERY_LENGTH", "4"))
+TASK_MATCH_MIN_SCORE = float(os.environ.get("TASK_MATCH_MIN_SCORE", "0.6"))
+TASK_SEARCH_LIMIT = int(os.environ.get("TASK_SEARCH_LIMIT", "5"))
+# Matching part of a longer name ("dentist" in "dentist appointment") scores a little below a full match
+PARTIAL_MATCH_WEIGHT = 0.95
+# Words in a spoken reference ("the dentist task") that are not part of the task's name
+FILLER_WORDS = re.compile(r"^(?:the|my|a|an)\s+|\s+(?:task|todo|item)$")
+# Words a query may add without naming a different task ("pay the rent" for "pay rent")
+STOP_WORDS = {"the", "my", "a", "an"}
+
+RankedTasks = List[Tuple[float, object]]
+
+
+def _normalize(text: Optional[str]) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", (text or "").lower())).strip()
+
+
+def _normalize_query(query: Optional[str]) -> str:
+    return FILLER_WORDS.sub("", _normalize(query))
+
+
+def match_score(query: str, name: str) -> float:
+    """How well `query` names the task `name`, from 0 to 1"""
+    query, name = _normalize_query(query), _normalize(name)
+    if not query or not name:
+        return 0.0
+    if query == name:
+        return 1.0
+    score = SequenceMatcher(None, query, name).ratio()
+    # Compare against every run of as many words as the query has
+    words = name.split()
+    size = len(query.split())
+    for start in range(max(len(words) - size + 1, 1)):
+        window = " ".join(words[start:start + size])
+        score = max(score, SequenceMatcher(None, query, window).ratio() * PARTIAL_MATCH_WEIGHT)
+    return score
+
+
+def rank_tasks(tasks, query: str, limit: int = TASK_SEARCH_LIMIT) -> RankedTasks:
+    """The `limit` best (score, task) matches for `query`, best first, above TASK_MATCH_MIN_SCORE"""
+    ranked = [(match_score(query, task['task']), task) for task in tasks]
+    ranked = [entry for entry in ranked if entry[0] >= TASK_MATCH_MIN_SCORE]
+    ranked.sort(key=lambda entry: entry[0], reverse=True)
+    return ranked[:limit]
+
+
+def whole_word_match(query: str, name: str) -> bool:
+    """Whether every word of `query`, bar STOP_WORDS, is a whole word of `name`"""
+    words = set(_normalize_query(query).split()) - STOP_WORDS
+    return bool(words) and words <= set(_normalize(name).split())
+
+
+def confident_match(ranked: RankedTasks, query: str, exact: bool = False):
+    """The single task `ranked` clearly points at, or None if there is no match or it is ambiguous.
+
+    With exact, only a task named exactly `query` counts.
+    """
+    if not ranked or ranked[0][0] < TASK_MATCH_THRESHOLD:
+        return None
+    if len(ranked) > 1 and ranked[0][0] - ranked[1][0] < TASK_MATCH_MARGIN:
+        return None
+    score, task = ranked[0]
+    if exact:
+        return task if score == 1.0 else None
+    if len(_normalize_query(query)) < TASK_MATCH_MIN_QUERY_LENGTH or not whole_word_match(query, task['task']):
+        return None
+    return task
@@ -0,0 +1,129 @@
+import os
+from typing import List, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from recurrence import RecurrenceRule
+
+# Telegram rejects messages longer than this many characters
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Long task names and notes are cut so a single task can't blow the limit
+MAX_TASK_TEXT_LENGTH = 300
+MAX_BUTTON_LABEL_LENGTH = 48
+SELECTION_PAGE_SIZE = int(os.environ.get("SELECTION_PAGE_SIZE", "8"))
+
+SELECTION_PROMPTS = {
+    'done': "📋 Which task would you like to mark as completed?",
+    'delete': "🗑️ Which task would you like to delete?\n⚠️ This action cannot be undone.",
+}
+
+
+def truncate(text: Optional[str], limit: int) -> str:
+    text = text or ""
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def format_due(task) -> str:
+    """Return ' (📅 date at time)' for a task with a due date, else ''"""
+    if not task['duedate']:
+        return ""
+    due = f" (📅 {task['duedate']}"
+    if task['duetime']:
+        due += f" at {task['duetime']}"
+    return due + ")"
+
+
+def chunk_lines(lines: List[str], limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """Join lines into as few messages as possible, each at most `limit` characters"""
+    chunks = []
+    current = []
+    size = 0
+    for line in lines:
+        while len(line) > limit:
+            # A single oversized line gets a message (or several) of its own
+            if current:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            chunks.append(line[:limit])
+            line = line[limit:]
+        added = len(line) + (1 if current else 0)
+        if size + added > limit:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+            added = len(line)
+        current.append(line)
+        size += added
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def format_task_list(tasks) -> List[str]:
+    """Render the 'list' view as one or more messages within Telegram's size limit"""
+    if not tasks:
+        return ["📋 You have no upcoming tasks!"]
+
+    lines = [f"📋 Your Tasks ({len(tasks)} total):", ""]
+    for i, task in enumerate(tasks, 1):
+        lines.append(f"{i}. 📝 {truncate(task['task'], MAX_TASK_TEXT_LENGTH)}")
+        lines.append("    ✅ Completed" if task['completed'] else "    ⏳ Incomplete")
+        if task['duedate']:
+            due = f"    📅 {task['duedate']}"
+            if task['duetime']:
+                due += f" at {task['duetime']}"
+            lines.append(due)
+        rule = RecurrenceRule.parse(task.get('recurrence'))
+        if rule is not None:
+            lines.append(f"    🔁 {rule.describe()}")
+        if task['note']:
+            lines.append(f"    📄 {truncate(task['note'], MAX_TASK_TEXT_LENGTH)}")
+        lines.append("")
+    return chunk_lines(lines)
+
+
+def format_task_history(tasks) -> List[str]:
+    """Render the /history view; tasks archived without being completed show as expired"""
+    if not tasks:
+        return ["🗂️ You have no finished tasks yet."]
+
+    lines = [f"🗂️ Recently finished ({len(tasks)}):", ""]
+    for task in tasks:
+        status = "✅" if task['completed'] else "⌛ Expired:"
+        lines.append(f"{status} {truncate(task['task'], MAX_TASK_TEXT_LENGTH)}{format_due(task)}")
+    return chunk_lines(lines)
+
+
+def build_selection_page(
+    action: str, tasks, has_more: bool, offset: int, after_id: Optional[int] = None
+) -> Tuple[str, InlineKeyboardMarkup]:
+    """Text and inline keyboard for one page of the done/delete selection flow.
+
+    `after_id` is the next page's cursor, by default the last task shown.
+
+    Callback data only carries the action and task ids:
+      sel:<action>:<task id>            pick a task
+      page:<action>:<after id>:<offset> next page (after id empty for the first)
+      cancel                            close the selection
+    """
+    lines = [SELECTION_PROMPTS[action], ""]
+    buttons = []
+    for i, task in enumerate(tasks, offset + 1):
+        lines.append(f"{i}. 📝 {truncate(task['task'], MAX_TASK_TEXT_LENGTH)}{format_due(task)}")
+        label = f"{i}. {truncate(task['task'], MAX_BUTTON_LABEL_LENGTH)}"
+        buttons.append([InlineKeyboardButton(label, callback_data=f"sel:{action}:{task['id']}")])
+    lines.append("")
+    lines.append("Tap a task, or reply with its number.")
+
+    navigation = []
+    if offset:
+        navigation.append(InlineKeyboardButton("⏮ First", callback_data=f"page:{action}::0"))
+    if has_more:
+        next_offset = offset + len(tasks)
+        cursor = after_id if after_id is not None else tasks[-1]['id']
+        navigation.append(InlineKeyboardButton("Next ▶", callback_data=f"page:{action}:{cursor}:{next_offset}"))
+    navigation.append(InlineKeyboardButton("✖ Cancel", callback_data="cancel"))
+    buttons.append(navigation)
+
+    # Page size and truncation keep this far below the limit; trim defensively anyway
+    text = truncate("\n".join(lines), TELEGRAM_MESSAGE_LIMIT)
+    return text, InlineKeyboardMarkup(buttons)
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# The bot's modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def task_row(task_id, user_id=1, duedate=None, duetime=None, completed=False, task=None, recurrence=None):
+    """A tasks row as the data-access functions return it"""
+    return {
+        'id': task_id, 'task': task or f"task {task_id}", 'note': None, 'userid': user_id,
+        'duedate': duedate, 'duetime': duetime, 'due_at': None, 'alerted': False,
+        'completed': completed, 'timezone': 'UTC', 'recurrence': recurrence,
+    }
+
+
+@pytest.fixture
+def row():
+    """Factory for tasks rows: row(task_id, user_id=1, duedate=None, ...)"""
+    return task_row
@@ -0,0 +1,76 @@
+import asyncio
+import datetime
+
+import pytest
+
+import aiHandler
+from llmAdmission import AdmissionController
+from taskRecord import TaskRecord
+
+
+@pytest.mark.parametrize("text, relative", [
+    ("remind me in 2 hours to call", True),
+    ("check the oven in 30 minutes", True),
+    ("call mom tonight", True),
+    ("buy milk tomorrow", False),
+    ("snowboard trip on friday", False),
+])
+def test_is_time_relative(text, relative):
+    assert aiHandler.is_time_relative(text) is relative
+
+
+def test_time_relative_replies_are_not_cached(monkeypatch):
+    monkeypatch.setattr(aiHandler, "_response_cache", aiHandler.ResponseCache(db_path=None))
+    today = datetime.date(2026, 10, 18)
+    records = [TaskRecord("add", "call", "2026-10-18", "11:00", None)]
+
+    async def run():
+        await aiHandler.cache_ai_response("call in 2 hours", "reply", records, today)
+        await aiHandler.cache_ai_response("call tomorrow", "reply", records, today)
+        return (
+            await aiHandler.get_cached_ai_response("call in 2 hours", today),
+            await aiHandler.get_cached_ai_response("call tomorrow", today),
+        )
+
+    relative, absolute = asyncio.run(run())
+    assert relative is None
+    assert absolute is not None and absolute[0] == "reply"
+
+
+class CountingRouter:
+    def __init__(self):
+        self.calls = []
+
+    async def complete(self, text, now):
+        self.calls.append(now)
+        await asyncio.sleep(0.01)
+        return f"{text} at {now:%H:%M}"
+
+
+def test_only_requests_with_the_same_prompt_are_merged(monkeypatch):
+    router = CountingRouter()
+    monkeypatch.setattr(aiHandler, "_llm_router", router)
+    monkeypatch.setattr(aiHandler, "_admission", AdmissionController(user_rate=0, global_rate=0))
+    morning = datetime.datetime(2026, 10, 18, 9, 0)
+    later = datetime.datetime(2026, 10, 18, 15, 30)
+
+    async def run():
+        return await asyncio.gather(
+            aiHandler.get_ai_response("call in 2 hours", morning, 1),
+            aiHandler.get_ai_response("call in 2 hours", morning, 2),
+            aiHandler.get_ai_response("call in 2 hours", later, 3),
+        )
+
+    assert asyncio.run(run()) == ["call in 2 hours at 09:00"] * 2 + ["call in 2 hours at 15:30"]
+    assert router.calls == [morning, later]
+
+
+@pytest.mark.parametrize("response, result", [
+    ("👨‍💻 Action: add\n📝 Task: gym", "ok"),
+    ("What time should I remind you?", "reply"),
+])
+def test_clarifying_questions_are_not_parse_failures(response, result):
+    before = aiHandler.get_parse_metrics()
+    asyncio.run(aiHandler.parse_ai_tasks(response))
+    after = aiHandler.get_parse_metrics()
+    assert {key for key in after if after[key] != before[key]} == {f"text_{result}"}
@@ -0,0 +1,161 @@
+import asyncio
+import datetime
+
+import pytest
+
+import alertScheduler
+from alertScheduler import AlertScheduler
+
+UTC = datetime.timezone.utc
+NOW = datetime.datetime(2026, 10, 18, 12, 0, tzinfo=UTC)
+HOUR = datetime.timedelta(hours=1)
+LEAD = 2 * HOUR
+
+
+class FakeClock:
+    def __init__(self, now=NOW):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeOwnership:
+    shard_count = 4
+
+    def __init__(self, users):
+        self.users = set(users)
+        self.owned = {0}
+
+    def owns(self, user_id):
+        return user_id in self.users
+
+    def shards(self):
+        return sorted(self.owned)
+
+
+def task(task_id, due_at, user_id=1, **fields):
+    row = {
+        'id': task_id, 'task': f"task {task_id}", 'note': None, 'userid': user_id,
+        'duedate': due_at.date(), 'duetime': due_at.time(), 'due_at': due_at,
+        'alerted': False, 'completed': False, 'timezone': 'UTC', 'recurrence': None,
+    }
+    row.update(fields)
+    return row
+
+
+@pytest.fixture
+def due_tasks(monkeypatch):
+    """The rows get_tasks_due_between returns, and the windows it was asked for"""
+    rows, windows = [], []
+
+    async def get_tasks_due_between(start, end, shards=None, shard_count=1):
+        windows.append((start, end, shards))
+        return [row for row in rows if start < row['due_at'] <= end]
+
+    monkeypatch.setattr(alertScheduler, "get_tasks_due_between", get_tasks_due_between)
+    return rows, windows
+
+
+def ids(tasks):
+    return [row['id'] for row in tasks]
+
+
+def make_scheduler(clock, ownership=None):
+    async def send_alerts(tasks):
+        pass
+
+    return AlertScheduler(send_alerts, lead_time=LEAD, horizon=6 * HOUR, ownership=ownership, clock=clock)
+
+
+def test_schedule_update_unschedule(due_tasks):
+    rows, windows = due_tasks
+    rows.append(task(1, NOW + 3 * HOUR))
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    assert asyncio.run(scheduler.load_window(NOW))
+    assert windows == [(NOW, NOW + 8 * HOUR, None)]
+    assert len(scheduler) == 1
+    assert scheduler._pop_due(NOW) == []
+
+    # Moved an hour later: the old heap entry goes stale and is skipped
+    scheduler.on_task_event('update', task(1, NOW + 4 * HOUR))
+    assert len(scheduler) == 1
+    assert scheduler._pop_due(NOW + HOUR) == []
+    fired = scheduler._pop_due(NOW + 2 * HOUR)
+    assert ids(fired) == [1] and fired[0]['due_at'] == NOW + 4 * HOUR
+    assert scheduler._pop_due(NOW + 3 * HOUR) == []
+
+    # Completed before its alert fires
+    scheduler.on_task_event('update', task(2, NOW + 5 * HOUR))
+    assert len(scheduler) == 1
+    scheduler.on_task_event('update', task(2, NOW + 5 * HOUR, completed=True))
+    assert len(scheduler) == 0
+    assert scheduler._pop_due(NOW + 8 * HOUR) == []
+
+
+def test_only_tasks_inside_the_loaded_window_are_kept(due_tasks):
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    # Nothing is scheduled before the first window load
+    scheduler.on_task_event('insert', task(1, NOW + HOUR))
+    assert len(scheduler) == 0
+    asyncio.run(scheduler.load_window(NOW))
+    scheduler.on_task_event('insert', task(2, NOW + 9 * HOUR))
+    scheduler.on_task_event('insert', task(3, NOW - HOUR))
+    scheduler.on_task_event('insert', task(4, NOW + HOUR, alerted=True))
+    assert len(scheduler) == 0
+    scheduler.on_task_event('insert', task(5, NOW + HOUR))
+    scheduler.on_task_event('delete', task(5, NOW + HOUR))
+    assert len(scheduler) == 0
+
+
+def test_repeating_tasks_are_scheduled_per_occurrence(due_tasks):
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    scheduler.horizon = 48 * HOUR
+    asyncio.run(scheduler.load_window(NOW))
+    series = task(1, NOW + HOUR, recurrence="FREQ=DAILY")
+    scheduler.on_task_event('update', series)
+    # Today's 13:00 and the next two days' fall in the 50-hour window
+    assert sorted(key[1] for key in scheduler._scheduled) == [
+        datetime.date(2026, 10, 18), datetime.date(2026, 10, 19), datetime.date(2026, 10, 20),
+    ]
+    scheduler.on_task_event('delete', series)
+    assert len(scheduler) == 0
+
+
+def test_shard_changes_reset_and_reload(due_tasks):
+    rows, windows = due_tasks
+    rows.extend([task(1, NOW + HOUR, user_id=1), task(2, NOW + HOUR, user_id=2)])
+    ownership = FakeOwnership(users=[1])
+    scheduler = make_scheduler(FakeClock(), ownership)
+    asyncio.run(scheduler.load_window(NOW))
+    assert [key[0] for key in scheduler._scheduled] == [1]
+    assert windows[-1][2] == [0]
+
+    ownership.users, ownership.owned = {2}, {1}
+    scheduler.on_ownership_change(ownership.owned)
+    assert len(scheduler) == 0 and scheduler._loaded_until is None
+    asyncio.run(scheduler.load_window(NOW))
+    assert [key[0] for key in scheduler._scheduled] == [2]
+    assert windows[-1][2] == [1]
+
+
+def test_run_fires_alerts_whose_time_has_come(due_tasks):
+    rows, _ = due_tasks
+    rows.append(task(1, NOW + HOUR))
+    sent = asyncio.Queue()
+
+    async def send_alerts(tasks):
+        await sent.put(ids(tasks))
+
+    async def run():
+        scheduler = AlertScheduler(send_alerts, lead_time=LEAD, horizon=6 * HOUR, clock=FakeClock())
+        runner = asyncio.create_task(scheduler.run())
+        try:
+            return await asyncio.wait_for(sent.get(), 1), len(scheduler)
+        finally:
+            runner.cancel()
+
+    assert asyncio.run(run()) == ([1], 0)
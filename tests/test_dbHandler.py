@@ -0,0 +1,69 @@
+import asyncio
+import datetime
+from contextlib import asynccontextmanager
+
+import pytest
+
+import dbHandler
+
+
+class RecordingConnection:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def fetch(self, query, *args):
+        if self.fail:
+            raise RuntimeError("connection lost")
+        self.calls.append(args)
+        return [{'id': n} for n in range(len(args[0]))]
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    conn = RecordingConnection()
+
+    @asynccontextmanager
+    async def acquire(query):
+        yield conn
+
+    monkeypatch.setattr(dbHandler, "acquire", acquire)
+    monkeypatch.setattr(dbHandler, "dispatch_task_event", lambda kind, row: None)
+    return conn
+
+
+def test_insert_tasks_keeps_a_valid_time_when_the_date_is_bad(connection):
+    inserted = asyncio.run(dbHandler.insert_tasks([
+        ("add", "gym", "friday", "18:30", None),
+        ("add", "milk", "2026-10-19", "later", None),
+    ], 1))
+    assert len(inserted) == 2
+    dates, times = connection.calls[0][2], connection.calls[0][3]
+    assert dates == [None, datetime.date(2026, 10, 19)]
+    assert times == [datetime.time(18, 30), None]
+
+
+def test_insert_tasks_returns_none_when_the_insert_fails(connection):
+    connection.fail = True
+    assert asyncio.run(dbHandler.insert_tasks([("add", "gym", None, None, None)], 1)) is None
+
+
+@pytest.mark.parametrize("name, expected", [("Asia/Kolkata", "Asia/Kolkata"), ("EST5EDT,M3.2.0,M11.1.0", "UTC")])
+def test_check_default_timezone(monkeypatch, name, expected):
+    monkeypatch.setattr(dbHandler, "DEFAULT_TIMEZONE", name)
+    dbHandler.check_default_timezone()
+    assert dbHandler.DEFAULT_TIMEZONE == expected
+
+
+def test_release_task_alerts_bounds_attempts_and_reschedules(connection, monkeypatch):
+    events = []
+    monkeypatch.setattr(dbHandler, "dispatch_task_event", lambda kind, row: events.append((kind, row['id'])))
+    released = asyncio.run(dbHandler.release_task_alerts([7, 8], max_attempts=3))
+    assert len(released) == 2
+    assert connection.calls == [([7, 8], 3)]
+    assert events == [('update', 0), ('update', 1)]
+    assert asyncio.run(dbHandler.release_task_alerts([])) == []
@@ -0,0 +1,103 @@
+import datetime
+
+import pytest
+
+from intentParser import extract_date, extract_time, format_intent_reply, parse_intent, parse_task_line
+
+# A Sunday morning
+NOW = datetime.datetime(2026, 10, 18, 7, 0)
+
+
+@pytest.mark.parametrize("text", ["show my tasks", "List", "what are my tasks?", "please show me all my todos"])
+def test_list(text):
+    assert parse_intent(text, NOW) == ("list", None, None, None, None)
+
+
+@pytest.mark.parametrize("text, task", [
+    ("mark task done", None),
+    ("done", None),
+    ("mark dentist as done", "dentist"),
+    ("mark as done", None),
+    ("mark ask boss as done", "ask boss"),
+    ("complete the report", "report"),
+])
+def test_update(text, task):
+    assert parse_intent(text, NOW) == ("update", task, None, None, None)
+
+
+@pytest.mark.parametrize("text, task", [
+    ("delete task", None),
+    ("remove a task", None),
+    ("delete the dentist task", "dentist"),
+    ("please delete buy milk", "buy milk"),
+])
+def test_delete(text, task):
+    assert parse_intent(text, NOW) == ("delete", task, None, None, None)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("add buy milk", ("add", "buy milk", None, None, None, None)),
+    ("Add Call Mom tomorrow at 2pm", ("add", "Call Mom", "2026-10-19", "14:00", None, None)),
+    ("remind me to water plants tonight", ("add", "water plants", "2026-10-18", "18:00", None, None)),
+    ("add gym on friday at 18:30", ("add", "gym", "2026-10-23", "18:30", None, None)),
+    ("add report 2026-11-02 morning", ("add", "report", "2026-11-02", "09:00", None, None)),
+])
+def test_add(text, expected):
+    assert parse_intent(text, NOW) == expected
+
+
+def test_add_repeating_task_starts_at_its_first_occurrence():
+    assert parse_intent("remind me to take meds every day at 8am", NOW) == (
+        "add", "take meds", "2026-10-18", "08:00", None, "FREQ=DAILY",
+    )
+    assert parse_intent("add gym every monday and thursday at 6pm", NOW) == (
+        "add", "gym", "2026-10-19", "18:00", None, "FREQ=WEEKLY;BYDAY=MO,TH",
+    )
+
+
+@pytest.mark.parametrize("text", [
+    "add call mom next week",
+    "add pay rent by the 5th",
+    "remember the thing about the quarterly report",
+    "finish the report by friday",
+    "complete my tax return tomorrow",
+    "finish slides at 5pm",
+    "",
+])
+def test_ambiguous_messages_go_to_the_llm(text):
+    assert parse_intent(text, NOW) is None
+
+
+def test_same_weekday_means_next_week():
+    assert extract_date("gym sunday", NOW)[0] == "2026-10-25"
+    assert extract_date("gym next monday", NOW)[0] == "2026-10-26"
+
+
+@pytest.mark.parametrize("text, time", [
+    ("at 12am", "00:00"),
+    ("at 12pm", "12:00"),
+    ("7:45pm", "19:45"),
+    ("23:05", "23:05"),
+    ("noon", "12:00"),
+    ("at 13pm", None),
+])
+def test_extract_time(text, time):
+    assert extract_time(text)[0] == time
+
+
+def test_import_lines_keep_unknown_words_in_the_name():
+    assert parse_task_line("Book flights next week", NOW) == (
+        "add", "Book flights next week", None, None, None, None,
+    )
+
+
+def test_format_intent_reply():
+    reply = format_intent_reply("add", "gym", "2026-10-19", "18:00", None, "FREQ=WEEKLY;BYDAY=MO")
+    assert reply.splitlines() == [
+        "👨‍💻 Action: add",
+        "📝 Task: gym",
+        "🗓️ Due date: 2026-10-19",
+        "⏱️ Time: 18:00",
+        "🗒️ Note: null",
+        "🔁 Repeat: every week on Mon",
+    ]
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from llmAdmission import AdmissionController, LLMBusy, SingleFlight, TokenBucket
+
+
+def test_token_bucket_burst_then_refill(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("llmAdmission.time.monotonic", lambda: clock[0])
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+    assert bucket.wait_time() == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert bucket.take()
+    assert not bucket.take()
+    clock[0] += 10
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+
+
+def test_user_over_their_rate_is_turned_away_at_once():
+    async def run():
+        admission = AdmissionController(user_rate=1 / 60, user_burst=2, global_rate=0)
+        results = []
+        for _ in range(3):
+            try:
+                results.append(await admission.admit(1))
+            except LLMBusy:
+                results.append("busy")
+        # Another user is unaffected
+        results.append(await admission.admit(2))
+        return results
+
+    assert asyncio.run(run()) == ["admitted", "admitted", "busy", "admitted"]
+
+
+def test_global_limit_queues_in_order_and_sheds_when_full():
+    async def run():
+        admission = AdmissionController(user_rate=0, global_rate=20, global_burst=1, queue_size=2, queue_timeout=1)
+        order = []
+
+        async def request(name):
+            try:
+                order.append((name, await admission.admit(name)))
+            except LLMBusy:
+                order.append((name, "busy"))
+
+        await asyncio.gather(*(request(name) for name in "abcd"))
+        return order
+
+    assert asyncio.run(run()) == [("a", "admitted"), ("d", "busy"), ("b", "queued"), ("c", "queued")]
+
+
+def test_queue_timeout_gives_the_user_token_back():
+    async def run():
+        admission = AdmissionController(user_rate=1 / 60, user_burst=1, global_rate=0.01, global_burst=1,
+                                        queue_size=5, queue_timeout=0.05)
+        await admission.admit("other")
+        with pytest.raises(LLMBusy):
+            await admission.admit(1)
+        # The timed-out request didn't use up user 1's only token
+        return admission._user_bucket(1).tokens
+
+    assert asyncio.run(run()) == pytest.approx(1, abs=0.01)
+
+
+def test_single_flight_merges_identical_calls():
+    async def run():
+        flight = SingleFlight()
+        calls = []
+
+        async def call(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value
+
+        results = await asyncio.gather(
+            flight.do("a", lambda: call(1)),
+            flight.do("a", lambda: call(2)),
+            flight.do("b", lambda: call(3)),
+        )
+        assert len(flight) == 0
+        # Once finished, the next call for the same key runs again
+        results.append(await flight.do("a", lambda: call(4)))
+        return results, calls
+
+    assert asyncio.run(run()) == ([1, 1, 3, 4], [1, 3, 4])
+
+
+def test_single_flight_survives_one_caller_being_cancelled():
+    async def run():
+        flight = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.02)
+            return "done"
+
+        first = asyncio.create_task(flight.do("k", call))
+        second = asyncio.create_task(flight.do("k", call))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "done"
@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+import llmRouter
+from llmRouter import CircuitBreaker, LLMRouter, Provider, ProviderUnavailable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeBackend:
+    """A provider call that answers, fails, or hangs until released"""
+
+    def __init__(self, answer="ok"):
+        self.answer = answer
+        self.fail = False
+        self.release = None
+        self.calls = 0
+        self.cancelled = 0
+
+    async def __call__(self, text):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("provider down")
+        if self.release is not None:
+            try:
+                await self.release.wait()
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+        return self.answer
+
+
+def test_breaker_opens_half_opens_and_closes():
+    clock = FakeClock()
+    backend = FakeBackend()
+    provider = Provider("groq", backend, max_concurrency=4, timeout=5)
+    provider.breaker = CircuitBreaker(failures=2, reset_timeout=30, clock=clock)
+    router = LLMRouter([provider])
+
+    async def run():
+        backend.fail = True
+        assert await router.complete("hi") is None
+        assert provider.breaker.state == "closed"
+        assert await router.complete("hi") is None
+        assert provider.breaker.state == "open"
+
+        # Open: no call goes out until the reset timeout has passed
+        assert await router.complete("hi") is None
+        assert backend.calls == 2
+        with pytest.raises(ProviderUnavailable):
+            await provider("hi")
+
+        # Half-open: one probe, which fails and opens the circuit again
+        clock.now += 30
+        assert provider.breaker.state == "half_open"
+        assert await router.complete("hi") is None
+        assert backend.calls == 3
+        assert provider.breaker.state == "open"
+
+        # The next probe succeeds and closes it
+        clock.now += 30
+        backend.fail = False
+        assert await router.complete("hi") == "ok"
+        assert provider.breaker.state == "closed"
+        assert provider.breaker.consecutive_failures == 0
+
+    asyncio.run(run())
+
+
+def test_half_open_lets_only_one_probe_through():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failures=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+    assert not breaker.allow() and not breaker.available()
+    # A probe cancelled by a lost hedge race frees the slot again
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_hedge_wins_when_the_primary_is_slow(monkeypatch):
+    monkeypatch.setattr(llmRouter, "LLM_HEDGE_MIN_DELAY", 0.01)
+    monkeypatch.setattr(llmRouter, "LLM_HEDGE_DEFAULT_DELAY", 0.01)
+    slow, fast = FakeBackend("slow"), FakeBackend("fast")
+    slow.release = asyncio.Event()
+    primary = Provider("groq", slow, max_concurrency=4, timeout=5)
+    hedge = Provider("gemini", fast, max_concurrency=4, timeout=5)
+    router = LLMRouter([primary, hedge])
+
+    async def run():
+        response = await router.complete("hi")
+        await asyncio.sleep(0)  # Let the cancelled primary unwind
+        return response
+
+    assert asyncio.run(run()) == "fast"
+    assert (router.hedged, router.hedge_wins) == (1, 1)
+    assert slow.cancelled == 1
+    # Losing the race is neither a failure nor a success for the primary
+    assert primary.errors == 0 and primary.breaker.state == "closed"
+    assert hedge.tracker._samples and not primary.tracker._samples
+
+
+def test_hedge_delay_follows_the_primarys_p95(monkeypatch):
+    provider = Provider("groq", FakeBackend(), max_concurrency=1, timeout=5)
+    assert LLMRouter._hedge_delay(provider) == llmRouter.LLM_HEDGE_DEFAULT_DELAY
+    for sample in range(1, 101):
+        provider.tracker.record(sample / 100)
+    assert LLMRouter._hedge_delay(provider) == 0.96
+    monkeypatch.setattr(llmRouter, "LLM_HEDGE_MIN_DELAY", 1.5)
+    assert LLMRouter._hedge_delay(provider) == 1.5
+
+
+def test_a_failed_primary_moves_on_without_waiting():
+    broken, backup = FakeBackend(), FakeBackend("backup")
+    broken.fail = True
+    router = LLMRouter([Provider("groq", broken, 4, 5), Provider("gemini", backup, 4, 5)])
+    assert asyncio.run(asyncio.wait_for(router.complete("hi"), 1)) == "backup"
+    assert router.hedged == 0
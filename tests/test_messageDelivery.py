@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from messageDelivery import MessageDelivery, send_error_reason
+from metrics import SEND_ERRORS
+
+
+@pytest.mark.parametrize("error, reason", [
+    (RetryAfter(3), "retry_after"),
+    (Forbidden("bot was blocked by the user"), "forbidden"),
+    (BadRequest("chat not found"), "bad_request"),
+    (TimedOut(), "network"),
+    (NetworkError("connection reset"), "network"),
+    (KeyError("surprise"), "other"),
+])
+def test_send_error_reason(error, reason):
+    assert send_error_reason(error) == reason
+
+
+class FailingBot:
+    def __init__(self, error):
+        self.error = error
+        self.attempts = 0
+
+    async def send_message(self, chat_id, text):
+        self.attempts += 1
+        raise self.error
+
+
+def test_unexpected_errors_share_one_label():
+    before = set(SEND_ERRORS._children)
+    bot = FailingBot(type("SomeLibraryError", (Exception,), {})("boom"))
+    assert asyncio.run(MessageDelivery(global_rate=100, chat_rate=100).send(bot, 1, "hi")) is False
+    assert set(SEND_ERRORS._children) - before <= {("other",)}
+
+
+def test_bad_requests_are_not_retried():
+    bot = FailingBot(BadRequest("message is too long"))
+    assert asyncio.run(MessageDelivery(global_rate=100, chat_rate=100).send(bot, 1, "hi")) is False
+    assert bot.attempts == 1
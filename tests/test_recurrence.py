@@ -0,0 +1,145 @@
+import datetime
+import random
+
+import pytest
+
+from recurrence import (
+    RecurrenceRule,
+    expand_occurrences,
+    first_occurrence,
+    occurrence_row,
+    parse_recurrence,
+)
+
+D = datetime.date
+UTC = datetime.timezone.utc
+
+
+@pytest.mark.parametrize("phrase, rule", [
+    ("daily", "FREQ=DAILY"),
+    ("every day", "FREQ=DAILY"),
+    ("weekdays", "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR"),
+    ("every monday and thursday", "FREQ=WEEKLY;BYDAY=MO,TH"),
+    ("every 2 weeks", "FREQ=WEEKLY;INTERVAL=2"),
+    ("every other day", "FREQ=DAILY;INTERVAL=2"),
+    ("monthly", "FREQ=MONTHLY"),
+    ("monday", "FREQ=WEEKLY;BYDAY=MO"),
+    ("RRULE:FREQ=WEEKLY;BYDAY=FR;COUNT=3", "FREQ=WEEKLY;BYDAY=FR;COUNT=3"),
+])
+def test_parse_recurrence(phrase, rule):
+    assert parse_recurrence(phrase) == rule
+
+
+@pytest.mark.parametrize("value", [None, "", "null", "never", "sometimes", "FREQ=YEARLY", "FREQ=MONTHLY;BYMONTHDAY=40"])
+def test_parse_recurrence_rejects(value):
+    assert parse_recurrence(value) is None
+
+
+def test_rule_round_trips_through_rrule():
+    text = "FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;COUNT=5;UNTIL=20270101"
+    assert str(RecurrenceRule.parse(text)) == text
+
+
+def test_describe():
+    assert RecurrenceRule.parse("FREQ=DAILY").describe() == "daily"
+    assert RecurrenceRule.parse("FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH").describe() == "every 2 weeks on Mon, Thu"
+
+
+def test_weekly_byday_occurrences():
+    rule = RecurrenceRule.parse("FREQ=WEEKLY;BYDAY=MO,TH")
+    # 2026-10-19 is a Monday
+    assert list(rule.between(D(2026, 10, 19), D(2026, 10, 19), D(2026, 10, 31))) == [
+        D(2026, 10, 19), D(2026, 10, 22), D(2026, 10, 26), D(2026, 10, 29),
+    ]
+
+
+def test_monthly_clamps_to_short_months():
+    rule = RecurrenceRule.parse("FREQ=MONTHLY")
+    assert list(rule.between(D(2026, 1, 31), D(2026, 1, 1), D(2026, 4, 30))) == [
+        D(2026, 1, 31), D(2026, 2, 28), D(2026, 3, 31), D(2026, 4, 30),
+    ]
+
+
+def test_count_and_until_end_the_series():
+    assert list(RecurrenceRule.parse("FREQ=DAILY;COUNT=3").occurrences(D(2026, 1, 1))) == [
+        D(2026, 1, 1), D(2026, 1, 2), D(2026, 1, 3),
+    ]
+    rule = RecurrenceRule.parse("FREQ=DAILY;UNTIL=20260102")
+    assert list(rule.occurrences(D(2026, 1, 1))) == [D(2026, 1, 1), D(2026, 1, 2)]
+    assert rule.next_on_or_after(D(2026, 1, 1), D(2026, 1, 3)) is None
+
+
+def test_next_on_or_after_skips_completed():
+    rule = RecurrenceRule.parse("FREQ=DAILY")
+    assert rule.next_on_or_after(D(2026, 1, 1), D(2026, 1, 5), skip=[D(2026, 1, 5)]) == D(2026, 1, 6)
+
+
+@pytest.mark.parametrize("text", [
+    "FREQ=DAILY;INTERVAL=3",
+    "FREQ=WEEKLY;INTERVAL=2;BYDAY=TU,SA",
+    "FREQ=WEEKLY;INTERVAL=3",
+    "FREQ=MONTHLY;INTERVAL=2",
+    "FREQ=MONTHLY;BYMONTHDAY=31",
+])
+def test_fast_forward_matches_counting_from_the_start(text):
+    rule = RecurrenceRule.parse(text)
+    generator = random.Random(text)
+    for _ in range(200):
+        dtstart = D(2024, 1, 1) + datetime.timedelta(days=generator.randrange(400))
+        start = dtstart + datetime.timedelta(days=generator.randrange(800))
+        expected = []
+        for day in rule.occurrences(dtstart):
+            if day > start + datetime.timedelta(days=90):
+                break
+            if day >= start:
+                expected.append(day)
+        assert list(rule.between(dtstart, start, start + datetime.timedelta(days=90))) == expected
+
+
+def test_first_occurrence_anchors_to_the_next_matching_day():
+    now = datetime.datetime(2026, 10, 18, 7, 0)  # A Sunday
+    assert first_occurrence("FREQ=WEEKLY;BYDAY=MO", None, None, now) == "2026-10-19"
+    assert first_occurrence("FREQ=DAILY", "2026-10-20", None, now) == "2026-10-20"
+
+
+def test_first_occurrence_skips_today_once_its_time_has_passed():
+    now = datetime.datetime(2026, 10, 18, 9, 0)
+    assert first_occurrence("FREQ=DAILY", None, "08:00", now) == "2026-10-19"
+    assert first_occurrence("FREQ=DAILY", None, "10:00", now) == "2026-10-18"
+    assert first_occurrence("FREQ=WEEKLY;BYDAY=SU", None, "08:00", now) == "2026-10-25"
+
+
+def test_first_occurrence_tolerates_a_bad_date():
+    now = datetime.datetime(2026, 10, 18, 7, 0)
+    assert first_occurrence("FREQ=DAILY", "every day", None, now) == "2026-10-18"
+
+
+def test_expand_occurrences_in_the_tasks_timezone():
+    task = {
+        'id': 1, 'task': 'meds', 'recurrence': 'FREQ=DAILY', 'timezone': 'Asia/Kolkata',
+        'duedate': D(2026, 10, 1), 'duetime': datetime.time(8, 0),
+    }
+    start = datetime.datetime(2026, 10, 18, 0, 0, tzinfo=UTC)
+    end = datetime.datetime(2026, 10, 20, 0, 0, tzinfo=UTC)
+    occurrences = expand_occurrences([task], start, end)
+    assert [row['occurrence'] for row in occurrences] == [D(2026, 10, 18), D(2026, 10, 19)]
+    # 08:00 in Kolkata is 02:30 UTC
+    assert occurrences[0]['due_at'].astimezone(UTC) == datetime.datetime(2026, 10, 18, 2, 30, tzinfo=UTC)
+    assert not occurrences[0]['alerted'] and not occurrences[0]['completed']
+
+
+def test_expand_occurrences_treats_an_unknown_timezone_as_utc():
+    task = {
+        'id': 1, 'task': 'meds', 'recurrence': 'FREQ=DAILY', 'timezone': 'EST5EDT,M3.2.0,M11.1.0',
+        'duedate': D(2026, 10, 1), 'duetime': datetime.time(8, 0),
+    }
+    start = datetime.datetime(2026, 10, 18, 0, 0, tzinfo=UTC)
+    end = datetime.datetime(2026, 10, 19, 0, 0, tzinfo=UTC)
+    occurrences = expand_occurrences([task], start, end)
+    assert [row['due_at'] for row in occurrences] == [datetime.datetime(2026, 10, 18, 8, 0, tzinfo=UTC)]
+
+
+def test_occurrence_row_keeps_the_series_fields():
+    row = occurrence_row({'id': 7, 'task': 'gym', 'completed': True}, D(2026, 1, 1))
+    assert row == {'id': 7, 'task': 'gym', 'completed': False, 'alerted': False,
+                   'duedate': D(2026, 1, 1), 'occurrence': D(2026, 1, 1), 'due_at': None}
@@ -0,0 +1,118 @@
+import asyncio
+import datetime
+from contextlib import asynccontextmanager
+
+import pytest
+
+import dbHandler
+import main
+from taskCache import UserTaskCache
+
+TODAY = datetime.date(2026, 10, 18)
+
+
+@pytest.fixture
+def cached_tasks(monkeypatch, row):
+    cache = UserTaskCache()
+    cache.put(1, [row(task_id) for task_id in range(1, 6)], cache.version(1))
+    monkeypatch.setattr(dbHandler, "task_cache", cache)
+    return cache
+
+
+class FakeTaskTable:
+    """Stands in for fetch_open_tasks_page: the user's open tasks in display order"""
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.calls = []
+
+    async def fetch_open_tasks_page(self, userId, after_id, limit):
+        self.calls.append((after_id, limit))
+        ids = [task['id'] for task in self.tasks]
+        start = 0 if after_id is None else ids.index(after_id) + 1
+        return self.tasks[start:start + limit]
+
+
+@pytest.fixture
+def task_table(monkeypatch):
+    table = FakeTaskTable([])
+    monkeypatch.setattr(dbHandler, "task_cache", None)
+    monkeypatch.setattr(dbHandler, "fetch_open_tasks_page", table.fetch_open_tasks_page)
+
+    class NoCompletedOccurrences:
+        async def fetch(self, query, *args):
+            return []
+
+    @asynccontextmanager
+    async def acquire(query):
+        yield NoCompletedOccurrences()
+
+    async def user_now(userId):
+        return datetime.datetime.combine(TODAY, datetime.time(9, 0))
+
+    monkeypatch.setattr(dbHandler, "acquire", acquire)
+    monkeypatch.setattr(main, "user_now", user_now)
+    monkeypatch.setattr(main, "SELECTION_PAGE_SIZE", 2)
+    return table
+
+
+def page(after_id, limit=2):
+    tasks, has_more = asyncio.run(dbHandler.get_user_tasks_page(1, after_id, limit))
+    return [task['id'] for task in tasks], has_more
+
+
+def ended_series(row, task_id):
+    return row(task_id, duedate=datetime.date(2026, 1, 1), recurrence="FREQ=DAILY;COUNT=1")
+
+
+def selection(after_id=None, offset=0):
+    result = asyncio.run(main.build_selection(None, 1, 'done', after_id, offset))
+    if result is None:
+        return None
+    text, keyboard = result
+    picks = [buttons[0].callback_data for buttons in keyboard.inline_keyboard[:-1]]
+    navigation = [button.callback_data for button in keyboard.inline_keyboard[-1]]
+    next_page = next((data for data in navigation if data.startswith("page:") and not data.endswith("::0")), None)
+    return picks, next_page
+
+
+def test_keyset_pages_follow_the_cursor(cached_tasks):
+    assert page(None) == ([1, 2], True)
+    assert page(2) == ([3, 4], True)
+    assert page(4) == ([5], False)
+
+
+def test_page_after_a_removed_cursor_is_empty(cached_tasks, row):
+    cached_tasks.on_task_event('delete', row(2))
+    assert page(2) == ([], False)
+    assert page(1) == ([3, 4], True)
+
+
+def test_uncached_pages_read_one_extra_row(task_table, row):
+    task_table.tasks = [row(task_id) for task_id in range(1, 4)]
+    assert page(None) == ([1, 2], True)
+    assert page(2) == ([3], False)
+    assert task_table.calls == [(None, 3), (2, 3)]
+
+
+def test_next_page_starts_after_a_dropped_series(task_table, row):
+    task_table.tasks = [row(1), ended_series(row, 2), row(3), row(4)]
+    picks, next_page = selection()
+    assert picks == ["sel:done:1"]
+    # The cursor is the last row read, not the last one shown
+    assert next_page == "page:done:2:1"
+    picks, next_page = selection(2, 1)
+    assert picks == ["sel:done:3", "sel:done:4"]
+    assert next_page is None
+
+
+def test_a_page_of_ended_series_reads_on(task_table, row):
+    task_table.tasks = [ended_series(row, 1), ended_series(row, 2), row(3)]
+    picks, next_page = selection()
+    assert picks == ["sel:done:3"]
+    assert next_page is None
+
+
+def test_only_ended_series_means_nothing_to_select(task_table, row):
+    task_table.tasks = [ended_series(row, 1), ended_series(row, 2), ended_series(row, 3)]
+    assert selection() is None
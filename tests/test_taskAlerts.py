@@ -0,0 +1,71 @@
+import asyncio
+import datetime
+
+import pytest
+from telegram.error import Forbidden, NetworkError
+
+import main
+from messageDelivery import MessageDelivery
+
+DUE = datetime.datetime(2026, 10, 18, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+class FlakyBot:
+    """Fails sends to the chats in `errors` with the given error"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if chat_id in self.errors:
+            raise self.errors[chat_id]
+        self.sent.append(chat_id)
+
+
+class FakeApp:
+    def __init__(self, bot):
+        self.bot = bot
+        self.bot_data = {'delivery': MessageDelivery(global_rate=100, chat_rate=100, max_retries=0)}
+
+
+@pytest.fixture
+def claims(monkeypatch, row):
+    """Claim everything asked for and record which alerts are released again"""
+    released = {'tasks': [], 'occurrences': []}
+
+    async def claim_task_alerts(task_ids):
+        return [dict(row(task_id, user_id=task_id), due_at=DUE) for task_id in task_ids]
+
+    async def claim_occurrence_alerts(occurrences):
+        return list(occurrences)
+
+    async def release_task_alerts(task_ids):
+        released['tasks'].extend(task_ids)
+        return list(task_ids)
+
+    async def release_occurrence_alerts(occurrences):
+        released['occurrences'].extend((task['id'], task['occurrence']) for task in occurrences)
+        return list(occurrences)
+
+    for func in (claim_task_alerts, claim_occurrence_alerts, release_task_alerts, release_occurrence_alerts):
+        monkeypatch.setattr(main, func.__name__, func)
+    monkeypatch.setattr(main, "ALERT_RETRY_DELAY", 0)
+    return released
+
+
+def test_failed_alerts_are_released_for_another_try(claims, row):
+    bot = FlakyBot({2: NetworkError("connection reset"), 3: Forbidden("bot was blocked by the user")})
+    occurrence = dict(row(4, user_id=2, recurrence="FREQ=DAILY"), due_at=DUE, occurrence=DUE.date())
+    tasks = [row(1), row(2), row(3), occurrence]
+    asyncio.run(main.send_task_alerts(FakeApp(bot), tasks))
+    assert bot.sent == [1]
+    # A blocked bot won't get through on a retry; a network error might
+    assert claims == {'tasks': [2], 'occurrences': [(4, DUE.date())]}
+
+
+def test_nothing_is_released_when_every_alert_is_sent(claims, row):
+    bot = FlakyBot({})
+    asyncio.run(main.send_task_alerts(FakeApp(bot), [row(1), row(2)]))
+    assert bot.sent == [1, 2]
+    assert claims == {'tasks': [], 'occurrences': []}
@@ -0,0 +1,50 @@
+import datetime
+
+from taskCache import UserTaskCache
+
+
+def ids(tasks):
+    return [task['id'] for task in tasks]
+
+
+def test_miss_then_hit(row):
+    cache = UserTaskCache()
+    assert cache.get(1) is None
+    cache.put(1, [row(1)], cache.version(1))
+    assert ids(cache.get(1)) == [1]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_events_patch_the_list_in_display_order(row):
+    cache = UserTaskCache()
+    cache.put(1, [row(1, duedate=datetime.date(2026, 1, 2)), row(2)], cache.version(1))
+    cache.on_task_event('insert', row(3, duedate=datetime.date(2026, 1, 1)))
+    assert ids(cache.get(1)) == [3, 1, 2]
+    cache.on_task_event('update', row(1, duedate=datetime.date(2026, 1, 2), completed=True))
+    cache.on_task_event('delete', row(2))
+    assert ids(cache.get(1)) == [3]
+
+
+def test_load_racing_a_write_is_not_cached(row):
+    cache = UserTaskCache()
+    version = cache.version(1)
+    cache.on_task_event('insert', row(5))
+    assert ids(cache.put(1, [row(4)], version)) == [4]
+    assert cache.get(1) is None
+
+
+def test_resync_drops_everything(row):
+    cache = UserTaskCache()
+    cache.put(1, [row(1)], cache.version(1))
+    cache.on_task_event('resync', None)
+    assert cache.get(1) is None
+
+
+def test_evicts_least_recently_used_users(row):
+    cache = UserTaskCache(max_users=2)
+    for user_id in (1, 2):
+        cache.put(user_id, [row(user_id, user_id)], cache.version(user_id))
+    cache.get(1)
+    cache.put(3, [row(3, 3)], cache.version(3))
+    assert cache.get(2) is None
+    assert cache.get(1) is not None and cache.get(3) is not None
@@ -0,0 +1,69 @@
+import pytest
+
+from taskSearch import confident_match, match_score, rank_tasks
+
+TASKS = [
+    {'id': i, 'task': name}
+    for i, name in enumerate([
+        "Dentist appointment", "call mom", "buy milk", "buy milk and eggs", "Call dentist's office", "pay rent",
+    ])
+]
+
+
+def names(ranked):
+    return [task['task'] for _, task in ranked]
+
+
+def test_exact_and_partial_scores():
+    assert match_score("Buy Milk", "buy milk") == 1.0
+    assert match_score("dentist", "Dentist appointment") == pytest.approx(0.95)
+    assert match_score("the rent task", "pay rent") == pytest.approx(0.95)
+    assert match_score("", "pay rent") == 0.0
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("call mom", "call mom"),
+    ("pay the rent", "pay rent"),
+    ("dentist appointment", "Dentist appointment"),
+    ("rent", "pay rent"),
+])
+def test_single_confident_match(query, expected):
+    match = confident_match(rank_tasks(TASKS, query), query)
+    assert match is not None and match['task'] == expected
+
+
+@pytest.mark.parametrize("query, tasks", [
+    # Too short to trust, even though it scores above the threshold
+    ("as", [{'id': 1, 'task': "ask boss"}]),
+    ("mom", TASKS),
+    # Part of a word, not a whole word of the name
+    ("ask bos", [{'id': 1, 'task': "ask boss"}]),
+    ("apointment", [{'id': 1, 'task': "Dentist appointment"}]),
+])
+def test_short_or_partial_queries_are_not_applied(query, tasks):
+    ranked = rank_tasks(tasks, query)
+    assert ranked
+    assert confident_match(ranked, query) is None
+
+
+def test_delete_needs_the_exact_name():
+    assert confident_match(rank_tasks(TASKS, "rent"), "rent", exact=True) is None
+    match = confident_match(rank_tasks(TASKS, "the pay rent task"), "the pay rent task", exact=True)
+    assert match is not None and match['task'] == "pay rent"
+
+
+@pytest.mark.parametrize("query", ["dentist", "buy milk", "call"])
+def test_ambiguous_names_ask_the_user(query):
+    ranked = rank_tasks(TASKS, query)
+    assert len(ranked) >= 2
+    assert confident_match(ranked, query) is None
+
+
+def test_unrelated_names_match_nothing():
+    assert rank_tasks(TASKS, "groceries") == []
+    assert confident_match([], "groceries") is None
+
+
+def test_rank_is_best_first_and_limited():
+    ranked = rank_tasks(TASKS, "buy milk", limit=1)
+    assert names(ranked) == ["buy milk"]
@@ -0,0 +1,126 @@
+import asyncio
+import datetime
+import time
+
+from telegram import Chat, Message, Update, User
+
+from updateDispatcher import PerUserUpdateProcessor, UpdateDispatcher, update_key
+
+SLOW = 0.2
+
+
+def make_update(update_id: int, user_id: int) -> Update:
+    user = User(id=user_id, first_name=f"user{user_id}", is_bot=False)
+    message = Message(
+        message_id=update_id,
+        date=datetime.datetime.now(datetime.timezone.utc),
+        chat=Chat(id=user_id, type=Chat.PRIVATE),
+        from_user=user,
+        text="hi",
+    )
+    return Update(update_id=update_id, message=message)
+
+
+def test_update_key_is_the_user():
+    assert update_key(make_update(1, 42)) == 42
+    assert update_key(object()) == 0
+
+
+def test_processor_keeps_each_users_order():
+    async def run():
+        processor = PerUserUpdateProcessor(4)
+        seen = []
+
+        async def handle(n):
+            await asyncio.sleep(SLOW / 4 if n % 2 else 0)
+            seen.append(n)
+
+        await asyncio.gather(*(processor.process_update(make_update(n, 1), handle(n)) for n in range(6)))
+        return seen
+
+    assert asyncio.run(run()) == list(range(6))
+
+
+def test_processor_backlog_of_one_user_does_not_delay_others():
+    async def run():
+        workers = 4
+        processor = PerUserUpdateProcessor(workers)
+        finished = {}
+        started = time.perf_counter()
+
+        async def handle(name, delay):
+            await asyncio.sleep(delay)
+            finished[name] = time.perf_counter() - started
+
+        # More slow updates from one user than there are worker slots
+        busy = [
+            asyncio.create_task(processor.process_update(make_update(n, 1), handle(n, SLOW)))
+            for n in range(workers + 1)
+        ]
+        await asyncio.sleep(0)
+        await processor.process_update(make_update(100, 2), handle("other", 0))
+        await asyncio.gather(*busy)
+        return finished
+
+    finished = asyncio.run(run())
+    assert finished["other"] < SLOW / 2
+    assert finished[4] >= SLOW * 5 * 0.9
+
+
+def test_processor_runs_at_most_max_concurrent_updates():
+    async def run():
+        processor = PerUserUpdateProcessor(2)
+        running = peak = 0
+
+        async def handle():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(SLOW / 4)
+            running -= 1
+
+        await asyncio.gather(*(processor.process_update(make_update(n, n), handle()) for n in range(6)))
+        return peak
+
+    assert asyncio.run(run()) == 2
+
+
+class RecordingApp:
+    def __init__(self, delays):
+        self.delays = delays
+        self.done = []
+        self.started = time.perf_counter()
+
+    async def process_update(self, update):
+        await asyncio.sleep(self.delays.get(update.update_id, 0))
+        self.done.append((update.update_id, time.perf_counter() - self.started))
+
+
+def test_dispatcher_slow_user_does_not_block_others():
+    async def run():
+        app = RecordingApp({1: SLOW, 2: SLOW})
+        dispatcher = UpdateDispatcher(app, workers=2, queue_size=10)
+        dispatcher.start()
+        # With hash sharding user 3 would share user 1's queue (3 % 2 == 1 % 2)
+        assert dispatcher.submit(make_update(1, 1))
+        assert dispatcher.submit(make_update(2, 1))
+        assert dispatcher.submit(make_update(3, 3))
+        await dispatcher.stop()
+        return app.done
+
+    done = dict(asyncio.run(run()))
+    assert done[3] < SLOW / 2
+    assert done[1] < done[2]
+
+
+def test_dispatcher_sheds_load_when_full():
+    async def run():
+        app = RecordingApp({})
+        dispatcher = UpdateDispatcher(app, workers=1, queue_size=2)
+        results = [dispatcher.submit(make_update(n, n)) for n in range(3)]
+        queued = dispatcher.queued()
+        dispatcher.start()
+        await dispatcher.stop()
+        return results, queued, dispatcher.queued(), len(app.done)
+
+    assert asyncio.run(run()) == ([True, True, False], 2, 0, 2)
@@ -0,0 +1,158 @@
+import os
+import logging
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Deque, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Number of concurrent update workers and total queued updates before shedding
+UPDATE_WORKERS = int(os.environ.get("UPDATE_WORKERS", "16"))
+UPDATE_QUEUE_SIZE = int(os.environ.get("UPDATE_QUEUE_SIZE", "1024"))
+# Concurrency limit handed to PTB's BaseUpdateProcessor; PerUserUpdateProcessor
+# enforces its own worker limit, so this only bounds updates waiting their turn
+PROCESSOR_WAITING_CAP = 1_000_000
+
+
+def update_key(update) -> int:
+    """Key that must be processed in order: the user, else the chat, else 0"""
+    if isinstance(update, Update):
+        if update.effective_user is not None:
+            return update.effective_user.id
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+    return 0
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently across users but one at a time per user.
+
+    Used in polling mode via ApplicationBuilder.concurrent_updates(), so a slow
+    LLM call only delays the user who sent it while the follow-up selection
+    flow still sees each user's messages in order.
+
+    The base class takes its concurrency slot before do_process_update, and
+    waiting for the user's turn inside that slot would let one user's backlog
+    hold slots every other user needs. So the base limit is effectively
+    lifted and do_process_update waits for the user's turn first and only
+    then takes one of `max_concurrent` slots of its own.
+    """
+
+    def __init__(self, max_concurrent: int = UPDATE_WORKERS):
+        super().__init__(PROCESSOR_WAITING_CAP)
+        self.max_concurrent = max_concurrent
+        self.slots = asyncio.Semaphore(max_concurrent)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._waiters: Dict[int, int] = {}
+
+    @asynccontextmanager
+    async def _user_turn(self, key: int):
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                # Nobody else is queued for this user; don't keep an idle lock around
+                del self._waiters[key]
+                del self._locks[key]
+
+    async def do_process_update(self, update, coroutine: Awaitable) -> None:
+        async with self._user_turn(update_key(update)):
+            async with self.slots:
+                await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+class UpdateDispatcher:
+    """Bounded per-user update queues drained under a global worker limit.
+
+    Each user's updates are handled in order by that user's drain task, and
+    a drain task only takes one of the `workers` slots while it is actually
+    processing an update, so a slow LLM call for one user never holds up
+    another. submit() never blocks: once `queue_size` updates are pending the
+    update is rejected so the caller can shed load (the webhook answers 503
+    and Telegram redelivers later).
+    """
+
+    def __init__(self, app, workers: int = UPDATE_WORKERS, queue_size: int = UPDATE_QUEUE_SIZE):
+        self.app = app
+        self.workers = workers
+        self.queue_size = queue_size
+        self._slots = asyncio.Semaphore(workers)
+        self._queues: Dict[int, Deque] = {}
+        self._drains: Dict[int, asyncio.Task] = {}
+        self._pending = 0
+        self._running = False
+        self.accepted = 0
+        self.rejected = 0
+
+    def queued(self) -> int:
+        """Updates accepted but not yet finished"""
+        return self._pending
+
+    def submit(self, update) -> bool:
+        """Queue an update for processing; False if it was shed because the queue is full"""
+        if self._pending >= self.queue_size:
+            self.rejected += 1
+            return False
+        key = update_key(update)
+        self._queues.setdefault(key, deque()).append(update)
+        self._pending += 1
+        self.accepted += 1
+        if self._running and key not in self._drains:
+            self._start_drain(key)
+        return True
+
+    def _start_drain(self, key: int):
+        self._drains[key] = asyncio.create_task(self._drain(key))
+
+    async def _drain(self, key: int):
+        queue = self._queues[key]
+        try:
+            while queue:
+                update = queue[0]
+                try:
+                    async with self._slots:
+                        await self.app.process_update(update)
+                except Exception as e:
+                    logger.error(f"Error processing update: {e}")
+                finally:
+                    queue.popleft()
+                    self._pending -= 1
+        finally:
+            del self._drains[key]
+            if queue:
+                # Cancelled on shutdown with updates left; they are dropped with the queue
+                self._pending -= len(queue)
+            del self._queues[key]
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            for key in list(self._queues):
+                self._start_drain(key)
+        logger.info(f"Update dispatcher started with {self.workers} workers")
+
+    async def stop(self, drain_timeout: Optional[float] = 10.0):
+        """Let queued updates finish (up to drain_timeout seconds), then stop the workers"""
+        self._running = False
+        tasks = list(self._drains.values())
+        if drain_timeout and tasks:
+            done, _ = await asyncio.wait(tasks, timeout=drain_timeout)
+            if len(done) < len(tasks):
+                logger.warning(f"Dropping {self.queued()} queued updates on shutdown")
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,84 @@
+import os
+import logging
+import json
+import hmac
+from typing import Optional
+
+from aiohttp import web
+from telegram import Update
+
+from updateDispatcher import UpdateDispatcher
+
+logger = logging.getLogger(__name__)
+
+# Public URL Telegram posts updates to, and the local address the server binds
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL")
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram")
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
+# Parallel HTTPS connections Telegram may open to the webhook
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+
+class WebhookServer:
+    """aiohttp endpoint that feeds Telegram webhook updates into an UpdateDispatcher"""
+
+    def __init__(self, app, dispatcher: UpdateDispatcher):
+        self.app = app
+        self.dispatcher = dispatcher
+        self.web_app = web.Application()
+        self.web_app.router.add_post(WEBHOOK_PATH, self.handle_update)
+        self.web_app.router.add_get("/healthz", self.handle_health)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET:
+            token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+            if not hmac.compare_digest(token, WEBHOOK_SECRET):
+                return web.Response(status=403)
+
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.app.bot)
+        except (json.JSONDecodeError, ValueError, TypeError) as e:
+            logger.warning(f"Rejecting malformed webhook update: {e}")
+            return web.Response(status=400)
+
+        if not self.dispatcher.submit(update):
+            # Queue is full: shed load and let Telegram redeliver later
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        return web.Response(status=200)
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "queued": self.dispatcher.queued(),
+            "accepted": self.dispatcher.accepted,
+            "rejected": self.dispatcher.rejected,
+        })
+
+    async def start(self):
+        """Start serving and register the webhook with Telegram"""
+        self.dispatcher.start()
+        self._runner = web.AppRunner(self.web_app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, WEBHOOK_LISTEN, WEBHOOK_PORT)
+        await site.start()
+        logger.info(f"Webhook server listening on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+        if WEBHOOK_URL:
+            await self.app.bot.set_webhook(
+                url=WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            logger.info(f"Webhook registered at {WEBHOOK_URL}")
+        else:
+            logger.warning("WEBHOOK_URL not set, not registering the webhook with Telegram")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        await self.dispatcher.stop()